@@ -0,0 +1,332 @@
+"""
+デコード前の受け付け制御 (画素数・メモリの上限)
+
+圧縮後のファイルサイズが小さくても、デコードすると巨大になる画像
+(いわゆるデコンプレッション・ボム) でワーカーがメモリ不足で強制終了されないよう、
+全画素をデコードする前にヘッダーの情報 (サイズと画像モード) だけで判定します。
+
+- 1枚あたりの画素数と、デコード・縮小に必要なメモリの見積もりに上限を設けます
+- アニメーション画像はフレーム数と全フレームの合計画素数にも上限を設けます
+- 同時に使うメモリ (見積もり) の合計にも上限を設け、超える場合は空くまで待ち、
+  待ち時間が上限を超えたら受け付けません (MemoryBudget はプロセス内、
+  SharedMemoryBudget はファイルを介して全ワーカー・全プロセスで共有する上限)
+
+作成日: 2026-10-16
+"""
+
+from contextlib import contextmanager
+import fcntl
+import json
+import os
+import threading
+import time
+import uuid
+
+# SharedMemoryBudget が空きを確認する間隔 (秒)
+SHARED_POLL_INTERVAL = 0.05
+
+class AdmissionError(Exception):
+    """画像の処理を受け付けない (reason はメトリクスに記録する理由)"""
+    reason = 'admission'
+
+class ImageTooLargeError(AdmissionError):
+    """画素数、または必要なメモリが1枚あたりの上限を超えている"""
+    reason = 'too_many_pixels'
+
+class TooManyFramesError(ImageTooLargeError):
+    """アニメーションのフレーム数、または全フレームの合計画素数が上限を超えている"""
+    reason = 'too_many_frames'
+
+class MemoryBudgetExceeded(AdmissionError):
+    """プロセス全体のメモリの上限に達しており、待ち時間内に空かなかった"""
+    reason = 'memory_budget'
+
+def bytes_per_pixel(mode):
+    """
+    Pillow がメモリ上で1画素に使うバイト数
+
+    複数のチャンネルを持つ画像 (RGB など) は、Pillow の内部では1画素4バイトで保持されます。
+    """
+    if mode in ('1', 'L', 'P'):
+        return 1
+    if mode.startswith('I;16'):
+        return 2
+    return 4
+
+def estimate_memory(decoded_size, mode, output_sizes):
+    """
+    デコードと縮小に必要なメモリを見積もる (バイト)
+
+    デコードした画像、reduce() による前縮小の中間画像 (最大でデコードした画像の1/4)、
+    縮小後の画像 (カスケード縮小では1つ前の中間画像も保持するため大きい方から2つ) の合計です。
+
+    Args:
+        decoded_size: デコード後のサイズ (draft() による縮小を反映したもの)
+        mode: 画像モード
+        output_sizes: 出力する画像のサイズのリスト
+    """
+    bpp = bytes_per_pixel(mode)
+    decoded = decoded_size[0] * decoded_size[1] * bpp
+    outputs = sorted((width * height for width, height in output_sizes), reverse=True)[:2]
+    return decoded + decoded // 4 + sum(outputs) * max(bpp, 4)
+
+def check_image(img, output_sizes, max_pixels, max_memory, decoded_size=None):
+    """
+    デコード前の画像 (Image.open() しただけのもの) を検査する
+
+    Args:
+        img: Image.open() で開いた画像 (draft() 済みの場合はデコード後のサイズで判定)
+        output_sizes: 出力する画像のサイズのリスト
+        max_pixels: 1枚あたりの画素数の上限
+        max_memory: 1枚あたりのメモリ (見積もり) の上限 (バイト)
+        decoded_size: 一度にデコードする範囲のサイズ (帯ごとに縮小する場合は1帯分、省略時は画像全体)
+
+    Returns:
+        int: 必要なメモリの見積もり (バイト)
+
+    Raises:
+        ImageTooLargeError: 上限を超えている場合
+    """
+    width, height = img.size
+    if width * height > max_pixels:
+        raise ImageTooLargeError(
+            f"画像が大きすぎます ({width}x{height}、{width * height / 1000000:.0f}メガピクセル)。"
+            f"{max_pixels / 1000000:.0f}メガピクセル以下の画像を選択してください。")
+    estimate = estimate_memory(decoded_size or img.size, img.mode, output_sizes)
+    if estimate > max_memory:
+        raise ImageTooLargeError(
+            f"画像の処理に必要なメモリが大きすぎます (約{estimate / (1024 * 1024):.0f}MB、"
+            f"上限{max_memory / (1024 * 1024):.0f}MB)。")
+    return estimate
+
+def estimate_animation_memory(canvas_size, frame_count, output_sizes):
+    """
+    アニメーションを1フレームずつ縮小して保存するのに必要なメモリを見積もる (バイト)
+
+    元の画像は合成中のフレームと変換後のフレームなど3フレーム分として計算します。
+    縮小後のフレームは、1回のデコードで全ての横幅を作り、目標ファイルサイズの探索で繰り返しエンコードするため、
+    保存が終わるまで全ての横幅の全フレーム分を保持します。
+    さらに GIF のエンコーダーはパレット画像に変換したフレーム (1画素1バイト) を全フレーム分保持するため、
+    1つずつ保存する横幅のうち最も大きいもの1つ分を加えます。
+    """
+    canvas = canvas_size[0] * canvas_size[1] * 4
+    outputs = sum(width * height for width, height in output_sizes) * 4
+    palette = max((width * height for width, height in output_sizes), default=0)
+    return canvas * 3 + (outputs + palette) * frame_count
+
+def check_animation(img, output_sizes, max_frames, max_pixels, max_memory):
+    """
+    デコード前のアニメーション画像を検査する
+
+    Args:
+        img: Image.open() で開いたアニメーション画像
+        output_sizes: 出力する画像のサイズのリスト
+        max_frames: フレーム数の上限
+        max_pixels: 全フレームの合計画素数の上限
+        max_memory: メモリ (見積もり) の上限 (バイト)
+
+    Returns:
+        int: 必要なメモリの見積もり (バイト)
+
+    Raises:
+        TooManyFramesError: フレーム数、または合計画素数が上限を超えている場合
+        ImageTooLargeError: 必要なメモリが上限を超えている場合
+    """
+    width, height = img.size
+    frame_count = img.n_frames
+    if frame_count > max_frames:
+        raise TooManyFramesError(
+            f"アニメーションのフレーム数が多すぎます ({frame_count}フレーム)。"
+            f"{max_frames}フレーム以下の画像を選択してください。")
+    if width * height * frame_count > max_pixels:
+        raise TooManyFramesError(
+            f"アニメーションが大きすぎます ({width}x{height}、{frame_count}フレーム)。"
+            f"全フレームの合計が{max_pixels / 1000000:.0f}メガピクセル以下の画像を選択してください。")
+    estimate = estimate_animation_memory(img.size, frame_count, output_sizes)
+    if estimate > max_memory:
+        raise ImageTooLargeError(
+            f"画像の処理に必要なメモリが大きすぎます (約{estimate / (1024 * 1024):.0f}MB、"
+            f"上限{max_memory / (1024 * 1024):.0f}MB)。")
+    return estimate
+
+class MemoryBudget:
+    """
+    プロセス全体で同時に使うメモリ (見積もり) の合計を制限するセマフォ (バイト単位)
+
+    上限を超える場合は他の処理が終わるまで timeout 秒まで待ち、
+    それでも空かない場合は MemoryBudgetExceeded を送出します。
+    """
+
+    def __init__(self, capacity, timeout):
+        """
+        Args:
+            capacity: 同時に使うメモリの上限 (バイト)
+            timeout: 空くまで待つ最大秒数
+        """
+        self.capacity = capacity
+        self.timeout = timeout
+        self._reset()
+        # fork した子プロセス (プロセスプール) では親プロセスの予約を引き継がない
+        os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self):
+        self._condition = threading.Condition()
+        self._used = 0
+        self._waiting = 0
+        self.rejected = 0
+
+    @contextmanager
+    def reserve(self, nbytes):
+        """
+        with ブロックの間、nbytes のメモリを予約する
+
+        Raises:
+            MemoryBudgetExceeded: timeout 秒待っても予約できなかった場合
+        """
+        nbytes = min(nbytes, self.capacity)  # 1件だけで上限を超える場合も、他に処理がなければ受け付ける
+        deadline = time.monotonic() + self.timeout
+        with self._condition:
+            self._waiting += 1
+            try:
+                while self._used + nbytes > self.capacity:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.rejected += 1
+                        raise MemoryBudgetExceeded("混み合っています。しばらくしてから再度お試しください。")
+                    self._condition.wait(remaining)
+            finally:
+                self._waiting -= 1
+            self._used += nbytes
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._used -= nbytes
+                self._condition.notify_all()
+
+    def stats(self):
+        """予約中のバイト数・待機中の件数・受け付けなかった件数を返す"""
+        with self._condition:
+            return {'capacity': self.capacity,
+                    'used': self._used,
+                    'waiting': self._waiting,
+                    'rejected': self.rejected}
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+class SharedMemoryBudget:
+    """
+    全プロセスで同時に使うメモリ (見積もり) の合計を制限するセマフォ (バイト単位)
+
+    予約の一覧 (予約ID -> [プロセスID, バイト数]) を共有のファイルに保存し、
+    読み書きは flock で排他します。gunicorn の sync ワーカーのように1プロセスで
+    1リクエストずつ処理する場合も、ワーカー全体の合計で制限できます。
+    強制終了されたプロセスの予約は、次に予約・参照するときに削除します。
+
+    インターフェースは MemoryBudget と同じです。
+    """
+
+    def __init__(self, capacity, timeout, path):
+        """
+        Args:
+            capacity: 全プロセスで同時に使うメモリの上限 (バイト)
+            timeout: 空くまで待つ最大秒数
+            path: 予約の一覧を保存するファイルのパス (全プロセスで共有するもの)
+        """
+        self.capacity = capacity
+        self.timeout = timeout
+        self.path = path
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self._reset()
+        # fork した子プロセスではこのプロセスの待機数・拒否数を引き継がない
+        os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self):
+        self._lock = threading.Lock()
+        self._waiting = 0
+        self.rejected = 0
+
+    @contextmanager
+    def _ledger(self):
+        """予約の一覧を排他的に開き、with ブロックの終了時に書き戻す"""
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        with os.fdopen(fd, 'r+') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                try:
+                    entries = json.loads(f.read() or '{}')
+                except ValueError:
+                    entries = {}
+                # 強制終了されたプロセスの予約を削除する
+                alive = {}
+                entries = {key: value for key, value in entries.items()
+                           if alive.setdefault(value[0], _pid_alive(value[0]))}
+                before = dict(entries)
+                yield entries
+                if entries != before:
+                    f.seek(0)
+                    f.truncate()
+                    f.write(json.dumps(entries))
+                    f.flush()
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _try_reserve(self, nbytes):
+        """空いていれば予約して予約IDを返す (空いていなければ None)"""
+        with self._ledger() as entries:
+            if sum(value[1] for value in entries.values()) + nbytes > self.capacity:
+                return None
+            key = uuid.uuid4().hex
+            entries[key] = [os.getpid(), nbytes]
+            return key
+
+    @contextmanager
+    def reserve(self, nbytes):
+        """
+        with ブロックの間、nbytes のメモリを予約する
+
+        Raises:
+            MemoryBudgetExceeded: timeout 秒待っても予約できなかった場合
+        """
+        nbytes = min(nbytes, self.capacity)  # 1件だけで上限を超える場合も、他に処理がなければ受け付ける
+        deadline = time.monotonic() + self.timeout
+        with self._lock:
+            self._waiting += 1
+        try:
+            while True:
+                key = self._try_reserve(nbytes)
+                if key is not None:
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    with self._lock:
+                        self.rejected += 1
+                    raise MemoryBudgetExceeded("混み合っています。しばらくしてから再度お試しください。")
+                time.sleep(min(SHARED_POLL_INTERVAL, remaining))
+        finally:
+            with self._lock:
+                self._waiting -= 1
+        try:
+            yield
+        finally:
+            with self._ledger() as entries:
+                entries.pop(key, None)
+
+    def stats(self):
+        """全プロセスの予約中のバイト数と件数、このプロセスの待機中の件数・受け付けなかった件数を返す"""
+        with self._ledger() as entries:
+            used = sum(value[1] for value in entries.values())
+            reservations = len(entries)
+        with self._lock:
+            return {'capacity': self.capacity,
+                    'used': used,
+                    'reservations': reservations,
+                    'waiting': self._waiting,
+                    'rejected': self.rejected}
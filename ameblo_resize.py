@@ -1,15 +1,36 @@
 import subprocess
-from PIL import Image, ImageTk
+from concurrent.futures import Future
+from PIL import Image, ImageOps
 import os
 import json
-import tkinter as tk
-from tkinter import filedialog, messagebox, ttk # ttkモジュールを追加
+import threading
+from jpeg_rotate import rotate_jpeg_file, METHOD_LOSSLESS, METHOD_EXIF
+from animation import ANIMATION_FORMATS, is_animated, resize_frames
+from encoders import (save_image, save_animation, output_format_info, available_output_formats,
+                      ENCODER_PRESETS, PRESET_LABELS, OUTPUT_FORMAT_LABELS, DEFAULT_PRESET, FORMAT_ORIGINAL)
 
 # --- グローバル設定 ---
 PROGRAM_TITLE = "Ameblo 画像リサイズツール"
-VERSION = "0.5" # ソース変更時にこの値を更新してください
+VERSION = "1.1" # ソース変更時にこの値を更新してください
 CONFIG_FILE = "ameblo_resizer_config.json"
 DEFAULT_WIDTHS = [620, 1024, 1080, 1280]
+PREVIEW_FAST_FILTER = Image.BILINEAR  # ウィンドウサイズ変更中の簡易表示に使うリサイズフィルタ
+PREVIEW_REDRAW_DELAY_MS = 150  # ウィンドウサイズ変更が落ち着いてから高画質で再描画するまでの待ち時間 (ミリ秒)
+BACKGROUND_POLL_MS = 100  # バックグラウンド処理の終了を確認する間隔 (ミリ秒)
+
+# GUI のモジュール (tkinter / ImageTk) は読み込みに時間がかかるため、画面を表示するときに load_gui_modules() で読み込む
+# (resize_image_to_file などをスクリプトやベンチマークから使う場合は読み込まない)
+tk = filedialog = messagebox = ttk = ImageTk = None
+
+def load_gui_modules():
+    """GUI のモジュール (tkinter / ImageTk) を読み込みます。2回目以降は何もしません。"""
+    global tk, filedialog, messagebox, ttk, ImageTk
+    if tk is not None:
+        return
+    import tkinter
+    from tkinter import filedialog as _filedialog, messagebox as _messagebox, ttk as _ttk # ttkモジュールを追加
+    from PIL import ImageTk as _ImageTk
+    tk, filedialog, messagebox, ttk, ImageTk = tkinter, _filedialog, _messagebox, _ttk, _ImageTk
 
 # 設定を読み込む
 def load_config():
@@ -20,6 +41,7 @@ def load_config():
                 return json.load(f)
         except json.JSONDecodeError:
             # JSONファイルが破損している場合の処理
+            load_gui_modules()
             messagebox.showwarning("設定ファイルの破損", "設定ファイルが破損しています。初期設定で起動します。")
             return {"default_directory": os.getcwd()}
     return {"default_directory": os.getcwd()} # デフォルトは現在の起動ディレクトリ
@@ -30,8 +52,15 @@ def save_config(config):
     with open(CONFIG_FILE, 'w') as f:
         json.dump(config, f, indent=4)
 
-# 初期設定を読み込む
-config = load_config()
+# 初期設定 (最初に使うときに読み込む)
+config = None
+
+def get_config():
+    """設定を返します。初回の呼び出し時に設定ファイルを読み込みます。"""
+    global config
+    if config is None:
+        config = load_config()
+    return config
 
 # --- Zenity を使用したファイル選択 (Zenity がインストールされている場合) ---
 def select_file_with_zenity_if_available(initial_dir):
@@ -42,7 +71,7 @@ def select_file_with_zenity_if_available(initial_dir):
         
         result = subprocess.run(
             ['zenity', '--file-selection', '--title=画像ファイルを選択してください',
-             '--file-filter=画像ファイル (jpg jpeg png gif bmp) | *.jpg *.jpeg *.png *.gif *.bmp',
+             '--file-filter=画像ファイル (jpg jpeg png gif bmp webp) | *.jpg *.jpeg *.png *.gif *.bmp *.webp',
              f'--filename={initial_dir}/'], # 初期ディレクトリを設定
             stdout=subprocess.PIPE,
             stderr=subprocess.PIPE,
@@ -59,13 +88,14 @@ def select_file_with_zenity_if_available(initial_dir):
 # --- tkinter を使用したファイル選択（Zenityがない場合のフォールバック） ---
 def select_file_with_tkinter(initial_dir):
     """Zenityが利用できない場合、tkinterを使用してファイル選択ダイアログを表示します。"""
+    load_gui_modules()
     root = tk.Tk()
     root.withdraw() # メインウィンドウを非表示にする
     file_path = filedialog.askopenfilename(
         title="画像ファイルを選択してください",
         initialdir=initial_dir,
         filetypes=[
-            ("画像ファイル", "*.jpg *.jpeg *.png *.gif *.bmp"),
+            ("画像ファイル", "*.jpg *.jpeg *.png *.gif *.bmp *.webp"),
             ("すべてのファイル", "*.*")
         ]
     )
@@ -77,7 +107,7 @@ def select_image_file():
     """画像ファイル選択ダイアログを表示し、選択されたファイルのパスを返します。
     ZenityがあればZenityを優先し、なければtkinterを使用します。
     """
-    initial_dir = config.get("default_directory", os.getcwd())
+    initial_dir = get_config().get("default_directory", os.getcwd())
     
     # まずZenityを試す
     file_path = select_file_with_zenity_if_available(initial_dir)
@@ -89,34 +119,92 @@ def select_image_file():
     return file_path
 
 # --- 画像のリサイズ処理 (メインアプリケーションから呼び出される) ---
-def resize_image_func(file_path, max_width):
-    """指定された画像をリサイズし、新しいファイルとして保存します。"""
-    try:
-        img = Image.open(file_path)
+def resize_image_to_file(file_path, max_width, output_format=FORMAT_ORIGINAL, preset=DEFAULT_PRESET):
+    """
+    指定された画像をリサイズし、新しいファイルとして保存します。
+    ダイアログは表示しないため、ワーカースレッドからも呼び出せます。
+
+    Args:
+        file_path: 画像ファイルのパス
+        max_width: リサイズ後の最大横幅
+        output_format: 出力形式 ('original', 'jpeg', 'progressive_jpeg', 'png', 'webp', 'avif')
+                       元の形式以外を指定した場合は、リサイズ不要でも変換して保存します
+        preset: 保存設定のプリセット ('fast', 'balanced', 'smallest')
+
+    Returns:
+        tuple: (保存したファイルのパス, メッセージ)。リサイズ・変換不要の場合、パスは None
+    """
+    format_info = output_format_info(output_format)
+    base, ext = os.path.splitext(file_path)
+    if format_info is None:
+        pil_format, encoder_options = Image.registered_extensions().get(ext.lower()), None # 拡張子から判定 (従来どおり)
+    else:
+        pil_format, ext, encoder_options = format_info
+    save_path = f"{base}_{max_width}px{ext}" # サイズをファイル名に含める
+
+    with Image.open(file_path) as img:
         w, h = img.size
+        if is_animated(img) and pil_format in ANIMATION_FORMATS:
+            if w <= max_width and format_info is None:
+                return None, f"横幅は既に{max_width}px以下です。リサイズは行いません。"
+            # アニメーション画像は1フレームずつ縮小し、アニメーションのまま保存する
+            size = (min(w, max_width), int(h * min(w, max_width) / w))
+            frames, durations, disposals = [], [], []
+            for (frame,), duration, disposal in resize_frames(img, [size]):
+                frames.append(frame)
+                durations.append(duration)
+                disposals.append(disposal)
+            save_animation(frames, save_path, pil_format, durations, disposals, img.info.get('loop'), preset, encoder_options)
+            return save_path, f"リサイズ画像を保存しました ({len(frames)}フレーム):\n{save_path}"
+
+        orientation = img.getexif().get(0x0112, 1) # EXIFの向き情報 (回転をEXIFで保存した場合など)
+        if orientation in (5, 6, 7, 8):
+            w, h = h, w # 表示上の横幅で判定する
 
         if w <= max_width:
-            messagebox.showinfo("情報", f"横幅は既に{max_width}px以下です。リサイズは行いません。")
-            return
-
-        new_w = max_width
-        new_h = int(h * max_width / w)
-        resized_img = img.resize((new_w, new_h), Image.LANCZOS)
-
-        base, ext = os.path.splitext(file_path)
-        save_path = f"{base}_{max_width}px{ext}" # サイズをファイル名に含める
-        
-        # JPEGの場合、品質を指定して保存
-        if save_path.lower().endswith(('.jpg', '.jpeg')):
-            resized_img.save(save_path, quality=95, optimize=True)
+            if format_info is None:
+                return None, f"横幅は既に{max_width}px以下です。リサイズは行いません。"
+            # 形式の変換だけを行う
+            resized_img = ImageOps.exif_transpose(img)
         else:
-            resized_img.save(save_path)
+            new_w = max_width
+            new_h = int(h * max_width / w)
+            # 縮小後の小さい画像に対して向きを反映させる
+            resized_img = ImageOps.exif_transpose(img.resize((new_h, new_w) if orientation in (5, 6, 7, 8) else (new_w, new_h), Image.LANCZOS))
+
+    # 形式とプリセットに応じた設定で保存 (JPEGの品質など)
+    save_image(resized_img, save_path, pil_format, preset, encoder_options)
 
-        messagebox.showinfo("完了", f"リサイズ画像を保存しました:\n{save_path}")
+    return save_path, f"リサイズ画像を保存しました:\n{save_path}"
 
+def resize_image_func(file_path, max_width):
+    """指定された画像をリサイズし、新しいファイルとして保存します。"""
+    load_gui_modules()
+    try:
+        save_path, message = resize_image_to_file(file_path, max_width)
+        messagebox.showinfo("完了" if save_path else "情報", message)
     except Exception as e:
         messagebox.showerror("エラー", f"画像のリサイズ中にエラーが発生しました:\n{e}")
 
+def rotate_image(image, rotation):
+    """画像を反時計回りに rotation 度 (0/90/180/270) 回転させた画像を返します。"""
+    transpose = {90: Image.ROTATE_90, 180: Image.ROTATE_180, 270: Image.ROTATE_270}.get(rotation)
+    if transpose is None:
+        return image
+    return image.transpose(transpose)
+
+def build_preview_proxy(file_path, max_size):
+    """
+    プレビュー用に画面サイズまで縮小した画像を作成します。
+    JPEGはDCT領域で縮小しながらデコードするため、大きな画像でも高速です。
+    """
+    with Image.open(file_path) as img:
+        img.thumbnail(max_size, Image.LANCZOS) # draft + reducing_gap による高速縮小
+        return ImageOps.exif_transpose(img) # EXIFの向き情報を反映 (縮小後に行うので高速)
+
+class OperationCancelled(Exception):
+    """バックグラウンド処理がユーザーによってキャンセルされた"""
+
 # --- メインアプリケーションのロジック ---
 class MainApp:
     def __init__(self, master):
@@ -130,10 +218,15 @@ class MainApp:
         self.center_window(master, 1000, 700) # ウィンドウを画面中央に配置
 
         self.current_image_path = None # 現在選択されている画像のパス
-        self.original_image = None     # 読み込んだままの元のPIL Imageオブジェクト
-        self.display_image = None      # プレビュー表示用に回転などされたPIL Imageオブジェクト
+        self.original_image = None     # 読み込んだままの元のPIL Imageオブジェクト (保存時まで全画素はデコードしない)
+        self.preview_proxy = None      # 画面サイズまで縮小したプレビュー用のPIL Imageオブジェクト (回転前)
+        self.display_image = None      # プレビュー表示用に回転などされたPIL Imageオブジェクト (preview_proxy を回転したもの)
         self.photo = None              # ImageTk.PhotoImageオブジェクト (Tkinterで画像を表示するために必要)
         self.image_rotated = False     # 画像がプレビューで回転されたかどうかのフラグ
+        self.rotation = 0              # プレビューでの回転角度 (反時計回り、0/90/180/270)。元画像には保存時に適用する
+        self.redraw_job = None         # 高画質での再描画の予約 (after のID)
+        self.cancel_event = None       # 実行中のバックグラウンド処理のキャンセル要求
+        self.progress_text = ""        # バックグラウンド処理の進行状況 (ワーカースレッドから更新)
 
         # メインフレーム (左右分割用)
         self.main_frame = tk.Frame(master)
@@ -159,8 +252,21 @@ class MainApp:
         self.image_ops_frame.pack(pady=10)
         self.image_ops_frame.pack_forget() # 最初は非表示
 
-        tk.Button(self.image_ops_frame, text="90度回転", command=self.rotate_90).pack(side=tk.LEFT, padx=5)
-        tk.Button(self.image_ops_frame, text="-90度回転", command=self.rotate_minus_90).pack(side=tk.LEFT, padx=5)
+        self.rotate_buttons = [
+            tk.Button(self.image_ops_frame, text="90度回転", command=self.rotate_90),
+            tk.Button(self.image_ops_frame, text="-90度回転", command=self.rotate_minus_90),
+        ]
+        for button in self.rotate_buttons:
+            button.pack(side=tk.LEFT, padx=5)
+
+        # JPEGの回転の保存方法 (どちらも再エンコードしないため画質は劣化しない)
+        self.rotate_method_frame = tk.Frame(self.control_frame)
+        self.rotate_method_frame.pack(pady=5)
+        self.rotate_method_frame.pack_forget() # 最初は非表示
+        tk.Label(self.rotate_method_frame, text="JPEGの回転の保存方法：").pack(anchor=tk.W)
+        self.rotate_method = tk.StringVar(self.master, value=METHOD_LOSSLESS)
+        tk.Radiobutton(self.rotate_method_frame, text="無劣化回転", variable=self.rotate_method, value=METHOD_LOSSLESS).pack(anchor=tk.W)
+        tk.Radiobutton(self.rotate_method_frame, text="EXIFの向き情報のみ", variable=self.rotate_method, value=METHOD_EXIF).pack(anchor=tk.W)
 
         # リサイズ設定フレーム (画像選択後に表示)
         self.resize_frame = tk.Frame(self.control_frame)
@@ -174,7 +280,32 @@ class MainApp:
         self.combobox.pack(pady=5)
         self.combobox.set(str(DEFAULT_WIDTHS[0])) # 初期値を設定
 
-        tk.Button(self.resize_frame, text="リサイズ実行", command=self.perform_resize).pack(pady=5)
+        # 出力形式と保存設定 (コンボボックスには表示名を出す)
+        self.output_formats = [FORMAT_ORIGINAL] + available_output_formats()
+        tk.Label(self.resize_frame, text="出力形式：").pack()
+        self.format_combobox = ttk.Combobox(self.resize_frame, values=[OUTPUT_FORMAT_LABELS[name] for name in self.output_formats], state="readonly")
+        self.format_combobox.pack(pady=5)
+        self.format_combobox.current(0)
+
+        self.presets = list(ENCODER_PRESETS)
+        tk.Label(self.resize_frame, text="保存設定：").pack()
+        self.preset_combobox = ttk.Combobox(self.resize_frame, values=[PRESET_LABELS[name] for name in self.presets], state="readonly")
+        self.preset_combobox.pack(pady=5)
+        self.preset_combobox.current(self.presets.index(DEFAULT_PRESET))
+
+        self.resize_button = tk.Button(self.resize_frame, text="リサイズ実行", command=self.perform_resize)
+        self.resize_button.pack(pady=5)
+
+        # 進行状況フレーム (バックグラウンド処理中に表示)
+        self.progress_frame = tk.Frame(self.control_frame)
+        self.progress_frame.pack(pady=10, fill=tk.X)
+        self.progress_label = tk.Label(self.progress_frame, text="")
+        self.progress_label.pack()
+        self.progress_bar = ttk.Progressbar(self.progress_frame, mode="indeterminate", length=200)
+        self.progress_bar.pack(pady=5)
+        self.cancel_button = tk.Button(self.progress_frame, text="キャンセル", command=self.cancel_background)
+        self.cancel_button.pack()
+        self.progress_frame.pack_forget() # 最初は非表示
 
         # その他の設定ボタン
         tk.Button(self.control_frame, text="デフォルト起動ディレクトリ設定", command=self.set_default_directory, height=2, width=25).pack(pady=5)
@@ -196,30 +327,141 @@ class MainApp:
         y = (screen_height / 2) - (height / 2)
         window.geometry(f'{width}x{height}+{int(x)}+{int(y)}')
     
+    def run_in_background(self, task, on_done):
+        """
+        task をワーカースレッドで実行し、終了後に on_done をメインスレッドで呼び出します。
+        処理中は進行状況とキャンセルボタンを表示し、画像操作ボタンを無効にします。
+
+        Args:
+            task: task(cancel_event, report) の形で呼び出される関数。
+                  report(テキスト) で進行状況を表示できます。
+            on_done: on_done(結果, 例外) の形で呼び出される関数 (成功時の例外は None)
+        """
+        if self.cancel_event is not None:
+            return # 既に処理中
+
+        self.cancel_event = threading.Event()
+        self.progress_text = ""
+        future = Future()
+        cancel_event = self.cancel_event
+
+        def report(text):
+            self.progress_text = text # 表示の更新はメインスレッドの poll_background で行う
+
+        def worker():
+            try:
+                future.set_result(task(cancel_event, report))
+            except BaseException as e:
+                future.set_exception(e)
+
+        # 終了時に処理の完了を待たないよう、デーモンスレッドで実行
+        threading.Thread(target=worker, daemon=True).start()
+        self.set_busy(True)
+        self.master.after(BACKGROUND_POLL_MS, self.poll_background, future, on_done)
+
+    def poll_background(self, future, on_done):
+        """バックグラウンド処理の終了を master.after で定期的に確認します。"""
+        self.progress_label.config(text=self.progress_text)
+        if not future.done():
+            self.master.after(BACKGROUND_POLL_MS, self.poll_background, future, on_done)
+            return
+
+        self.set_busy(False)
+        self.cancel_event = None
+        try:
+            result, error = future.result(), None
+        except Exception as e:
+            result, error = None, e
+        on_done(result, error)
+
+    def cancel_background(self):
+        """実行中のバックグラウンド処理のキャンセルを要求します (区切りのよいところで中断されます)。"""
+        if self.cancel_event is not None:
+            self.cancel_event.set()
+            self.progress_text = "キャンセルしています..."
+
+    def set_busy(self, busy):
+        """処理中は進行状況を表示し、画像操作ボタンを無効にします。"""
+        state = tk.DISABLED if busy else tk.NORMAL
+        for button in [self.select_button, self.resize_button] + self.rotate_buttons:
+            button.config(state=state)
+        if busy:
+            self.progress_frame.pack(pady=10, fill=tk.X)
+            self.progress_bar.start(10)
+        else:
+            self.progress_bar.stop()
+            self.progress_frame.pack_forget()
+
     def select_image_and_display(self):
         """
         画像ファイルを選択し、選択された画像をプレビュー領域に表示します。
         画像操作ボタンとリサイズ設定を表示します。
+        画像の読み込みはバックグラウンドで行います。
         """
         file_path = select_image_file()
-        if file_path:
-            self.current_image_path = file_path
-            try:
-                self.original_image = Image.open(file_path)
-                self.display_image = self.original_image.copy() # プレビュー用の画像をコピー
-                self.image_rotated = False # 新しい画像が読み込まれたら回転フラグをリセット
-                self.update_image_display() # 画像をキャンバスに表示
-                # 画像が選択されたら操作UIを表示
-                self.image_ops_frame.pack(pady=10)
-                self.resize_frame.pack(pady=10)
-            except Exception as e:
-                messagebox.showerror("エラー", f"画像の読み込み中にエラーが発生しました:\n{e}")
+        if not file_path:
+            return
+
+        max_size = (self.master.winfo_screenwidth(), self.master.winfo_screenheight())
+
+        def task(cancel_event, report):
+            report("画像を読み込んでいます...")
+            original_image = Image.open(file_path)
+            if cancel_event.is_set():
+                original_image.close()
+                raise OperationCancelled()
+            report("プレビューを作成しています...")
+            preview_proxy = build_preview_proxy(file_path, max_size) # 画面サイズのプレビュー用画像を作成
+            if cancel_event.is_set():
+                original_image.close()
+                raise OperationCancelled()
+            return original_image, preview_proxy
+
+        def on_done(result, error):
+            if isinstance(error, OperationCancelled):
+                return # 読み込み前の状態のまま
+            if error is not None:
+                messagebox.showerror("エラー", f"画像の読み込み中にエラーが発生しました:\n{error}")
                 self.reset_ui() # エラー時はUIをリセット
+                return
+            self.current_image_path = file_path
+            self.original_image, self.preview_proxy = result
+            self.display_image = self.preview_proxy
+            self.rotation = 0
+            self.image_rotated = False # 新しい画像が読み込まれたら回転フラグをリセット
+            self.update_image_display() # 画像をキャンバスに表示
+            # 画像が選択されたら操作UIを表示
+            self.image_ops_frame.pack(pady=10)
+            if file_path.lower().endswith(('.jpg', '.jpeg')):
+                self.rotate_method_frame.pack(pady=5, after=self.image_ops_frame)
+            else:
+                self.rotate_method_frame.pack_forget()
+            self.resize_frame.pack(pady=10)
+
+        self.run_in_background(task, on_done)
+
+    def schedule_redraw(self):
+        """
+        ウィンドウサイズ変更中は簡易フィルタですぐに再描画し、
+        変更が落ち着いてから (PREVIEW_REDRAW_DELAY_MS 後に) 高画質で1回だけ再描画します。
+        """
+        if not self.display_image:
+            return
+        self.update_image_display(resample=PREVIEW_FAST_FILTER)
+        if self.redraw_job is not None:
+            self.master.after_cancel(self.redraw_job)
+        self.redraw_job = self.master.after(PREVIEW_REDRAW_DELAY_MS, self.redraw_high_quality)
+
+    def redraw_high_quality(self):
+        """予約された高画質での再描画を行います。"""
+        self.redraw_job = None
+        self.update_image_display()
 
-    def update_image_display(self):
+    def update_image_display(self, resample=Image.LANCZOS):
         """
         現在のdisplay_imageをキャンバスに表示します。
         キャンバスのサイズに合わせて画像を拡大縮小し、中央に配置します。
+        display_image は画面サイズのプレビュー用画像のため、元画像の解像度に関係なく高速です。
         """
         if not self.display_image:
             self.canvas.delete("all") # 画像がない場合はキャンバスをクリア
@@ -260,8 +502,8 @@ class MainApp:
         new_w = int(img_w * scale_ratio)
         new_h = int(img_h * scale_ratio)
 
-        # 画像をリサイズ (LANCZOSは高品質なリサイズアルゴリズム)
-        resized_for_display = self.display_image.resize((new_w, new_h), Image.LANCZOS)
+        # 画像をリサイズ (LANCZOSは高品質なリサイズアルゴリズム、サイズ変更中は簡易フィルタ)
+        resized_for_display = self.display_image.resize((max(new_w, 1), max(new_h, 1)), resample)
             
         # ImageTk.PhotoImageに変換して、Tkinterで表示できるようにする
         self.photo = ImageTk.PhotoImage(resized_for_display)
@@ -275,15 +517,17 @@ class MainApp:
     def rotate_90(self):
         """表示中の画像を時計回りに90度回転させます。"""
         if self.display_image:
-            self.display_image = self.display_image.transpose(Image.ROTATE_90)
-            self.image_rotated = True # 回転フラグを立てる
+            self.display_image = self.display_image.transpose(Image.ROTATE_90) # プレビュー用画像のみ回転
+            self.rotation = (self.rotation + 90) % 360
+            self.image_rotated = self.rotation != 0 # 回転フラグを立てる (一周した場合は戻す)
             self.update_image_display()
 
     def rotate_minus_90(self):
         """表示中の画像を反時計回りに90度回転させます。"""
         if self.display_image:
-            self.display_image = self.display_image.transpose(Image.ROTATE_270)
-            self.image_rotated = True # 回転フラグを立てる
+            self.display_image = self.display_image.transpose(Image.ROTATE_270) # プレビュー用画像のみ回転
+            self.rotation = (self.rotation + 270) % 360
+            self.image_rotated = self.rotation != 0 # 回転フラグを立てる (一周した場合は戻す)
             self.update_image_display()
             
     def on_resize(self, event):
@@ -293,14 +537,14 @@ class MainApp:
         """
         # event.widget が master (root) の場合のみ処理 (他のウィジェットのリサイズイベントを無視)
         if event.widget == self.master:
-            self.update_image_display()
+            self.schedule_redraw()
 
     def on_preview_frame_resize(self, event):
         """
         プレビューフレームのサイズが変更されたときに呼び出されます。
         画像の再描画をトリガーします。
         """
-        self.update_image_display()
+        self.schedule_redraw()
 
     def perform_resize(self):
         """
@@ -313,32 +557,83 @@ class MainApp:
 
         try:
             max_width = int(self.selected_width.get())
-            
-            # プレビューで画像が回転されている場合、元のファイルに保存するか確認
-            if self.image_rotated: 
-                confirm_save = messagebox.askyesno("確認", "プレビューで画像を回転させました。リサイズ前にこの変更を元のファイルに保存しますか？")
-                if confirm_save:
-                    try:
-                        # JPEGの場合、品質を指定して保存（元の品質に近い形で）
-                        if self.current_image_path.lower().endswith(('.jpg', '.jpeg')):
-                            self.display_image.save(self.current_image_path, quality=95, optimize=True)
-                        else:
-                            self.display_image.save(self.current_image_path)
-                        messagebox.showinfo("保存完了", "回転された画像を元のファイルに保存しました。")
-                        self.image_rotated = False # 保存したらフラグをリセット
-                    except Exception as e:
-                        messagebox.showerror("エラー", f"回転画像の保存中にエラーが発生しました:\n{e}")
-                        return # 保存に失敗したらリサイズは行わない
-
-            # リサイズ処理を実行
-            resize_image_func(self.current_image_path, max_width) 
         except ValueError:
             messagebox.showerror("エラー", "無効なサイズが選択されました。")
-        except Exception as e:
-            messagebox.showerror("エラー", f"リサイズ処理中に予期せぬエラーが発生しました:\n{e}")
+            return
+
+        # プレビューで画像が回転されている場合、元のファイルに保存するか確認
+        save_rotation = False
+        if self.image_rotated: 
+            save_rotation = messagebox.askyesno("確認", "プレビューで画像を回転させました。リサイズ前にこの変更を元のファイルに保存しますか？")
+
+        file_path = self.current_image_path
+        original_image = self.original_image
+        rotation = self.rotation
+        rotate_method = self.rotate_method.get()
+        output_format = self.output_formats[self.format_combobox.current()]
+        preset = self.presets[self.preset_combobox.current()]
+
+        def task(cancel_event, report):
+            result = {'rotated_image': None, 'save_error': None, 'resize': None, 'resize_error': None,
+                      'rotate_method': None}
+            if save_rotation:
+                report("回転した画像を保存しています...")
+                try:
+                    if file_path.lower().endswith(('.jpg', '.jpeg')):
+                        # JPEGは再エンコードせずに回転 (rotation は反時計回り、jpeg_rotate は時計回り)
+                        original_image.close()
+                        result['rotate_method'] = rotate_jpeg_file(file_path, (-rotation) % 360, rotate_method)
+                        rotated_image = Image.open(file_path)
+                    else:
+                        # 元の画像 (全解像度) に回転を適用するのは保存時の1回だけ
+                        rotated_image = rotate_image(ImageOps.exif_transpose(original_image), rotation)
+                        rotated_image.save(file_path)
+                    result['rotated_image'] = rotated_image
+                except Exception as e:
+                    result['save_error'] = e
+                    return result # 保存に失敗したらリサイズは行わない
+
+            # 保存済みの回転を反映させるため、キャンセルは保存の後で確認する
+            if cancel_event.is_set():
+                result['cancelled'] = True
+                return result
+
+            # リサイズ処理を実行
+            report("リサイズしています...")
+            try:
+                result['resize'] = resize_image_to_file(file_path, max_width, output_format, preset)
+            except Exception as e:
+                result['resize_error'] = e
+            return result
+
+        def on_done(result, error):
+            if error is not None:
+                messagebox.showerror("エラー", f"リサイズ処理中に予期せぬエラーが発生しました:\n{error}")
+                return
+            if result['save_error'] is not None:
+                messagebox.showerror("エラー", f"回転画像の保存中にエラーが発生しました:\n{result['save_error']}")
+                self.original_image = Image.open(self.current_image_path) # 保存前に閉じている場合があるため開き直す
+                return
+            if result['rotated_image'] is not None:
+                method_text = {METHOD_LOSSLESS: "(無劣化回転)", METHOD_EXIF: "(EXIFの向き情報)"}.get(result['rotate_method'], "")
+                messagebox.showinfo("保存完了", f"回転された画像を元のファイルに保存しました。{method_text}")
+                self.original_image = result['rotated_image'] # 保存した画像を新しい元画像とする
+                self.preview_proxy = self.display_image
+                self.rotation = 0
+                self.image_rotated = False # 保存したらフラグをリセット
+            if result.get('cancelled'):
+                return
+            if result['resize_error'] is not None:
+                messagebox.showerror("エラー", f"画像のリサイズ中にエラーが発生しました:\n{result['resize_error']}")
+                return
+            save_path, message = result['resize']
+            messagebox.showinfo("完了" if save_path else "情報", message)
+
+        self.run_in_background(task, on_done)
 
     def set_default_directory(self):
         """デフォルトの起動ディレクトリを設定します。"""
+        config = get_config()
         initial_dir = config.get("default_directory", os.getcwd())
         new_dir = filedialog.askdirectory(title="デフォルト起動ディレクトリを選択", initialdir=initial_dir)
         if new_dir:
@@ -350,14 +645,18 @@ class MainApp:
         """UIの状態を初期化します（画像クリア、操作ボタン非表示など）。"""
         self.current_image_path = None
         self.original_image = None
+        self.preview_proxy = None
         self.display_image = None
+        self.rotation = 0
         self.photo = None
         self.canvas.delete("all") # キャンバスをクリア
         self.image_ops_frame.pack_forget() # 画像操作ボタンを非表示
+        self.rotate_method_frame.pack_forget() # 回転の保存方法を非表示
         self.resize_frame.pack_forget() # リサイズ設定を非表示
 
 # --- プログラムの実行 ---
 if __name__ == "__main__":
+    load_gui_modules()
     root = tk.Tk()
     app = MainApp(root)
     root.mainloop()
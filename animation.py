@@ -0,0 +1,70 @@
+"""
+アニメーション画像 (GIF / WebP) のフレームごとのリサイズ
+
+全フレームを一度にメモリへ読み込まず、1フレームずつデコードして縮小するジェネレーターです。
+元の画像は常に1フレーム分 (GIFは差分を合成するための1つ前のフレームを含めて2フレーム分) だけを保持します。
+
+- 各フレームの表示時間 (duration)・破棄方法 (disposal)・ループ回数 (loop) を引き継ぎます
+- 縮小後のフレームは保存時に Pillow のエンコーダーがまとめて保持するため、
+  フレーム数と画素数・メモリの上限 (admission.check_animation) と合わせて使用してください
+
+作成日: 2026-10-16
+"""
+
+from PIL import Image
+
+# アニメーションのまま保存できる画像形式 (それ以外の形式では従来どおり先頭のフレームだけを保存する)
+ANIMATION_FORMATS = ('GIF', 'WEBP')
+
+# 破棄方法の情報を持たない画像 (WebP) のフレームは、フレーム全体を描き直すため背景に戻す (2) とする
+DEFAULT_DISPOSAL = 2
+
+def is_animated(img):
+    """複数のフレームを持つ画像かどうか (GIFはヘッダーを読むだけでデコードはしない)"""
+    return getattr(img, 'is_animated', False) and img.n_frames > 1
+
+def _frame_mode(frame):
+    """縮小に使う画像モード (パレット画像は LANCZOS で縮小できないため RGB / RGBA にする)"""
+    if frame.mode in ('RGBA', 'LA', 'PA') or 'transparency' in frame.info:
+        return 'RGBA'
+    return 'RGB'
+
+def iter_frames(img):
+    """
+    1フレームずつデコードする
+
+    Args:
+        img: Image.open() で開いたアニメーション画像
+
+    Yields:
+        tuple: (フレーム (RGB または RGBA), 表示時間 (ミリ秒), 破棄方法)
+    """
+    for index in range(img.n_frames):
+        img.seek(index)
+        # GIF は2フレーム目以降も前のフレームと合成したフレーム全体が得られる
+        frame = img.convert(_frame_mode(img))
+        # WebP の表示時間はデコード後に設定されるため、convert() の後で読む
+        yield frame, img.info.get('duration', 0), getattr(img, 'disposal_method', DEFAULT_DISPOSAL)
+    img.seek(0)
+
+def resize_frames(img, sizes, resample=Image.LANCZOS):
+    """
+    1フレームずつデコードし、複数のサイズに縮小する
+
+    各サイズのフレームは1つ前 (1段大きい) のサイズのフレームから縮小します (カスケード縮小)。
+
+    Args:
+        img: Image.open() で開いたアニメーション画像
+        sizes: 縮小後のサイズ (幅, 高さ) のリスト (大きい順)。元のサイズと同じ場合は縮小しない
+
+    Yields:
+        tuple: (sizes と同じ順のフレームのリスト, 表示時間 (ミリ秒), 破棄方法)
+    """
+    for frame, duration, disposal in iter_frames(img):
+        resized = []
+        source = frame
+        for size in sizes:
+            if source.size != size:
+                source = source.resize(size, resample)
+            resized.append(source)
+        yield resized, duration, disposal
@@ -12,20 +12,151 @@
 作成日: 2025-06-06
 """
 
-from flask import Flask, render_template, request, send_file, flash, redirect, url_for
+import time
+_IMPORT_STARTED = time.perf_counter()  # 起動時間の計測用 (このモジュールの読み込みを開始した時刻)
+
+from flask import Flask, Request, render_template, request, send_file, flash, redirect, url_for, jsonify, g
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
 from PIL import Image
+import hashlib
+import io
+import json
 import os
+import posixpath
+import re
+import sqlite3
 import tempfile
+import threading
 import uuid
-from werkzeug.utils import secure_filename
+import zipfile
+from urllib.parse import quote
+from werkzeug.utils import secure_filename, safe_join, send_file as werkzeug_send_file
 import logging
+from jpeg_rotate import ROTATE_METHODS, METHOD_LOSSLESS
+from job_queue import JobQueue, QueueFullError, STATUS_DONE
+from storage_janitor import StorageJanitor, SweepRule
+from metrics import Metrics
+from admission import SharedMemoryBudget, AdmissionError, ImageTooLargeError, MemoryBudgetExceeded
+from zip_stream import iter_zip
+from result_cache import ResultCache, HASH_CHUNK_SIZE, new_hasher, make_cache_key, link_or_copy
+from perceptual_hash import HashIndex, file_dhash, similar_aspect
+from encoders import (encoder_params, encoder_stats, output_format_info, available_output_formats,
+                      ENCODER_PRESETS, PRESET_LABELS, OUTPUT_FORMAT_LABELS, OUTPUT_FORMATS, DEFAULT_PRESET,
+                      FORMAT_ORIGINAL, FORMAT_AUTO, convert_for_format)
+from resize_core import (Resizer, format_for_ext, format_label,
+                         METRIC_STAGE_SECONDS, METRIC_REJECTIONS, METRIC_ERRORS)
 
 # --- グローバル設定 ---
 APP_TITLE = "画像リサイズWebサービス"
-VERSION = "0.1"  # ソース変更時にこの値を更新してください
-ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'bmp'}
+VERSION = "3.5"  # ソース変更時にこの値を更新してください
+ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'bmp', 'webp'}
 MAX_FILE_SIZE = 16 * 1024 * 1024  # 16MB
 DEFAULT_WIDTHS = [620, 1024, 1080, 1280]
+ROTATIONS = [0, 90, 180, 270]  # 選択できる回転角度 (時計回り)
+
+# 高速縮小の設定
+# JPEGはDCT領域での縮小(draft)、その他は reduce() による整数倍縮小を行ってから
+# 最終的な LANCZOS リサイズを行います。
+FAST_DOWNSCALE = True  # False にすると従来の厳密なリサイズ(全画素デコード + LANCZOS)のみを行う
+RESIZE_REDUCING_GAP = 3.0  # 品質ガード: 最終LANCZOSの前に目標サイズの何倍以上を残すか (3.0以上で厳密リサイズと見分けがつかない)
+
+# 保存設定 (プリセットと出力形式の内容は encoders.py を参照)
+DEFAULT_OUTPUT_FORMAT = FORMAT_ORIGINAL  # フォームで出力形式を指定しない場合の出力形式
+AUTO_OUTPUT_FORMATS = ['webp']  # 出力形式が「自動」の場合に Accept ヘッダーで優先する形式 (先頭ほど優先)
+                                # AVIF はサイズが小さい反面エンコードが遅いため、使う場合は 'avif' を先頭に追加してください
+
+# 保存先の設定
+# 全ての gunicorn ワーカーで共有するため固定のパスにする (環境変数 IMAGE_RESIZE_STORAGE で変更可能)
+STORAGE_ROOT = os.environ.get('IMAGE_RESIZE_STORAGE', os.path.join(tempfile.gettempdir(), 'image-resize'))
+UPLOAD_FOLDER = os.path.join(STORAGE_ROOT, 'uploads')
+DOWNLOAD_FOLDER = os.path.join(STORAGE_ROOT, 'downloads')
+CACHE_FOLDER = os.path.join(STORAGE_ROOT, 'cache')
+JOB_FOLDER = os.path.join(STORAGE_ROOT, 'jobs')
+METRICS_FOLDER = os.path.join(STORAGE_ROOT, 'metrics')
+MEMORY_BUDGET_PATH = os.path.join(STORAGE_ROOT, 'memory_budget.json')  # 全プロセスで共有するメモリの予約の一覧
+PHASH_INDEX_PATH = os.path.join(STORAGE_ROOT, 'phash.sqlite3')  # 知覚ハッシュの索引 (似た画像の検索に使う SQLite のファイル)
+
+# 一時ファイルの定期削除の設定
+SWEEP_INTERVAL = 5 * 60  # 削除処理の間隔 (秒)
+UPLOAD_TTL = 60 * 60  # アップロードファイル (非同期ジョブの入力) の保存期間: 1時間
+DOWNLOAD_TTL = 24 * 60 * 60  # ダウンロード用ファイルの保存期間: 24時間
+DOWNLOAD_MAX_BYTES = 1024 * 1024 * 1024  # ダウンロード用ファイルの合計サイズの上限: 1GB
+JOB_TTL = 24 * 60 * 60  # ジョブの状態ファイルの保存期間: 24時間
+
+# アップロード受信の設定
+UPLOAD_STREAMING = True  # False にすると従来どおりアップロードを UPLOAD_FOLDER に保存してからデコードする
+UPLOAD_SPOOL_MAX_MEMORY = 8 * 1024 * 1024  # この大きさまではメモリ上に保持し、超えた分はディスクに書き出す
+
+# リサイズ結果キャッシュの設定
+RESULT_CACHE_ENABLED = True  # False にするとキャッシュを使用しない
+CACHE_MAX_BYTES = 512 * 1024 * 1024  # 512MB
+CACHE_MAX_AGE = 7 * 24 * 60 * 60  # 最終利用から7日
+
+# 似た画像 (保存し直し・圧縮し直し・少しの切り抜きなど) の検索の設定 (リサイズ結果キャッシュを使用する場合のみ)
+NEAR_DUPLICATE_INDEX = True  # False にするとリサイズした画像の知覚ハッシュ (dHash) を索引に記録しない
+NEAR_DUPLICATE_REUSE = True  # キャッシュにない画像でも似た画像のリサイズ結果がキャッシュにあれば再利用する (False で無効)
+NEAR_DUPLICATE_THRESHOLD = 3  # 似た画像とみなす知覚ハッシュの異なるビット数の上限 (64ビット中。3以下は索引で高速に検索できる)
+NEAR_DUPLICATE_ASPECT_TOLERANCE = 0.02  # 再利用する画像の縦横比の差の上限 (比率。切り抜きで縦横比が変わった画像は再利用しない)
+NEAR_DUPLICATE_MIN_BITS = 8  # 知覚ハッシュの1のビットがこれより少ない画像 (無地に近く、別の画像とも一致しやすい) は再利用しない
+NEAR_DUPLICATE_MAX_DECODE_PIXELS = 4 * 1000 * 1000  # 検索のためにデコードする画素数の上限 (JPEGは draft() による縮小後の画素数で判定)
+
+# 非同期ジョブの設定 (/upload に mode=async を指定した場合)
+JOB_WORKERS = os.cpu_count() or 1  # ワーカーごとのプロセスプールのプロセス数
+JOB_MAX_PENDING = 16  # ワーカーごとに受け付ける最大ジョブ数 (実行中 + 待機中)
+JOB_TIMEOUT = 60  # ジョブ1件あたりの最大実行秒数
+JOB_RETRY_AFTER = 5  # キューが満杯の場合にクライアントへ返す再試行までの秒数
+
+# ダウンロード (/download) の設定
+SENDFILE_X_ACCEL = 'x-accel-redirect'  # nginx
+SENDFILE_X_SENDFILE = 'x-sendfile'  # Apache (mod_xsendfile) / lighttpd
+DOWNLOAD_SENDFILE_MODE = None  # 上のどちらかを指定すると、ファイルの送信をフロントのプロキシに任せる (None の場合は Python で送信する)
+DOWNLOAD_ACCEL_PREFIX = '/protected-downloads/'  # X-Accel-Redirect で指定する nginx の internal な location (DOWNLOAD_FOLDER を指すもの)
+DOWNLOAD_MAX_AGE = 60 * 60  # Cache-Control の max-age (秒)。None の場合は毎回 ETag で再検証させる
+ETAG_CACHE_SIZE = 4096  # ダウンロードファイルの ETag (内容のハッシュ値) をワーカーごとに記憶しておく件数
+
+# 帯ごとのリサイズの設定 (無圧縮の大きな画像 (BMP) を全体をデコードせずに数百行ずつ縮小する)
+STRIP_RESIZE = True  # False にすると従来どおり画像全体をデコードしてから縮小する
+STRIP_RESIZE_MIN_PIXELS = 4 * 1000 * 1000  # この画素数以上の画像だけを帯ごとに縮小する (MAX_FILE_SIZE 以下の24ビットBMPが届く値にする)
+STRIP_HEIGHT = 256  # 1帯あたりの元画像の行数
+
+# 一括リサイズAPI (/api/batch) の設定
+BATCH_WORKERS = os.cpu_count() or 1  # ワーカーごとの一括リサイズ用プロセスプールのプロセス数
+BATCH_MAX_FILES = 200  # 1リクエストで受け付ける画像の最大数 (ZIP内の画像を含む)
+BATCH_MAX_REQUEST_SIZE = 256 * 1024 * 1024  # 一括アップロードのリクエスト全体の最大サイズ
+BATCH_MAX_EXTRACTED_SIZE = 512 * 1024 * 1024  # ZIPを展開した後の合計サイズの上限 (ZIP爆弾対策)
+BATCH_SPOOL_MAX_MEMORY = 1024 * 1024  # 一括アップロードでファイルごとにメモリ上に保持する大きさ (超えた分はディスクに書き出す)
+BATCH_MANIFEST_NAME = 'manifest.json'  # 処理結果の一覧 (ファイルごとのエラーを含む) として返すZIP内のファイル名
+
+# デコード前の受け付け制御の設定 (圧縮後は小さくてもデコードすると巨大になる画像への対策)
+MAX_IMAGE_PIXELS = 50 * 1000 * 1000  # 1枚あたりの画素数の上限 (JPEGは draft() による縮小後の画素数で判定)
+MAX_IMAGE_MEMORY = 512 * 1024 * 1024  # 1枚あたりのデコード・縮小に必要なメモリ (見積もり) の上限
+MEMORY_BUDGET = 1024 * 1024 * 1024  # 全ワーカー (と非同期ジョブ・一括リサイズのプロセス) で同時に使うメモリ (見積もり) の合計の上限
+MEMORY_WAIT_TIMEOUT = 10  # 上限に達している場合に空くまで待つ最大秒数 (超えたら 503 を返す)
+MEMORY_RETRY_AFTER = 2  # メモリの上限で受け付けなかった場合にクライアントへ返す再試行までの秒数
+MAX_ANIMATION_FRAMES = 500  # アニメーション画像 (GIF / WebP) のフレーム数の上限
+MAX_ANIMATION_PIXELS = 200 * 1000 * 1000  # アニメーション画像の全フレームの合計画素数の上限
+
+# 起動時間の計測 (環境変数 IMAGE_RESIZE_STARTUP_TIMING=1 で、ワーカーごとの起動時間と最初のリクエストの処理時間をログに出力する)
+STARTUP_TIMING = os.environ.get('IMAGE_RESIZE_STARTUP_TIMING') == '1'
+
+# メトリクスの設定 (/metrics で Prometheus 形式で出力)
+SLOW_REQUEST_SECONDS = None  # この秒数以上かかったリクエストの段階ごとの処理時間をJSON形式でログに出力する (None の場合は出力しない)
+
+# メトリクスの名前
+METRIC_REQUEST_SECONDS = 'image_resize_request_seconds'
+METRIC_BYTES_IN = 'image_resize_bytes_in_total'
+METRIC_BYTES_OUT = 'image_resize_bytes_out_total'
+METRIC_CACHE_HITS = 'image_resize_cache_hits_total'
+METRIC_CACHE_MISSES = 'image_resize_cache_misses_total'
+METRIC_NEAR_DUPLICATE_HITS = 'image_resize_near_duplicate_hits_total'
+METRIC_STORAGE_BYTES = 'image_resize_storage_bytes'
+METRIC_STORAGE_FILES = 'image_resize_storage_files'
+METRIC_STORAGE_EVICTIONS = 'image_resize_storage_evicted_files_total'
+METRIC_JANITOR_SWEEPS = 'image_resize_janitor_sweeps_total'
+METRIC_JANITOR_SWEEP_SECONDS = 'image_resize_janitor_sweep_duration_seconds'
+METRIC_JANITOR_LAST_SWEEP = 'image_resize_janitor_last_sweep_timestamp_seconds'
 
 # Flaskアプリケーションの初期化
 app = Flask(__name__)
@@ -36,55 +167,846 @@ app.config['MAX_CONTENT_LENGTH'] = MAX_FILE_SIZE
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# 一時ディレクトリの設定
-UPLOAD_FOLDER = tempfile.mkdtemp()
-DOWNLOAD_FOLDER = tempfile.mkdtemp()
+# 一時ディレクトリの作成
+os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+os.makedirs(DOWNLOAD_FOLDER, exist_ok=True)
+
+class SpoolingRequest(Request):
+    """
+    アップロードファイルを UPLOAD_SPOOL_MAX_MEMORY まではメモリ上に保持するリクエストクラス
+
+    一括アップロード (/api/batch) はファイル数が多く、リクエスト全体の上限も大きいため、
+    BATCH_SPOOL_MAX_MEMORY までとします。
+    """
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        max_size = BATCH_SPOOL_MAX_MEMORY if self.endpoint == 'api_batch' else UPLOAD_SPOOL_MAX_MEMORY
+        return tempfile.SpooledTemporaryFile(max_size=max_size, mode='w+b', dir=UPLOAD_FOLDER)
+
+app.request_class = SpoolingRequest
+
+# 読み込み用バッファ (スレッドごとに1つを使い回す)
+_read_buffers = threading.local()
+
+# リサイズ結果キャッシュ
+result_cache = ResultCache(CACHE_FOLDER, CACHE_MAX_BYTES, CACHE_MAX_AGE) if RESULT_CACHE_ENABLED else None
+
+# 知覚ハッシュの索引 (全ワーカーで共有する。キーはアップロードされた画像のハッシュ値)
+phash_index = HashIndex(PHASH_INDEX_PATH) if RESULT_CACHE_ENABLED and NEAR_DUPLICATE_INDEX else None
+
+# 全ワーカー・全プロセスで同時に使うメモリの上限 (予約の一覧はファイルで共有する)
+memory_budget = SharedMemoryBudget(MEMORY_BUDGET, MEMORY_WAIT_TIMEOUT, MEMORY_BUDGET_PATH)
+
+# 非同期ジョブキュー
+job_queue = JobQueue(JOB_FOLDER, JOB_WORKERS, JOB_MAX_PENDING, JOB_TIMEOUT)
+
+# 起動時間の計測結果 (秒): import (モジュールの読み込み)、warmup (事前の初期化)、first_request (最初のリクエスト)
+startup_timings = {}
+
+# ダウンロードファイルの ETag ((パス, 更新日時, サイズ) -> ハッシュ値、古いものから削除する)
+_etag_cache = OrderedDict()
+_etag_cache_lock = threading.Lock()
+
+# 一括リサイズ用プロセスプール (gunicorn のワーカーが fork された後に、最初の一括リサイズで作成する)
+_batch_executor = None
+_batch_executor_lock = threading.Lock()
+# プロセスが異常終了して処理できなかった画像のエラーメッセージ
+BATCH_WORKER_DIED_ERROR = "処理中にワーカープロセスが異常終了しました。"
+
+# メトリクス (プロセスごとに記録し、/metrics で全プロセス分を合計する)
+metrics = Metrics(METRICS_FOLDER)
+metrics.describe(METRIC_STAGE_SECONDS, '処理段階 (receive/decode/resize/encode/write) ごとの処理時間 (秒)')
+metrics.describe(METRIC_REQUEST_SECONDS, 'リクエスト全体の処理時間 (秒)')
+metrics.describe(METRIC_BYTES_IN, '受信した画像のバイト数')
+metrics.describe(METRIC_BYTES_OUT, '出力した画像のバイト数')
+metrics.describe(METRIC_CACHE_HITS, 'リサイズ結果キャッシュのヒット数')
+metrics.describe(METRIC_CACHE_MISSES, 'リサイズ結果キャッシュのミス数')
+metrics.describe(METRIC_NEAR_DUPLICATE_HITS, '似た画像のリサイズ結果を再利用した数')
+metrics.describe(METRIC_REJECTIONS, '受け付けなかったリクエストの数 (理由別)')
+metrics.describe(METRIC_ERRORS, '画像処理エラーの数 (画像形式別)')
+metrics.describe(METRIC_STORAGE_BYTES, '一時ファイルの使用バイト数 (直近の削除処理の時点)')
+metrics.describe(METRIC_STORAGE_FILES, '一時ファイルの数 (直近の削除処理の時点)')
+metrics.describe(METRIC_STORAGE_EVICTIONS, '定期削除で削除した一時ファイルの数')
+metrics.describe(METRIC_JANITOR_SWEEPS, '一時ファイルの定期削除の実行回数')
+metrics.describe(METRIC_JANITOR_SWEEP_SECONDS, '直近の定期削除の所要時間 (秒)')
+metrics.describe(METRIC_JANITOR_LAST_SWEEP, '直近の定期削除の開始時刻 (UNIX時間)')
+
+# リサイズ処理 (処理内容は resize_core.py、設定はこのファイルのグローバル設定を使う)
+resizer = Resizer(FAST_DOWNSCALE, RESIZE_REDUCING_GAP, STRIP_RESIZE, STRIP_RESIZE_MIN_PIXELS, STRIP_HEIGHT,
+                  MAX_IMAGE_PIXELS, MAX_IMAGE_MEMORY, MAX_ANIMATION_FRAMES, MAX_ANIMATION_PIXELS,
+                  memory_budget, metrics)
+
+# 一時ファイルの定期削除 (最初のリクエストでワーカーごとにスレッドを開始する)
+storage_janitor = StorageJanitor(
+    STORAGE_ROOT,
+    [SweepRule('uploads', UPLOAD_FOLDER, UPLOAD_TTL, None),
+     SweepRule('downloads', DOWNLOAD_FOLDER, DOWNLOAD_TTL, DOWNLOAD_MAX_BYTES),
+     SweepRule('jobs', JOB_FOLDER, JOB_TTL, None)],
+    SWEEP_INTERVAL,
+    extra_sweeps=([result_cache.evict] if result_cache is not None else [])
+                 + ([lambda: phash_index.prune(CACHE_MAX_AGE)] if phash_index is not None else []))
+
+@app.before_request
+def start_storage_janitor():
+    """一時ファイルの定期削除スレッドを開始する (開始済みの場合は何もしない)"""
+    storage_janitor.start()
+
+@app.before_request
+def start_request_metrics():
+    """リクエストの処理時間と段階ごとの処理時間の記録を開始する"""
+    g.request_started = time.perf_counter()
+    metrics.begin_request()
+
+@app.after_request
+def record_request_metrics(response):
+    """リクエストの処理時間を記録し、このプロセスのメトリクスをファイルに書き出す"""
+    duration = time.perf_counter() - g.request_started
+    stages = metrics.end_request()
+    metrics.observe(METRIC_REQUEST_SECONDS, duration, endpoint=request.endpoint or 'unknown')
+    if SLOW_REQUEST_SECONDS is not None and duration >= SLOW_REQUEST_SECONDS:
+        logger.warning(json.dumps({'event': 'slow_request',
+                                   'method': request.method,
+                                   'path': request.path,
+                                   'status': response.status_code,
+                                   'duration': round(duration, 4),
+                                   'stages': {stage: round(seconds, 4) for stage, seconds in stages.items()}},
+                                  ensure_ascii=False))
+    metrics.flush()
+    if 'first_request' not in startup_timings:
+        startup_timings['first_request'] = duration
+        if STARTUP_TIMING:
+            logger.info(json.dumps(dict({'event': 'startup', 'pid': os.getpid(), 'path': request.path},
+                                        **{name: round(seconds, 4) for name, seconds in startup_timings.items()})))
+    return response
+
+def warmup():
+    """
+    ワーカーがリクエストを受け付ける前に、最初のリクエストで行われる初期化を済ませる
+
+    画像形式のプラグインの読み込み、各画像形式のデコーダー・エンコーダーの初期化、
+    リサイズ処理 (draft / reduce / LANCZOS) の実行、テンプレートのコンパイルを行います。
+    gunicorn では gunicorn.conf.py の post_worker_init から呼び出します。
+
+    Returns:
+        dict: 段階ごとの処理時間 (秒)
+    """
+    timings = {}
+    started = time.perf_counter()
+    Image.init()
+    timings['plugins'] = time.perf_counter() - started
+
+    # 受け付ける形式と出力できる形式を、小さな画像でエンコード・デコードしておく
+    # (save_image はエンコードの統計に記録されるため使わない)
+    started = time.perf_counter()
+    sample = Image.linear_gradient('L').convert('RGB')
+    formats = {format_for_ext(f".{ext}") for ext in ALLOWED_EXTENSIONS}
+    formats.update(OUTPUT_FORMATS[name][0] for name in available_output_formats())
+    for output_format in sorted(f for f in formats if f):
+        buffer = io.BytesIO()
+        try:
+            convert_for_format(sample, output_format).save(buffer, format=output_format, **encoder_params(output_format))
+            buffer.seek(0)
+            with Image.open(buffer) as img:
+                img.draft('RGB', (img.width // 2, img.height // 2))
+                img.load()
+        except Exception as e:
+            logger.error(f"ウォームアップエラー ({output_format}): {str(e)}")
+    timings['codecs'] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    sample.resize((64, 64), Image.LANCZOS, reducing_gap=RESIZE_REDUCING_GAP)
+    sample.resize((100, 100), Image.LANCZOS)
+    timings['resize'] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    for template in ('index.html', 'result.html'):
+        app.jinja_env.get_template(template)
+    timings['templates'] = time.perf_counter() - started
+
+    storage_janitor.start()
+    startup_timings['warmup'] = sum(timings.values())
+    return timings
+
+def _reject(reason):
+    """受け付けなかったリクエストを理由別に数える"""
+    metrics.inc(METRIC_REJECTIONS, reason=reason)
+
+def _record_upload_received(file, file_ext):
+    """アップロードの受信 (ハッシュ計算・保存を含む) にかかった時間と受信バイト数を記録する"""
+    label = format_label(file_ext)
+    metrics.observe(METRIC_STAGE_SECONDS, time.perf_counter() - g.request_started, stage='receive', format=label)
+    position = file.stream.tell()
+    metrics.inc(METRIC_BYTES_IN, file.stream.seek(0, os.SEEK_END), format=label)
+    file.stream.seek(position)
 
 def allowed_file(filename):
     """アップロードされたファイルが許可された拡張子かチェック"""
     return '.' in filename and \
            filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-def resize_image(input_path, output_path, max_width):
+def _read_buffer():
+    """このスレッドの読み込み用バッファを返す (リクエストごとに確保しない)"""
+    buffer = getattr(_read_buffers, 'buffer', None)
+    if buffer is None:
+        buffer = _read_buffers.buffer = bytearray(HASH_CHUNK_SIZE)
+    return buffer
+
+def _iter_chunks(stream):
+    """ストリームを先頭から読み込み、使い回しのバッファ上のデータを順に返す"""
+    buffer = _read_buffer()
+    view = memoryview(buffer)
+    stream.seek(0)
+    while True:
+        size = stream.readinto(buffer)
+        if not size:
+            break
+        yield view[:size]
+
+def hash_upload(stream):
+    """
+    受信済みのアップロードデータのハッシュ値を計算する
+
+    読み込み後はストリームを先頭に戻すため、そのままデコードに使えます。
+
+    Returns:
+        str: ファイル内容のハッシュ値 (16進文字列)
+    """
+    hasher = new_hasher()
+    for chunk in _iter_chunks(stream):
+        hasher.update(chunk)
+    stream.seek(0)
+    return hasher.hexdigest()
+
+def save_upload(file, input_path):
+    """
+    アップロードされたファイルを保存しながらハッシュ値を計算する
+
+    Returns:
+        str: ファイル内容のハッシュ値 (16進文字列)
+    """
+    return save_stream(file.stream, input_path)
+
+def save_stream(stream, input_path):
+    """
+    ストリーム (アップロードデータやZIP内のファイル) を保存しながらハッシュ値を計算する
+
+    Returns:
+        str: ファイル内容のハッシュ値 (16進文字列)
+    """
+    hasher = new_hasher()
+    with open(input_path, 'wb') as f:
+        for chunk in _iter_chunks(stream):
+            hasher.update(chunk)
+            f.write(chunk)
+    return hasher.hexdigest()
+
+def file_etag(path, stat=None):
+    """
+    ファイルの内容のハッシュ値 (強い ETag に使う) を返す
+
+    パス・更新日時・サイズが同じ間は、計算済みのハッシュ値を使います。
+    """
+    stat = stat or os.stat(path)
+    key = (path, stat.st_mtime_ns, stat.st_size)
+    with _etag_cache_lock:
+        etag = _etag_cache.get(key)
+        if etag is not None:
+            _etag_cache.move_to_end(key)
+            return etag
+
+    hasher = new_hasher()
+    with open(path, 'rb') as f:
+        for chunk in _iter_chunks(f):
+            hasher.update(chunk)
+    etag = hasher.hexdigest()
+    with _etag_cache_lock:
+        _etag_cache[key] = etag
+        while len(_etag_cache) > ETAG_CACHE_SIZE:
+            _etag_cache.popitem(last=False)
+    return etag
+
+def _cache_params(max_width, file_ext, options=None):
+    """出力結果に影響するリサイズ条件 (キャッシュキーの一部)"""
+    options = options or {}
+    params = {'width': max_width,
+              'ext': file_ext.lower(),
+              'encoder': encoder_params(format_for_ext(file_ext), options.get('preset', DEFAULT_PRESET),
+                                        options.get('encoder_options')),
+              'exact': not FAST_DOWNSCALE}
+    params.update(options)
+    return params
+
+def lookup_cached_rendition(content_hash, max_width, file_ext, options=None, record=True):
+    """
+    キャッシュ済みの画像を検索する
+
+    Args:
+        record: False の場合はヒット・ミスをメトリクスに記録しない (似た画像の検索に使う場合)
+
+    Returns:
+        tuple: ヒットした場合は (キャッシュ内の画像ファイルのパス, メタデータ)、ミスの場合は None
+    """
+    if result_cache is None:
+        return None
+    key = make_cache_key(content_hash, **_cache_params(max_width, file_ext, options))
+    cached = result_cache.get(key, file_ext.lower())
+    if record:
+        metrics.inc(METRIC_CACHE_HITS if cached is not None else METRIC_CACHE_MISSES)
+    return cached
+
+def fetch_cached_rendition(content_hash, max_width, file_ext, output_path, options=None):
+    """
+    キャッシュ済みの画像があれば、デコードせずに出力先へリンクする
+
+    リンクした出力先の更新時刻はキャッシュに登録した時点のままですが、一時ファイルの定期削除は
+    リンクを作成した時刻 (ctime) から DOWNLOAD_TTL を数えます。
+
+    Returns:
+        dict: ヒットした場合はメタデータ (original_size, new_size, message)、ミスの場合は None
+    """
+    cached = lookup_cached_rendition(content_hash, max_width, file_ext, options)
+    if cached is None:
+        return None
+    cached_path, meta = cached
+    try:
+        link_or_copy(cached_path, output_path)
+    except OSError:
+        # 他のワーカーによって削除された場合はミスとして扱う
+        return None
+    return meta
+
+def store_cached_rendition(content_hash, max_width, file_ext, output_path, original_size, new_size, message, options=None,
+                           quality=None):
+    """生成した画像をキャッシュに登録する"""
+    if result_cache is None:
+        return
+    key = make_cache_key(content_hash, **_cache_params(max_width, file_ext, options))
+    result_cache.put(key, file_ext.lower(), output_path,
+                     {'original_size': list(original_size),
+                      'new_size': list(new_size),
+                      'message': message,
+                      'quality': quality})
+
+def record_perceptual_hash(content_hash, value, original_size):
+    """リサイズした画像の知覚ハッシュを索引に記録する (似た画像の検索に使う)"""
+    if phash_index is None or value is None:
+        return
+    try:
+        phash_index.add(content_hash, value, original_size)
+    except sqlite3.Error as e:
+        logger.error(f"知覚ハッシュの記録エラー: {str(e)}")
+
+def touch_perceptual_hash(content_hash):
+    """キャッシュにヒットした画像の知覚ハッシュの最後に使った時刻を更新する (使われている画像を索引の定期削除で消さないように)"""
+    if phash_index is None:
+        return
+    try:
+        phash_index.touch(content_hash)
+    except sqlite3.Error as e:
+        logger.error(f"知覚ハッシュの更新エラー: {str(e)}")
+
+def find_near_duplicates(input_file, content_hash):
+    """
+    索引から似た画像を検索する (NEAR_DUPLICATE_REUSE が有効な場合のみ)
+
+    Args:
+        input_file: 入力画像ファイルのパス、またはファイルオブジェクト
+        content_hash: 入力画像ファイルのハッシュ値 (同じ画像は結果から除く)
+
+    Returns:
+        list: 似た画像のハッシュ値のリスト (似ている順)
+    """
+    if phash_index is None or not NEAR_DUPLICATE_REUSE:
+        return []
+    try:
+        value, size = file_dhash(input_file, NEAR_DUPLICATE_MAX_DECODE_PIXELS)
+        if value is None or bin(value).count('1') < NEAR_DUPLICATE_MIN_BITS:
+            return []
+        matches = phash_index.find(value, NEAR_DUPLICATE_THRESHOLD, exclude_key=content_hash)
+    except (OSError, sqlite3.Error, Image.DecompressionBombError) as e:
+        logger.error(f"似た画像の検索エラー: {str(e)}")
+        return []
+    return [key for _, key, match_size in matches if similar_aspect(size, match_size, NEAR_DUPLICATE_ASPECT_TOLERANCE)]
+
+def lookup_near_duplicate_renditions(input_file, content_hash, max_widths, file_ext, options=None):
+    """
+    似た画像のリサイズ結果をキャッシュから検索する
+
+    横幅ごとに別の画像の結果が混ざらないよう、全ての横幅がキャッシュにある画像だけを使います。
+
+    Returns:
+        list: 見つかった場合は max_widths と同じ順の (キャッシュ内の画像ファイルのパス, メタデータ) のリスト、
+              見つからない場合は None
+    """
+    for similar_hash in find_near_duplicates(input_file, content_hash):
+        cached = [lookup_cached_rendition(similar_hash, max_width, file_ext, options, record=False)
+                  for max_width in max_widths]
+        if all(c is not None for c in cached):
+            metrics.inc(METRIC_NEAR_DUPLICATE_HITS)
+            touch_perceptual_hash(similar_hash)
+            return cached
+    return None
+
+def resize_image_multi(input_path, targets, exact=None, output_format=None, rotate=0, rotate_method=METHOD_LOSSLESS,
+                       preset=DEFAULT_PRESET, encoder_options=None, max_bytes=None):
+    """
+    1回のデコードで複数の横幅の画像を生成する関数
+
+    処理内容は resize_core.Resizer.resize_multi を参照してください。
+    このサービスの設定 (高速縮小・帯ごとの縮小・受け付けの上限)、全ワーカーで共有するメモリの上限、
+    メトリクスを使います。
+
+    Returns:
+        tuple: (成功フラグ, メッセージ, 元のサイズ, 横幅ごとの結果のリスト)
+
+    Raises:
+        ImageTooLargeError: 画素数、または必要なメモリが1枚あたりの上限を超えている場合
+        MemoryBudgetExceeded: 全プロセスのメモリの上限に達しており、MEMORY_WAIT_TIMEOUT 秒待っても空かなかった場合
+    """
+    success, message, original_size, renditions = resizer.resize_multi(
+        input_path, targets, exact, output_format, rotate, rotate_method, preset, encoder_options, max_bytes)
+    if not success:
+        logger.error(f"画像リサイズエラー: {message}")
+    return success, message, original_size, renditions
+
+def resize_image(input_path, output_path, max_width, exact=None, output_format=None,
+                 preset=DEFAULT_PRESET, encoder_options=None, max_bytes=None):
     """
     画像をリサイズする関数
     
     Args:
-        input_path: 入力画像ファイルのパス
-        output_path: 出力画像ファイルのパス
+        input_path: 入力画像ファイルのパス、またはファイルオブジェクト
+        output_path: 出力画像ファイルのパス、またはファイルオブジェクト
         max_width: リサイズ後の最大横幅
+        exact: True の場合は高速縮小を行わず従来の厳密なリサイズを行う
+               (None の場合は FAST_DOWNSCALE の設定に従う)
+        output_format: 出力する画像形式 (例: 'JPEG')。省略時は出力先の拡張子から判定します
+        preset: エンコーダーのプリセット名 ('fast' / 'balanced' / 'smallest')
+        encoder_options: プリセットに追加する保存設定 (例: {'progressive': True})
+        max_bytes: 目標ファイルサイズ (バイト)。使用した品質はメッセージに含めます
     
     Returns:
         tuple: (成功フラグ, メッセージ, 元のサイズ, 新しいサイズ)
     """
+    success, message, original_size, renditions = resize_image_multi(
+        input_path, [(max_width, output_path)], exact=exact, output_format=output_format,
+        preset=preset, encoder_options=encoder_options, max_bytes=max_bytes)
+    if not success:
+        return False, message, None, None
+    rendition = renditions[0]
+    return True, rendition['message'], original_size, rendition['new_size']
+
+def create_zip(zip_path, entries):
+    """
+    複数の出力画像を1つのZIPファイルにまとめる
+
+    画像は既に圧縮されているため、無圧縮 (ZIP_STORED) で格納します。
+
+    Args:
+        zip_path: 作成するZIPファイルのパス
+        entries: (ZIP内のファイル名, 画像ファイルのパス) のリスト
+    """
+    with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_STORED) as zf:
+        for arcname, path in entries:
+            zf.write(path, arcname)
+
+def process_upload(input_file, content_hash, base_name, file_ext, max_widths, options=None, create_archive=True):
+    """
+    受信済みのアップロードファイルから、指定された全ての横幅の画像を生成する
+
+    キャッシュ済みの横幅はデコードせずにキャッシュから取り出し、
+    残りの横幅は1回のデコードでまとめて生成します。
+    非同期ジョブとしてプロセスプールからも呼び出されます。
+
+    Args:
+        input_file: 入力画像ファイルのパス、またはファイルオブジェクト
+        content_hash: 入力画像ファイルのハッシュ値
+        base_name: 元のファイル名 (拡張子なし)
+        file_ext: 出力ファイルの拡張子 (出力形式を変換しない場合は元のファイルの拡張子)
+        max_widths: リサイズ後の最大横幅のリスト
+        options: resize_image_multi に渡すキーワード引数 (回転・プリセットなど)
+        create_archive: False の場合は複数の横幅でもまとめてダウンロードするZIPを作成しない
+
+    Returns:
+        tuple: (成功フラグ, メッセージ, 元のサイズ, 横幅ごとの結果のリスト, ZIPのダウンロードID)
+    """
+    # キャッシュ済みの横幅はデコードせずにそのまま使う
+    targets = []
+    output_filenames = {}
+    renditions = {}
+    original_size = None
+    for max_width in max_widths:
+        output_filename = f"{base_name}_{max_width}px{file_ext}"
+        output_path = os.path.join(DOWNLOAD_FOLDER, f"{uuid.uuid4().hex}_{output_filename}")
+        output_filenames[output_path] = output_filename
+        meta = fetch_cached_rendition(content_hash, max_width, file_ext, output_path, options)
+        if meta is not None:
+            original_size = tuple(meta['original_size'])
+            renditions[max_width] = {'max_width': max_width,
+                                     'output_path': output_path,
+                                     'new_size': tuple(meta['new_size']),
+                                     'message': meta['message'],
+                                     'quality': meta.get('quality')}
+        else:
+            targets.append((max_width, output_path))
+    if renditions:
+        touch_perceptual_hash(content_hash)
+
+    # 残りの横幅は、似た画像 (保存し直し・圧縮し直しなど) のリサイズ結果がキャッシュにあれば再利用する
+    # (別の画像の結果のため、この画像のハッシュ値ではキャッシュに登録しない)
+    similar = lookup_near_duplicate_renditions(input_file, content_hash, [w for w, _ in targets], file_ext, options) if targets else None
+    if similar:
+        linked = []
+        try:
+            for (_, output_path), (cached_path, _) in zip(targets, similar):
+                link_or_copy(cached_path, output_path)
+                linked.append(output_path)
+        except OSError:
+            # 他のワーカーによって削除された場合はリサイズする。リンク済みの出力先はキャッシュと同じファイルのため、
+            # 上書きしないよう先に削除しておく (リサイズ結果は新しいファイルに書き込まれる)
+            for output_path in linked:
+                os.remove(output_path)
+            similar = None
+    if similar:
+        for (max_width, output_path), (_, meta) in zip(targets, similar):
+            original_size = tuple(meta['original_size'])
+            renditions[max_width] = {'max_width': max_width,
+                                     'output_path': output_path,
+                                     'new_size': tuple(meta['new_size']),
+                                     'message': f"{meta['message']} (よく似た画像のリサイズ結果を再利用しました)",
+                                     'quality': meta.get('quality')}
+        targets = []
+
+    # リサイズ処理 (1回のデコードで残りの横幅を全て生成)
+    success, message = True, "リサイズが完了しました。"
+    if targets:
+        success, message, original_size, resized = resize_image_multi(input_file, targets, **(options or {}))
+        for r in resized:
+            renditions[r['max_width']] = r
+            store_cached_rendition(content_hash, r['max_width'], file_ext, r['output_path'],
+                                   original_size, r['new_size'], r['message'], options, r['quality'])
+        if resized:
+            record_perceptual_hash(content_hash, resized[0]['dhash'], original_size)
+
+    if not success:
+        return False, message, None, [], None
+
+    for r in renditions.values():
+        metrics.inc(METRIC_BYTES_OUT, os.path.getsize(r['output_path']), format=format_label(file_ext))
+
+    results = [{'message': r['message'],
+                'max_width': r['max_width'],
+                'output_filename': output_filenames[r['output_path']],
+                'new_size': r['new_size'],
+                'quality': r['quality'],
+                'download_id': os.path.basename(r['output_path'])}
+               for r in (renditions[max_width] for max_width in max_widths)]
+
+    # 複数の横幅の場合はまとめてダウンロードできるZIPも作成
+    zip_download_id = None
+    if create_archive and len(results) > 1:
+        zip_path = os.path.join(DOWNLOAD_FOLDER, f"{uuid.uuid4().hex}_{base_name}.zip")
+        create_zip(zip_path, [(r['output_filename'], os.path.join(DOWNLOAD_FOLDER, r['download_id']))
+                              for r in results])
+        zip_download_id = os.path.basename(zip_path)
+
+    return True, message, original_size, results, zip_download_id
+
+def run_upload_job(input_path, content_hash, base_name, file_ext, max_widths, options=None):
+    """非同期ジョブとして process_upload を実行し、入力ファイルを削除する"""
+    try:
+        success, message, original_size, results, zip_download_id = process_upload(
+            input_path, content_hash, base_name, file_ext, max_widths, options)
+        if not success:
+            raise RuntimeError(message)
+        return {'message': results[0]['message'] if len(results) == 1 else message,
+                'original_size': original_size,
+                'results': results,
+                'zip_download_id': zip_download_id}
+    finally:
+        if os.path.exists(input_path):
+            os.remove(input_path)
+        # プロセスプール側で記録したメトリクスを書き出す
+        metrics.flush()
+
+def run_batch_item(input_path, content_hash, base_name, file_ext, max_widths, options=None):
+    """
+    一括リサイズの1枚分をプロセスプールで実行し、入力ファイルを削除する
+
+    Returns:
+        list: 横幅ごとの結果 (process_upload と同じ形式) のリスト
+
+    Raises:
+        RuntimeError: リサイズに失敗した場合 (受け付けなかった場合は AdmissionError)
+    """
     try:
-        with Image.open(input_path) as img:
-            original_width, original_height = img.size
-            
-            # 既に指定幅以下の場合はリサイズしない
-            if original_width <= max_width:
-                # 元の画像をそのままコピー
-                img.save(output_path, quality=95, optimize=True)
-                return True, f"横幅は既に{max_width}px以下です。", (original_width, original_height), (original_width, original_height)
-            
-            # アスペクト比を維持してリサイズ
-            new_width = max_width
-            new_height = int(original_height * max_width / original_width)
-            
-            # リサイズ実行
-            resized_img = img.resize((new_width, new_height), Image.LANCZOS)
-            
-            # 保存時の品質設定
-            if output_path.lower().endswith(('.jpg', '.jpeg')):
-                resized_img.save(output_path, quality=95, optimize=True)
-            else:
-                resized_img.save(output_path)
-            
-            return True, "リサイズが完了しました。", (original_width, original_height), (new_width, new_height)
-            
-    except Exception as e:
-        logger.error(f"画像リサイズエラー: {str(e)}")
-        return False, f"画像処理中にエラーが発生しました: {str(e)}", None, None
+        success, message, _, results, _ = process_upload(input_path, content_hash, base_name, file_ext, max_widths, options,
+                                                         create_archive=False)
+        if not success:
+            raise RuntimeError(message)
+        return results
+    finally:
+        if os.path.exists(input_path):
+            os.remove(input_path)
+        metrics.flush()
+
+def _get_batch_executor():
+    global _batch_executor
+    with _batch_executor_lock:
+        if _batch_executor is None:
+            _batch_executor = ProcessPoolExecutor(max_workers=BATCH_WORKERS)
+        return _batch_executor
+
+def _discard_batch_executor(executor):
+    """
+    壊れたプロセスプールを破棄する (次の一括リサイズで作り直す)
+
+    作り直した後のプロセスプールは破棄しないよう、現在のプロセスプールと同じ場合だけ破棄します。
+    """
+    global _batch_executor
+    with _batch_executor_lock:
+        if _batch_executor is not executor:
+            return
+        _batch_executor = None
+    logger.error("一括リサイズのプロセスが異常終了したため、プロセスプールを作り直します")
+    executor.shutdown(wait=False)
+
+def _submit_batch_item(item, max_widths, output_ext=None, options=None):
+    """
+    一括リサイズの入力画像1枚をプロセスプールに投入する
+
+    プロセスプールが壊れていた場合は作り直して1回だけ再投入します。
+
+    Returns:
+        tuple: (投入したプロセスプール, Future)
+
+    Raises:
+        BrokenProcessPool: 作り直したプロセスプールにも投入できなかった場合
+    """
+    args = (run_batch_item, item['input_path'], item['content_hash'], item['base_name'],
+            output_ext or item['file_ext'], max_widths, options)
+    executor = _get_batch_executor()
+    try:
+        return executor, executor.submit(*args)
+    except BrokenProcessPool:
+        _discard_batch_executor(executor)
+    executor = _get_batch_executor()
+    return executor, executor.submit(*args)
+
+def _add_batch_input(inputs, stream, name, folder=''):
+    """
+    一括リサイズの入力画像を UPLOAD_FOLDER に保存して inputs に追加する
+
+    Raises:
+        ValueError: 画像の数が BATCH_MAX_FILES を超えた場合
+    """
+    if len(inputs) >= BATCH_MAX_FILES:
+        raise ValueError(f"一度にリサイズできる画像は{BATCH_MAX_FILES}枚までです。")
+    base_name, file_ext = os.path.splitext(secure_filename(name))
+    input_path = os.path.join(UPLOAD_FOLDER, f"{uuid.uuid4().hex}{file_ext}")
+    item = {'source': posixpath.join(folder, name), 'folder': folder, 'input_path': input_path,
+            'base_name': base_name, 'file_ext': file_ext}
+    # 保存に失敗した場合も呼び出し元で削除できるよう、保存前に追加する
+    inputs.append(item)
+    item['content_hash'] = save_stream(stream, input_path)
+
+def _file_too_large_error(source):
+    """一括リサイズで MAX_FILE_SIZE を超えたファイルのエラー"""
+    return {'source': source, 'status': 'error',
+            'error': f"ファイルサイズが大きすぎます (上限{MAX_FILE_SIZE / (1024 * 1024):.0f}MB)。"}
+
+def collect_batch_inputs(files):
+    """
+    一括リサイズのアップロード (画像ファイル、またはZIPファイル) から入力画像を取り出して保存する
+
+    ZIPファイルは中の画像 (許可された拡張子のもの) をフォルダ構成を保ったまま取り出します。
+    展開後のサイズはZIPのヘッダーで確認してから取り出します。
+    画像ファイル・ZIP内の画像とも、MAX_FILE_SIZE を超えるものはエラーとして扱います。
+
+    Returns:
+        tuple: (入力画像のリスト, 取り出せなかったファイルのエラーのリスト)
+
+    Raises:
+        ValueError: 画像の数や展開後のサイズが上限を超えた場合 (保存済みの入力画像は削除します)
+    """
+    inputs, errors = [], []
+    try:
+        for file in files:
+            file_ext = os.path.splitext(file.filename)[1].lower()
+            if file_ext != '.zip':
+                if not allowed_file(file.filename):
+                    errors.append({'source': file.filename, 'status': 'error', 'error': '許可されていないファイル形式です。'})
+                elif file.stream.seek(0, os.SEEK_END) > MAX_FILE_SIZE:
+                    errors.append(_file_too_large_error(file.filename))
+                else:
+                    _add_batch_input(inputs, file.stream, file.filename)
+                _record_upload_received(file, file_ext)
+                continue
+
+            _record_upload_received(file, file_ext)
+            try:
+                archive = zipfile.ZipFile(file.stream)
+            except zipfile.BadZipFile as e:
+                errors.append({'source': file.filename, 'status': 'error', 'error': f"ZIPファイルを読み込めません: {str(e)}"})
+                continue
+            with archive:
+                members = [info for info in archive.infolist() if not info.is_dir() and allowed_file(info.filename)]
+                if sum(info.file_size for info in members) > BATCH_MAX_EXTRACTED_SIZE:
+                    raise ValueError(f"ZIPファイルの展開後のサイズが大きすぎます"
+                                     f" (上限{BATCH_MAX_EXTRACTED_SIZE / (1024 * 1024):.0f}MB)。")
+                for info in members:
+                    parts = [secure_filename(part) for part in info.filename.split('/')]
+                    if info.file_size > MAX_FILE_SIZE:
+                        errors.append(_file_too_large_error(info.filename))
+                        continue
+                    with archive.open(info) as stream:
+                        _add_batch_input(inputs, stream, parts[-1], '/'.join(part for part in parts[:-1] if part))
+    except Exception:
+        for item in inputs:
+            if os.path.exists(item['input_path']):
+                os.remove(item['input_path'])
+        raise
+    return inputs, errors
+
+def _remove_batch_outputs(results):
+    """一括リサイズの出力画像 (DOWNLOAD_FOLDER に生成されたもの) を削除する"""
+    for r in results:
+        path = os.path.join(DOWNLOAD_FOLDER, r['download_id'])
+        if os.path.exists(path):
+            os.remove(path)
+
+def _discard_unstreamed_outputs(future):
+    """ZIPに書き出さなかった (クライアントが切断した) 一括リサイズの出力画像を削除する (書き出し済みのものは何もしない)"""
+    if not future.cancelled() and future.exception() is None:
+        _remove_batch_outputs(future.result())
+
+def iter_batch_zip(inputs, errors, max_widths, output_ext=None, options=None):
+    """
+    入力画像をプロセスプールで並列にリサイズし、終わったものから順にZIPファイルとして書き出す
+
+    最後に、ファイルごとの結果とエラーの一覧 (BATCH_MANIFEST_NAME) を追加します。
+    出力画像はZIPに書き出したら DOWNLOAD_FOLDER から削除します (ダウンロード用ファイルの上限を使わないため)。
+    クライアントが途中で切断した場合は、まだ始まっていない処理を取り消し、
+    書き出さなかった出力画像は処理が終わり次第削除します。
+    プロセスが異常終了した場合 (BrokenProcessPool) は、影響を受けた画像をエラーとして一覧に記録し、
+    プロセスプールを作り直します。
+
+    Yields:
+        bytes: ZIPファイルのデータ
+    """
+    started = time.perf_counter()
+    manifest = list(errors)
+    futures = {}
+    executors = {}
+    for item in inputs:
+        try:
+            executor, future = _submit_batch_item(item, max_widths, output_ext, options)
+        except BrokenProcessPool as e:
+            logger.error(f"一括リサイズエラー ({item['source']}): {str(e)}")
+            manifest.append({'source': item['source'], 'status': 'error', 'error': BATCH_WORKER_DIED_ERROR})
+            if os.path.exists(item['input_path']):
+                os.remove(item['input_path'])
+            continue
+        futures[future] = item
+        executors[future] = executor
+    used_names = set()
+
+    def entries():
+        try:
+            for future in as_completed(futures):
+                item = futures[future]
+                try:
+                    results = future.result()
+                except BrokenProcessPool as e:
+                    # ワーカープロセスが異常終了した (メモリ不足で強制終了された場合など)
+                    logger.error(f"一括リサイズエラー ({item['source']}): {str(e)}")
+                    manifest.append({'source': item['source'], 'status': 'error', 'error': BATCH_WORKER_DIED_ERROR})
+                    _discard_batch_executor(executors[future])
+                    if os.path.exists(item['input_path']):
+                        os.remove(item['input_path'])
+                    continue
+                except Exception as e:
+                    logger.error(f"一括リサイズエラー ({item['source']}): {str(e)}")
+                    manifest.append({'source': item['source'], 'status': 'error', 'error': str(e)})
+                    continue
+                outputs = []
+                for r in results:
+                    arcname = posixpath.join(item['folder'], r['output_filename'])
+                    # 同じ名前のファイルが複数ある場合は番号を付ける
+                    base, ext = posixpath.splitext(arcname)
+                    number = 2
+                    while arcname in used_names:
+                        arcname = f"{base}_{number}{ext}"
+                        number += 1
+                    used_names.add(arcname)
+                    outputs.append({'filename': arcname, 'max_width': r['max_width'],
+                                    'new_size': r['new_size'], 'message': r['message']})
+                    try:
+                        yield arcname, os.path.join(DOWNLOAD_FOLDER, r['download_id'])
+                    finally:
+                        # iter_zip は次の要素を取り出す前に書き出しを終えている
+                        _remove_batch_outputs([r])
+                manifest.append({'source': item['source'], 'status': 'ok', 'outputs': outputs})
+
+            summary = {'processed': sum(1 for entry in manifest if entry['status'] == 'ok'),
+                       'errors': sum(1 for entry in manifest if entry['status'] == 'error'),
+                       'elapsed': round(time.perf_counter() - started, 3),
+                       'files': manifest}
+            yield BATCH_MANIFEST_NAME, json.dumps(summary, ensure_ascii=False, indent=2).encode('utf-8')
+        finally:
+            for future, item in futures.items():
+                if future.cancel():
+                    if os.path.exists(item['input_path']):
+                        os.remove(item['input_path'])
+                else:
+                    # 書き出さなかった出力画像を削除する (実行中のものは終わった時点、終わっている場合はすぐに呼び出される)
+                    future.add_done_callback(_discard_unstreamed_outputs)
+
+    return iter_zip(entries())
+
+def _negotiate_output_format():
+    """Accept ヘッダーから出力形式を選ぶ (AUTO_OUTPUT_FORMATS のどれにも対応していない場合は元の形式)"""
+    # */* ではなく、形式を明示して受け入れているものだけを対象にする
+    accepted = {mimetype for mimetype, quality in request.accept_mimetypes if quality > 0}
+    available = available_output_formats()
+    for name in AUTO_OUTPUT_FORMATS:
+        if name in available and Image.MIME.get(OUTPUT_FORMATS[name][0]) in accepted:
+            return name
+    return FORMAT_ORIGINAL
+
+def parse_encoding_options(form):
+    """
+    フォームの出力形式 (format)、プリセット (preset)、目標ファイルサイズ (max_bytes または max_kb) を解釈する
+
+    Returns:
+        tuple: (出力ファイルの拡張子 (元の形式のままの場合は None),
+                resize_image_multi に渡すキーワード引数,
+                出力形式を Accept ヘッダーから選んだかどうか)
+
+    Raises:
+        ValueError: 不明な出力形式・プリセット、または不正な目標ファイルサイズが指定された場合
+    """
+    format_name = form.get('format', DEFAULT_OUTPUT_FORMAT)
+    preset = form.get('preset', DEFAULT_PRESET)
+    if preset not in ENCODER_PRESETS:
+        raise ValueError(f"不明なプリセットです: {preset}")
+    negotiated = format_name == FORMAT_AUTO
+    if negotiated:
+        format_name = _negotiate_output_format()
+
+    options = {'preset': preset} if preset != DEFAULT_PRESET else {}
+    max_bytes = form.get('max_bytes') or form.get('max_kb')
+    if max_bytes:
+        if not max_bytes.isdigit() or int(max_bytes) <= 0:
+            raise ValueError("目標ファイルサイズには正の整数を指定してください。")
+        options['max_bytes'] = int(max_bytes) * (1 if form.get('max_bytes') else 1024)
+    info = output_format_info(format_name)
+    if info is None:
+        return None, options, negotiated
+    _, output_ext, extra_params = info
+    if extra_params:
+        options['encoder_options'] = extra_params
+    return output_ext, options, negotiated
 
 @app.route('/')
 def index():
@@ -92,82 +1014,385 @@ def index():
     return render_template('index.html', 
                          app_title=APP_TITLE, 
                          version=VERSION, 
-                         default_widths=DEFAULT_WIDTHS)
+                         default_widths=DEFAULT_WIDTHS,
+                         rotations=ROTATIONS,
+                         output_formats=[FORMAT_ORIGINAL, FORMAT_AUTO] + available_output_formats(),
+                         output_format_labels=OUTPUT_FORMAT_LABELS,
+                         default_output_format=DEFAULT_OUTPUT_FORMAT,
+                         presets=list(ENCODER_PRESETS),
+                         preset_labels=PRESET_LABELS,
+                         default_preset=DEFAULT_PRESET)
 
 @app.route('/upload', methods=['POST'])
 def upload_file():
     """ファイルアップロードとリサイズ処理"""
     if 'file' not in request.files:
+        _reject('invalid_request')
         flash('ファイルが選択されていません。')
         return redirect(url_for('index'))
     
     file = request.files['file']
-    width = request.form.get('width')
+    widths = request.form.getlist('width')
     
     if file.filename == '':
+        _reject('invalid_request')
         flash('ファイルが選択されていません。')
         return redirect(url_for('index'))
     
-    if not width or not width.isdigit():
+    if not widths or not all(width.isdigit() and int(width) > 0 for width in widths):
+        _reject('invalid_request')
         flash('有効な横幅を選択してください。')
         return redirect(url_for('index'))
     
-    max_width = int(width)
+    # 重複を除いて指定順を保つ
+    max_widths = list(dict.fromkeys(int(width) for width in widths))
+    
+    rotate = request.form.get('rotate', '0')
+    rotate_method = request.form.get('rotate_method', METHOD_LOSSLESS)
+    if not rotate.isdigit() or int(rotate) not in ROTATIONS or rotate_method not in ROTATE_METHODS:
+        _reject('invalid_request')
+        flash('有効な回転方法を選択してください。')
+        return redirect(url_for('index'))
+    options = {'rotate': int(rotate), 'rotate_method': rotate_method} if int(rotate) else {}
     
+    try:
+        output_ext, encoding_options, _ = parse_encoding_options(request.form)
+    except ValueError as e:
+        _reject('invalid_request')
+        flash(str(e))
+        return redirect(url_for('index'))
+    options.update(encoding_options)
+    
+    input_path = None
     if file and allowed_file(file.filename):
         try:
             # 安全なファイル名を生成
             original_filename = secure_filename(file.filename)
-            file_ext = os.path.splitext(original_filename)[1]
+            base_name, file_ext = os.path.splitext(original_filename)
             unique_filename = f"{uuid.uuid4().hex}{file_ext}"
+            output_ext = output_ext or file_ext
             
-            # 一時ファイルとして保存
-            input_path = os.path.join(UPLOAD_FOLDER, unique_filename)
-            file.save(input_path)
+            is_async = request.values.get('mode') == 'async'
+            if UPLOAD_STREAMING and not is_async:
+                # 受信したデータ (メモリ上、または大きい場合はスプールファイル) から直接デコードする
+                content_hash = hash_upload(file.stream)
+                input_file = file.stream
+            else:
+                # 一時ファイルとして保存 (保存しながらハッシュ値を計算)
+                # 非同期ジョブではプロセス間で受け渡すためファイルに保存する
+                input_path = os.path.join(UPLOAD_FOLDER, unique_filename)
+                content_hash = save_upload(file, input_path)
+                input_file = input_path
+            _record_upload_received(file, file_ext)
             
-            # リサイズ処理
-            output_filename = f"{os.path.splitext(original_filename)[0]}_{max_width}px{file_ext}"
-            output_path = os.path.join(DOWNLOAD_FOLDER, f"{uuid.uuid4().hex}_{output_filename}")
+            if is_async:
+                # プロセスプールにジョブを投入し、ジョブIDをすぐに返す
+                try:
+                    job_id = job_queue.submit(run_upload_job, input_path, content_hash, base_name, output_ext, max_widths, options,
+                                              info={'original_filename': original_filename})
+                except QueueFullError:
+                    _reject('queue_full')
+                    response = jsonify({'error': '混み合っています。しばらくしてから再度お試しください。'})
+                    response.status_code = 503
+                    response.headers['Retry-After'] = str(JOB_RETRY_AFTER)
+                    return response
+                # 入力ファイルの削除はジョブ側で行う
+                input_path = None
+                return jsonify({'job_id': job_id,
+                                'status_url': url_for('job_status', job_id=job_id),
+                                'result_url': url_for('job_result', job_id=job_id)}), 202
             
-            success, message, original_size, new_size = resize_image(input_path, output_path, max_width)
+            success, message, original_size, results, zip_download_id = process_upload(
+                input_file, content_hash, base_name, output_ext, max_widths, options)
             
             if success:
-                # 処理完了ページに結果を渡す
+                # 処理完了ページに結果を渡す (同期モード)
                 return render_template('result.html',
                                      app_title=APP_TITLE,
                                      version=VERSION,
-                                     message=message,
+                                     message=results[0]['message'] if len(results) == 1 else message,
                                      original_filename=original_filename,
-                                     output_filename=output_filename,
                                      original_size=original_size,
-                                     new_size=new_size,
-                                     download_id=os.path.basename(output_path))
+                                     results=results,
+                                     zip_download_id=zip_download_id)
             else:
                 flash(message)
                 return redirect(url_for('index'))
                 
+        except AdmissionError as e:
+            flash(str(e))
+            return redirect(url_for('index'))
         except Exception as e:
             logger.error(f"ファイル処理エラー: {str(e)}")
+            metrics.inc(METRIC_ERRORS, format=format_label(os.path.splitext(file.filename)[1]))
             flash(f"ファイル処理中にエラーが発生しました: {str(e)}")
             return redirect(url_for('index'))
         finally:
             # 一時ファイルをクリーンアップ
-            if os.path.exists(input_path):
+            if input_path and os.path.exists(input_path):
                 os.remove(input_path)
     else:
-        flash('許可されていないファイル形式です。PNG, JPG, JPEG, GIF, BMPファイルを選択してください。')
+        _reject('unsupported_format')
+        flash('許可されていないファイル形式です。PNG, JPG, JPEG, GIF, BMP, WebPファイルを選択してください。')
         return redirect(url_for('index'))
 
+@app.route('/api/resize', methods=['POST'])
+def api_resize():
+    """
+    リサイズした画像をレスポンスとして直接返すAPI
+
+    DOWNLOAD_FOLDER には保存せず、メモリ上でエンコードした画像をそのまま返します。
+    フォームの項目は /upload と同じです (file, width, format, preset, max_bytes)。横幅は1つだけ指定できます。
+    format=auto の場合は Accept ヘッダーから出力形式を選び、レスポンスに Vary: Accept を付けます。
+    max_bytes を指定した場合は、使用した品質を X-Image-Quality ヘッダー (品質で調整できない GIF などは返さない)、
+    目標サイズに収まったかどうかを X-Image-Target-Met ヘッダー (true / false) で返します。
+    """
+    if 'file' not in request.files or request.files['file'].filename == '':
+        _reject('invalid_request')
+        return jsonify({'error': 'ファイルが選択されていません。'}), 400
+    
+    file = request.files['file']
+    width = request.form.get('width')
+    
+    if not width or not width.isdigit() or int(width) <= 0:
+        _reject('invalid_request')
+        return jsonify({'error': '有効な横幅を指定してください。'}), 400
+    
+    if not allowed_file(file.filename):
+        _reject('unsupported_format')
+        return jsonify({'error': '許可されていないファイル形式です。PNG, JPG, JPEG, GIF, BMP, WebPファイルを選択してください。'}), 415
+    
+    try:
+        output_ext, options, negotiated = parse_encoding_options(request.form)
+    except ValueError as e:
+        _reject('invalid_request')
+        return jsonify({'error': str(e)}), 400
+    
+    max_width = int(width)
+    original_filename = secure_filename(file.filename)
+    base_name, file_ext = os.path.splitext(original_filename)
+    output_ext = output_ext or file_ext
+    output_format = format_for_ext(output_ext)
+    
+    content_hash = hash_upload(file.stream)
+    _record_upload_received(file, file_ext)
+    cached = lookup_cached_rendition(content_hash, max_width, output_ext, options)
+    data = None
+    if cached is not None:
+        cached_path, meta = cached
+        try:
+            with open(cached_path, 'rb') as f:
+                data = f.read()
+            original_size, new_size, quality = meta['original_size'], meta['new_size'], meta.get('quality')
+            touch_perceptual_hash(content_hash)
+        except OSError:
+            # 他のワーカーによって削除された場合はミスとして扱う
+            data = None
+    
+    if data is None:
+        # 似た画像 (保存し直し・圧縮し直しなど) のリサイズ結果がキャッシュにあれば再利用する
+        similar = lookup_near_duplicate_renditions(file.stream, content_hash, [max_width], output_ext, options)
+        if similar:
+            cached_path, meta = similar[0]
+            try:
+                with open(cached_path, 'rb') as f:
+                    data = f.read()
+                original_size, new_size, quality = meta['original_size'], meta['new_size'], meta.get('quality')
+            except OSError:
+                data = None
+    
+    if data is None:
+        buffer = io.BytesIO()
+        try:
+            success, message, original_size, renditions = resize_image_multi(file.stream, [(max_width, buffer)],
+                                                                              output_format=output_format, **options)
+        except MemoryBudgetExceeded as e:
+            response = jsonify({'error': str(e)})
+            response.status_code = 503
+            response.headers['Retry-After'] = str(MEMORY_RETRY_AFTER)
+            return response
+        except ImageTooLargeError as e:
+            return jsonify({'error': str(e)}), 413
+        if not success:
+            return jsonify({'error': message}), 422
+        data = buffer.getvalue()
+        new_size, quality = renditions[0]['new_size'], renditions[0]['quality']
+    metrics.inc(METRIC_BYTES_OUT, len(data), format=format_label(output_ext))
+    
+    response = app.response_class(data, mimetype=Image.MIME.get(output_format, 'application/octet-stream'))
+    response.headers['Content-Disposition'] = f'attachment; filename="{base_name}_{max_width}px{output_ext}"'
+    response.headers['X-Original-Size'] = f"{original_size[0]}x{original_size[1]}"
+    response.headers['X-Image-Size'] = f"{new_size[0]}x{new_size[1]}"
+    if quality is not None:
+        response.headers['X-Image-Quality'] = str(quality)
+    if options.get('max_bytes') is not None:
+        response.headers['X-Image-Target-Met'] = 'true' if len(data) <= options['max_bytes'] else 'false'
+    response.set_etag(hashlib.sha256(data).hexdigest())
+    if negotiated:
+        response.vary.add('Accept')
+    return response
+
+@app.route('/api/batch', methods=['POST'])
+def api_batch():
+    """
+    複数の画像 (またはZIPファイル) をまとめてリサイズし、結果をZIPファイルとして返すAPI
+
+    ZIPファイルは全体ができるのを待たず、リサイズが終わった画像から順に送信します。
+    """
+    # 一括アップロードはリクエスト全体のサイズの上限を個別に設定する
+    request.max_content_length = BATCH_MAX_REQUEST_SIZE
+    files = [file for file in request.files.getlist('file') if file.filename]
+    widths = request.form.getlist('width')
+    if not files:
+        _reject('invalid_request')
+        return jsonify({'error': 'ファイルが選択されていません。'}), 400
+    if not widths or not all(width.isdigit() and int(width) > 0 for width in widths):
+        _reject('invalid_request')
+        return jsonify({'error': '有効な横幅を指定してください。'}), 400
+    max_widths = list(dict.fromkeys(int(width) for width in widths))
+    
+    try:
+        output_ext, options, _ = parse_encoding_options(request.form)
+    except ValueError as e:
+        _reject('invalid_request')
+        return jsonify({'error': str(e)}), 400
+    
+    try:
+        inputs, errors = collect_batch_inputs(files)
+    except ValueError as e:
+        _reject('too_large')
+        return jsonify({'error': str(e)}), 413
+    
+    response = app.response_class(iter_batch_zip(inputs, errors, max_widths, output_ext, options),
+                                  mimetype='application/zip')
+    response.headers['Content-Disposition'] = 'attachment; filename="resized.zip"'
+    return response
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    """非同期ジョブの状態をJSONで返す"""
+    status = job_queue.status(job_id) if re.fullmatch(r'[0-9a-f]{32}', job_id) else None
+    if status is None:
+        return jsonify({'error': 'ジョブが見つかりません。'}), 404
+    
+    response = {'job_id': job_id, 'status': status['status']}
+    if status['status'] == STATUS_DONE:
+        result = status['result']
+        response['original_size'] = result['original_size']
+        response['results'] = [dict(r, download_url=url_for('download_file', download_id=r['download_id']))
+                               for r in result['results']]
+        if result['zip_download_id']:
+            response['zip_download_url'] = url_for('download_file', download_id=result['zip_download_id'])
+    elif 'error' in status:
+        response['error'] = status['error']
+    return jsonify(response)
+
+@app.route('/jobs/<job_id>/result')
+def job_result(job_id):
+    """非同期ジョブの結果を処理完了ページとして表示する"""
+    status = job_queue.status(job_id) if re.fullmatch(r'[0-9a-f]{32}', job_id) else None
+    if status is None:
+        flash('ジョブが見つかりません。')
+        return redirect(url_for('index'))
+    
+    if status['status'] != STATUS_DONE:
+        if 'error' in status:
+            flash(status['error'])
+            return redirect(url_for('index'))
+        # 処理中の場合は状態を返す
+        return jsonify({'job_id': job_id, 'status': status['status']}), 202
+    
+    result = status['result']
+    return render_template('result.html',
+                         app_title=APP_TITLE,
+                         version=VERSION,
+                         message=result['message'],
+                         original_filename=status['info'].get('original_filename', ''),
+                         original_size=result['original_size'],
+                         results=result['results'],
+                         zip_download_id=result['zip_download_id'])
+
+@app.route('/status/storage')
+def storage_status():
+    """一時ファイルの使用量と直近の削除処理の結果をJSONで返す"""
+    stats = storage_janitor.stats() or {}
+    if result_cache is not None:
+        stats['cache'] = result_cache.stats()
+    stats['memory_budget'] = memory_budget.stats()  # used / reservations は全プロセス、waiting / rejected はこのワーカーの分
+    if phash_index is not None:
+        try:
+            stats['phash_index'] = {'entries': phash_index.count()}
+        except sqlite3.Error as e:
+            logger.error(f"知覚ハッシュの索引の読み込みエラー: {str(e)}")
+    return jsonify(stats)
+
+def janitor_metrics(stats):
+    """
+    一時ファイルの定期削除の結果を /metrics に出力する値にする
+
+    Args:
+        stats: StorageJanitor.stats() の結果 (まだ一度も実行されていない場合は None)
+
+    Returns:
+        tuple: (ゲージのリスト, カウンターのリスト)。どちらも (名前, ラベルの辞書, 値) のリスト
+    """
+    if not stats:
+        return [], []
+    gauges = [(METRIC_JANITOR_SWEEP_SECONDS, {}, stats['sweep_duration_seconds']),
+              (METRIC_JANITOR_LAST_SWEEP, {}, stats['last_sweep'])]
+    counters = [(METRIC_JANITOR_SWEEPS, {}, stats['sweeps'])]
+    for name, folder in stats['folders'].items():
+        gauges.append((METRIC_STORAGE_BYTES, {'folder': name}, folder['bytes_used']))
+        gauges.append((METRIC_STORAGE_FILES, {'folder': name}, folder['files']))
+        counters.append((METRIC_STORAGE_EVICTIONS, {'folder': name}, folder['files_evicted']))
+    return gauges, counters
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """全ワーカー (とプロセスプール) のメトリクスを Prometheus のテキスト形式で返す"""
+    gauges, counters = janitor_metrics(storage_janitor.stats())
+    return app.response_class(metrics.render(gauges, counters), mimetype='text/plain; version=0.0.4')
+
+@app.route('/status/encoders')
+def encoder_status():
+    """プリセット・画像形式ごとのエンコード時間と出力サイズの集計をJSONで返す (このワーカーの分のみ)"""
+    return jsonify(encoder_stats.snapshot())
+
 @app.route('/download/<download_id>')
 def download_file(download_id):
-    """リサイズされた画像のダウンロード"""
+    """
+    リサイズされた画像のダウンロード
+
+    内容のハッシュ値を強い ETag として付け、If-None-Match / If-Modified-Since には 304 を、
+    Range には 206 (部分的な内容) を返します。DOWNLOAD_SENDFILE_MODE を指定した場合は、
+    ヘッダーだけを返してファイルの送信をフロントのプロキシに任せます。
+    """
     try:
-        file_path = os.path.join(DOWNLOAD_FOLDER, download_id)
-        if os.path.exists(file_path):
-            return send_file(file_path, as_attachment=True)
-        else:
+        file_path = safe_join(DOWNLOAD_FOLDER, download_id)
+        if file_path is None or not os.path.isfile(file_path):
             flash('ファイルが見つかりません。')
             return redirect(url_for('index'))
+        stat = os.stat(file_path)
+        send_options = {'as_attachment': True,
+                        'etag': file_etag(file_path, stat),
+                        'last_modified': stat.st_mtime,
+                        'max_age': DOWNLOAD_MAX_AGE}
+        if DOWNLOAD_SENDFILE_MODE is None:
+            return send_file(file_path, **send_options)
+
+        # X-Sendfile ヘッダーの付いた (本文のない) レスポンスを作る (Flask の send_file は設定 USE_X_SENDFILE に従うため直接呼ぶ)
+        response = werkzeug_send_file(os.path.abspath(file_path), request.environ, use_x_sendfile=True, conditional=False,
+                                      response_class=app.response_class, **send_options)
+        if DOWNLOAD_SENDFILE_MODE == SENDFILE_X_ACCEL:
+            del response.headers['X-Sendfile']
+            response.headers['X-Accel-Redirect'] = DOWNLOAD_ACCEL_PREFIX + quote(download_id)
+        # 304 の判定だけを行い、Range はプロキシに任せる
+        response = response.make_conditional(request)
+        if response.status_code == 304:
+            # 304 でもファイルを送ってしまうプロキシがあるため外す
+            response.headers.pop('X-Sendfile', None)
+            response.headers.pop('X-Accel-Redirect', None)
+        return response
     except Exception as e:
         logger.error(f"ダウンロードエラー: {str(e)}")
         flash('ダウンロード中にエラーが発生しました。')
@@ -175,10 +1400,17 @@ def download_file(download_id):
 
 @app.errorhandler(413)
 def too_large(e):
-    """ファイルサイズが大きすぎる場合のエラーハンドラ"""
-    flash('ファイルサイズが大きすぎます。16MB以下のファイルを選択してください。')
+    """ファイルサイズが大きすぎる場合のエラーハンドラ (API はリダイレクトせず JSON で返す)"""
+    _reject('too_large')
+    limit = request.max_content_length or MAX_FILE_SIZE
+    message = f"ファイルサイズが大きすぎます。{limit // (1024 * 1024)}MB以下のファイルを選択してください。"
+    if request.path.startswith('/api/'):
+        return jsonify({'error': message}), 413
+    flash(message)
     return redirect(url_for('index'))
 
+startup_timings['import'] = time.perf_counter() - _IMPORT_STARTED
+
 if __name__ == '__main__':
     # 開発用サーバーの起動
     print(f"=== {APP_TITLE} (Ver {VERSION}) ===")
@@ -189,5 +1421,6 @@ if __name__ == '__main__':
     # 一時ディレクトリの作成を確認
     os.makedirs(UPLOAD_FOLDER, exist_ok=True)
     os.makedirs(DOWNLOAD_FOLDER, exist_ok=True)
+    warmup()
     
     app.run(debug=True, host='127.0.0.1', port=5000)
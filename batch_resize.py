@@ -0,0 +1,326 @@
+"""
+画像一括リサイズツール (コマンドライン)
+
+フォルダ以下の画像 (またはファイル一覧に書かれた画像) を、
+全CPUコアを使って1つ以上の横幅にまとめてリサイズします。
+リサイズ処理は Web サービス (app.py) と同じ resize_core.py を使うため、結果は Web サービスと同じになります。
+Web サービス (Flask) は読み込まないため、保存先のフォルダなどは作成しません。
+画素数・メモリの上限は Web サービスとは別に、このファイルの設定またはオプションで指定します。
+
+使い方:
+    python batch_resize.py 画像フォルダ -w 620 -w 1280
+    python batch_resize.py --file-list files.txt -w 620 -o 出力フォルダ
+    python batch_resize.py 画像フォルダ --duplicates            # リサイズせずに似た画像の一覧を表示
+    python batch_resize.py 画像フォルダ --max-megapixels 300     # 大きな画像の上限を変更
+
+- 出力ファイル名は「元のファイル名_620px.jpg」の形式です
+- 出力ファイルが元の画像より新しい場合はスキップします (--force で再作成)
+- エラーはダイアログを出さずに収集し、最後にまとめて表示します
+- --duplicates では、知覚ハッシュ (dHash) が近い画像 (保存し直し・圧縮し直し・少しの切り抜きなど) をまとめて表示します
+
+作成日: 2026-10-16
+"""
+
+import argparse
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+import os
+import re
+import sys
+import time
+from PIL import Image
+from perceptual_hash import BKTree, file_dhash, format_hash
+from resize_core import Resizer
+
+# --- グローバル設定 ---
+PROGRAM_TITLE = "画像一括リサイズツール"
+VERSION = "0.5"  # ソース変更時にこの値を更新してください
+ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'bmp', 'webp'}
+DEFAULT_WIDTHS = [620]
+OUTPUT_NAME_PATTERN = re.compile(r'_\d+px$')  # 出力ファイル (xxx_620px.jpg) を入力として扱わないため
+DUPLICATE_THRESHOLD = 6  # --duplicates で似た画像とみなす知覚ハッシュの異なるビット数の上限 (64ビット中)
+HASH_CHUNKSIZE = 16  # --duplicates でプロセスに1回で渡す画像の数
+MAX_IMAGE_PIXELS = 200 * 1000 * 1000  # 1枚あたりの画素数の上限 (--max-megapixels で変更可能。JPEGは draft() による縮小後の画素数で判定)
+MAX_IMAGE_MEMORY = 2 * 1024 * 1024 * 1024  # 1枚あたりのデコード・縮小に必要なメモリ (見積もり) の上限 (--max-memory-mb で変更可能)
+
+def is_image_file(path):
+    """リサイズ対象の拡張子かチェック"""
+    return os.path.splitext(path)[1][1:].lower() in ALLOWED_EXTENSIONS
+
+def iter_input_files(sources, file_list=None):
+    """
+    入力画像ファイルを列挙する
+
+    Args:
+        sources: フォルダまたはファイルのパスのリスト (フォルダは再帰的に走査)
+        file_list: 1行に1つのパスを書いたファイル ('-' の場合は標準入力)
+
+    Yields:
+        tuple: (入力ファイルのパス, 基準フォルダからの相対パス)
+    """
+    for source in sources:
+        if os.path.isdir(source):
+            for dirpath, dirnames, filenames in os.walk(source):
+                dirnames.sort()
+                for filename in sorted(filenames):
+                    path = os.path.join(dirpath, filename)
+                    if is_image_file(path) and not OUTPUT_NAME_PATTERN.search(os.path.splitext(filename)[0]):
+                        yield path, os.path.relpath(path, source)
+        elif is_image_file(source):
+            yield source, os.path.basename(source)
+
+    if file_list:
+        f = sys.stdin if file_list == '-' else open(file_list, 'r', encoding='utf-8')
+        try:
+            for line in f:
+                path = line.strip()
+                if path and is_image_file(path):
+                    yield path, os.path.basename(path)
+        finally:
+            if f is not sys.stdin:
+                f.close()
+
+def output_paths(input_path, relative_path, widths, output_dir=None):
+    """
+    出力ファイルのパスを決める
+
+    output_dir を指定しない場合は元の画像と同じフォルダに、
+    指定した場合は output_dir 以下に元のフォルダ構成のまま保存します。
+
+    Returns:
+        list: (横幅, 出力ファイルのパス) のリスト
+    """
+    if output_dir:
+        base, ext = os.path.splitext(os.path.join(output_dir, relative_path))
+    else:
+        base, ext = os.path.splitext(input_path)
+    return [(width, f"{base}_{width}px{ext}") for width in widths]
+
+def is_up_to_date(input_path, targets):
+    """全ての出力ファイルが存在し、元の画像より新しい場合は True"""
+    try:
+        input_mtime = os.path.getmtime(input_path)
+        return all(os.path.getmtime(path) >= input_mtime for _, path in targets)
+    except OSError:
+        return False
+
+def _init_resize_worker():
+    """
+    リサイズ用のプロセスの初期化
+
+    Pillow は画素数が Image.MAX_IMAGE_PIXELS の2倍 (既定で約1億7900万画素) を超える画像を開くと
+    DecompressionBombError を送出するため、MAX_IMAGE_PIXELS (--max-megapixels) をそれより大きくしても効きません。
+    画素数の上限は Resizer がデコード前にヘッダーのサイズ (JPEGは draft() による縮小後) で判定するため、
+    Pillow の判定は無効にします。
+    """
+    Image.MAX_IMAGE_PIXELS = None
+
+def resize_one(resizer, input_path, targets, exact):
+    """
+    1つの画像をリサイズする (プロセスプール側で実行)
+
+    Returns:
+        tuple: (成功フラグ, メッセージ)
+    """
+    success, message, _, _ = resizer.resize_multi(input_path, targets, exact=exact)
+    return success, message
+
+def run_batch(files, widths, output_dir=None, workers=None, max_in_flight=None, force=False, exact=None, resizer=None):
+    """
+    画像を一括リサイズする
+
+    同時に投入するジョブ数を max_in_flight までに抑えるため、
+    数千枚の画像でもメモリ使用量は一定です。
+    resizer を省略した場合は、このファイルの設定 (MAX_IMAGE_PIXELS / MAX_IMAGE_MEMORY) を使います。
+
+    Returns:
+        dict: 処理結果の集計 (processed, skipped, errors, elapsed, input_bytes)
+    """
+    workers = workers or os.cpu_count() or 1
+    max_in_flight = max_in_flight or workers * 2
+    resizer = resizer or Resizer(max_image_pixels=MAX_IMAGE_PIXELS, max_image_memory=MAX_IMAGE_MEMORY)
+    summary = {'processed': 0, 'skipped': 0, 'errors': [], 'input_bytes': 0}
+    started = time.perf_counter()
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_resize_worker) as executor:
+        in_flight = {}
+
+        def collect(done):
+            for future in done:
+                input_path, size = in_flight.pop(future)
+                try:
+                    success, message = future.result()
+                except Exception as e:
+                    success, message = False, str(e)
+                if success:
+                    summary['processed'] += 1
+                    summary['input_bytes'] += size
+                else:
+                    summary['errors'].append((input_path, message))
+
+        for input_path, relative_path in files:
+            targets = output_paths(input_path, relative_path, widths, output_dir)
+            if not force and is_up_to_date(input_path, targets):
+                summary['skipped'] += 1
+                continue
+            try:
+                size = os.path.getsize(input_path)
+                for _, path in targets:
+                    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+            except OSError as e:
+                summary['errors'].append((input_path, str(e)))
+                continue
+
+            # 投入済みのジョブが上限に達したら、どれかが終わるまで待つ
+            if len(in_flight) >= max_in_flight:
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                collect(done)
+            in_flight[executor.submit(resize_one, resizer, input_path, targets, exact)] = (input_path, size)
+
+        while in_flight:
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            collect(done)
+
+    summary['elapsed'] = time.perf_counter() - started
+    return summary
+
+def hash_one(input_path):
+    """
+    1つの画像の知覚ハッシュを計算する (プロセスプール側で実行)
+
+    Returns:
+        tuple: (入力ファイルのパス, dHash, 元のサイズ, エラーメッセージ)
+    """
+    try:
+        value, size = file_dhash(input_path)
+        return input_path, value, size, None
+    except Exception as e:
+        return input_path, None, None, str(e)
+
+def find_duplicates(files, threshold=DUPLICATE_THRESHOLD, workers=None):
+    """
+    知覚ハッシュが近い画像をグループにまとめる
+
+    ハッシュの計算は全CPUコアで行い (JPEG は縮小デコードするため高速)、
+    BK木で距離が threshold 以下の組を探して、つながった画像を1つのグループにします。
+
+    Returns:
+        dict: groups (グループのリスト。各グループは (パス, dHash, 元のサイズ) のリスト、大きい順)、
+              hashed (ハッシュを計算した枚数)、errors、elapsed
+    """
+    workers = workers or os.cpu_count() or 1
+    summary = {'groups': [], 'hashed': 0, 'errors': []}
+    started = time.perf_counter()
+
+    entries = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        paths = (input_path for input_path, _ in files)
+        for input_path, value, size, error in executor.map(hash_one, paths, chunksize=HASH_CHUNKSIZE):
+            if error is not None:
+                summary['errors'].append((input_path, error))
+            else:
+                entries.append((input_path, value, size))
+    summary['hashed'] = len(entries)
+
+    tree = BKTree()
+    for index, (_, value, _) in enumerate(entries):
+        tree.add(value, index)
+
+    # 距離が threshold 以下の組をつなぐ (Union-Find)
+    parent = list(range(len(entries)))
+
+    def root(index):
+        while parent[index] != index:
+            parent[index] = parent[parent[index]]
+            index = parent[index]
+        return index
+
+    for index, (_, value, _) in enumerate(entries):
+        for _, other in tree.search(value, threshold):
+            a, b = root(index), root(other)
+            if a != b:
+                parent[max(a, b)] = min(a, b)
+
+    groups = {}
+    for index in range(len(entries)):
+        groups.setdefault(root(index), []).append(entries[index])
+    summary['groups'] = sorted((group for group in groups.values() if len(group) > 1), key=len, reverse=True)
+    summary['elapsed'] = time.perf_counter() - started
+    return summary
+
+def print_duplicates(summary):
+    """似た画像のグループを表示する"""
+    groups = summary['groups']
+    print(f"似た画像: {len(groups)}グループ ({sum(len(group) for group in groups)}件)")
+    for number, group in enumerate(groups, 1):
+        print(f"\n[{number}] {len(group)}件")
+        for input_path, value, size in group:
+            print(f"  {format_hash(value)}  {size[0]}x{size[1]}  {input_path}")
+    elapsed = summary['elapsed']
+    print(f"\n処理: {summary['hashed']}件 / エラー: {len(summary['errors'])}件")
+    if elapsed > 0:
+        print(f"処理時間: {elapsed:.2f}秒 ({summary['hashed'] / elapsed:.1f} 枚/秒)")
+    for input_path, message in summary['errors']:
+        print(f"エラー: {input_path}: {message}", file=sys.stderr)
+
+def print_summary(summary):
+    """処理結果の集計を表示する"""
+    elapsed = summary['elapsed']
+    processed = summary['processed']
+    megabytes = summary['input_bytes'] / (1024 * 1024)
+    print(f"処理: {processed}件 / スキップ: {summary['skipped']}件 / エラー: {len(summary['errors'])}件")
+    if elapsed > 0:
+        print(f"処理時間: {elapsed:.2f}秒 ({processed / elapsed:.1f} 枚/秒, {megabytes / elapsed:.1f} MB/秒)")
+    for input_path, message in summary['errors']:
+        print(f"エラー: {input_path}: {message}", file=sys.stderr)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=f"{PROGRAM_TITLE} (Ver.{VERSION})")
+    parser.add_argument('sources', nargs='*', help='画像フォルダ、または画像ファイル')
+    parser.add_argument('--file-list', help='画像ファイルのパスを1行に1つ書いたファイル (- で標準入力)')
+    parser.add_argument('-w', '--width', type=int, action='append', dest='widths',
+                        help=f'リサイズ後の最大横幅 (複数指定可、既定: {DEFAULT_WIDTHS[0]})')
+    parser.add_argument('-o', '--output-dir', help='出力フォルダ (省略時は元の画像と同じフォルダ)')
+    parser.add_argument('-j', '--jobs', type=int, help='同時に処理するプロセス数 (既定: CPUコア数)')
+    parser.add_argument('--max-in-flight', type=int, help='同時に投入するジョブ数の上限 (既定: プロセス数の2倍)')
+    parser.add_argument('--force', action='store_true', help='出力ファイルが新しい場合もリサイズし直す')
+    parser.add_argument('--exact', action='store_true', help='高速縮小を使わず厳密なリサイズを行う')
+    parser.add_argument('--duplicates', action='store_true', help='リサイズせずに、似た画像のグループを表示する')
+    parser.add_argument('--threshold', type=int, default=DUPLICATE_THRESHOLD,
+                        help=f'--duplicates で似た画像とみなす知覚ハッシュの異なるビット数の上限 (0〜64、既定: {DUPLICATE_THRESHOLD})')
+    parser.add_argument('--max-megapixels', type=int, default=MAX_IMAGE_PIXELS // (1000 * 1000),
+                        help=f'1枚あたりの画素数の上限 (メガピクセル、既定: {MAX_IMAGE_PIXELS // (1000 * 1000)})')
+    parser.add_argument('--max-memory-mb', type=int, default=MAX_IMAGE_MEMORY // (1024 * 1024),
+                        help=f'1枚あたりの処理に使うメモリ (見積もり) の上限 (MB、既定: {MAX_IMAGE_MEMORY // (1024 * 1024)})')
+    args = parser.parse_args(argv)
+
+    if not args.sources and not args.file_list:
+        parser.error('画像フォルダ、画像ファイル、または --file-list を指定してください。')
+    widths = args.widths or DEFAULT_WIDTHS
+    if any(width <= 0 for width in widths):
+        parser.error('横幅には正の整数を指定してください。')
+
+    if not 0 <= args.threshold <= 64:
+        parser.error('--threshold には 0〜64 を指定してください。')
+    if args.max_megapixels <= 0 or args.max_memory_mb <= 0:
+        parser.error('--max-megapixels と --max-memory-mb には正の整数を指定してください。')
+
+    print(f"=== {PROGRAM_TITLE} (Ver.{VERSION}) ===")
+    if args.duplicates:
+        summary = find_duplicates(iter_input_files(args.sources, args.file_list), args.threshold, args.jobs)
+        print_duplicates(summary)
+        return 1 if summary['errors'] else 0
+
+    summary = run_batch(iter_input_files(args.sources, args.file_list),
+                        list(dict.fromkeys(widths)),
+                        output_dir=args.output_dir,
+                        workers=args.jobs,
+                        max_in_flight=args.max_in_flight,
+                        force=args.force,
+                        exact=True if args.exact else None,
+                        resizer=Resizer(max_image_pixels=args.max_megapixels * 1000 * 1000,
+                                        max_image_memory=args.max_memory_mb * 1024 * 1024))
+    print_summary(summary)
+    return 1 if summary['errors'] else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,480 @@
+"""
+リサイズ処理のベンチマーク
+
+生成した画像 (JPEG/PNG/GIF/BMP、複数の解像度) を使って、リサイズ処理の性能を測定します。
+デコード・リサイズフィルタ・保存設定の変更による性能の低下を、本番環境で遅くなる前に確認できます。
+
+- 段階ごとの処理時間 (open: ヘッダーの読み込み、decode: 全画素のデコード、
+  resize: 縮小、encode: メモリ上へのエンコード、write: ファイルへの書き込み)
+- 最大メモリ使用量 (測定ケースごとに新しいプロセスで実行し、最大RSSの増加分を測定)
+- app.resize_image と ameblo_resize.resize_image_to_file (resize_image_func の本体) の処理時間
+- 1〜N 並列のプロセスでのスループット (枚/秒)
+- 起動時間 (--startup): 新しいプロセスでの app の読み込み時間と、最初・2回目のリクエストの処理時間
+  (ウォームアップ (app.warmup) なし/ありの両方) と、ameblo_resize の読み込み時間
+
+結果は JSON ファイルに保存し、--compare で前回の結果と比較できます。
+
+使い方:
+    python benchmark.py
+    python benchmark.py --sizes 1920x1080 6000x4000 --formats jpeg png -o before.json
+    python benchmark.py -o after.json --compare before.json
+    python benchmark.py --startup
+
+作成日: 2026-10-16
+"""
+
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import io
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from PIL import Image
+import PIL
+
+# --- グローバル設定 ---
+PROGRAM_TITLE = "画像リサイズ ベンチマーク"
+VERSION = "0.3"  # ソース変更時にこの値を更新してください
+DEFAULT_SIZES = [(1920, 1080), (4000, 3000)]
+DEFAULT_FORMATS = ['jpeg', 'png', 'gif', 'bmp']
+DEFAULT_REPEAT = 3  # 各ケースの繰り返し回数 (中央値を採用)
+DEFAULT_JOBS_PER_WORKER = 4  # スループット測定でプロセス1つあたりに処理させる枚数
+DEFAULT_OUTPUT = 'benchmark_result.json'
+STAGES = ['open', 'decode', 'resize', 'encode', 'write']
+
+# 形式名 -> (PIL の画像形式, 拡張子)
+FORMATS = {
+    'jpeg': ('JPEG', '.jpg'),
+    'png': ('PNG', '.png'),
+    'gif': ('GIF', '.gif'),
+    'bmp': ('BMP', '.bmp'),
+}
+
+def parse_size(text):
+    """'1920x1080' 形式の文字列を (幅, 高さ) に変換する"""
+    try:
+        width, height = (int(v) for v in text.lower().split('x'))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"サイズは 幅x高さ の形式で指定してください: {text}")
+    if width <= 0 or height <= 0:
+        raise argparse.ArgumentTypeError(f"サイズには正の整数を指定してください: {text}")
+    return width, height
+
+def make_synthetic_image(size):
+    """
+    ベンチマーク用の画像を生成する
+
+    グラデーションとマンデルブロ集合を組み合わせた、細部と平坦な部分の両方を持つ画像です。
+    乱数を使わないため、何度実行しても同じ画像になります。
+    """
+    width, height = size
+    red = Image.linear_gradient('L').resize(size)
+    green = Image.radial_gradient('L').resize(size)
+    blue = Image.effect_mandelbrot(size, (-2.0, -1.25, 1.0, 1.25), 100)
+    return Image.merge('RGB', (red, green, blue))
+
+def generate_images(work_dir, sizes, formats):
+    """
+    全ての解像度・形式の画像を生成して保存する
+
+    Returns:
+        list: 画像ごとの辞書 (path, format, size, bytes) のリスト
+    """
+    images = []
+    for size in sizes:
+        img = make_synthetic_image(size)
+        for name in formats:
+            pil_format, ext = FORMATS[name]
+            path = os.path.join(work_dir, f"synthetic_{size[0]}x{size[1]}{ext}")
+            if pil_format == 'JPEG':
+                img.save(path, format=pil_format, quality=95)
+            else:
+                img.save(path, format=pil_format)
+            images.append({'path': path, 'format': name, 'size': list(size), 'bytes': os.path.getsize(path)})
+    return images
+
+def _max_rss_kb():
+    """
+    このプロセスの最大RSS (KB)
+
+    Linux では /proc の VmHWM を使います (getrusage の ru_maxrss は exec 後も
+    親プロセスの値を引き継ぐため、子プロセスの測定には使えない)。
+    """
+    try:
+        with open('/proc/self/status', 'r') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+def measure_stages(path, width, output_path, exact):
+    """
+    1つの画像を段階ごとに時間を測りながらリサイズする (新しいプロセスで実行)
+
+    処理内容は app.resize_image_multi と同じです (高速縮小・保存設定も app の設定に従う)。
+
+    Returns:
+        dict: 段階ごとの処理時間 (秒)、出力サイズ、最大RSSの増加分 (KB)
+    """
+    import app
+
+    rss_before = _max_rss_kb()
+    timings = {}
+
+    started = time.perf_counter()
+    img = Image.open(path)
+    timings['open'] = time.perf_counter() - started
+
+    with img:
+        new_size = (width, int(img.size[1] * width / img.size[0]))
+        output_format = img.format
+
+        started = time.perf_counter()
+        box = (0, 0) + img.size if exact else app.resizer.prepare_downscale(img, new_size)
+        img.load()
+        timings['decode'] = time.perf_counter() - started
+
+        started = time.perf_counter()
+        if exact:
+            resized = img.resize(new_size, Image.LANCZOS)
+        else:
+            resized = img.resize(new_size, Image.LANCZOS, box=box, reducing_gap=app.RESIZE_REDUCING_GAP)
+        timings['resize'] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    buffer = io.BytesIO()
+    app.resizer.save_image(resized, buffer, output_format)
+    timings['encode'] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    with open(output_path, 'wb') as f:
+        f.write(buffer.getbuffer())
+    timings['write'] = time.perf_counter() - started
+
+    return {'timings': timings,
+            'output_bytes': buffer.tell(),
+            'peak_rss_delta_kb': _max_rss_kb() - rss_before}
+
+def run_stage_benchmark(images, widths, work_dir, repeat, exact):
+    """
+    段階ごとの処理時間と最大メモリ使用量を測定する
+
+    メモリ使用量を他のケースの影響なく測るため、1回の測定ごとに新しいプロセスを使います。
+    (fork では親プロセスのメモリを引き継いでしまうため spawn で起動します)
+
+    Returns:
+        list: ケース (形式・解像度・横幅) ごとの結果
+    """
+    context = multiprocessing.get_context('spawn')
+    results = []
+    for image in images:
+        for width in widths:
+            if width >= image['size'][0]:
+                continue  # リサイズしない横幅は測定しない
+            output_path = os.path.join(work_dir, f"stage_{width}px_{os.path.basename(image['path'])}")
+            runs = []
+            for _ in range(repeat):
+                with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                    runs.append(executor.submit(measure_stages, image['path'], width, output_path, exact).result())
+            timings = {stage: statistics.median(run['timings'][stage] for run in runs) for stage in STAGES}
+            results.append({'format': image['format'],
+                            'size': image['size'],
+                            'width': width,
+                            'timings': timings,
+                            'total': sum(timings.values()),
+                            'output_bytes': runs[-1]['output_bytes'],
+                            'peak_rss_kb': max(run['peak_rss_delta_kb'] for run in runs)})
+    return results
+
+def _time_median(func, repeat):
+    """func を repeat 回実行し、処理時間の中央値 (秒) を返す"""
+    elapsed = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        elapsed.append(time.perf_counter() - started)
+    return statistics.median(elapsed)
+
+def run_end_to_end_benchmark(images, widths, work_dir, repeat):
+    """
+    app.resize_image と ameblo_resize.resize_image_to_file の処理時間を測定する
+
+    ameblo_resize は tkinter が必要なため、読み込めない環境では測定しません。
+
+    Returns:
+        list: ケースごとの結果
+    """
+    from app import resize_image
+    try:
+        from ameblo_resize import resize_image_to_file
+    except ImportError as e:
+        print(f"ameblo_resize を読み込めないため測定しません: {e}", file=sys.stderr)
+        resize_image_to_file = None
+
+    results = []
+    for image in images:
+        for width in widths:
+            if width >= image['size'][0]:
+                continue
+            output_path = os.path.join(work_dir, f"app_{width}px_{os.path.basename(image['path'])}")
+
+            def run_app():
+                success, message, _, _ = resize_image(image['path'], output_path, width)
+                if not success:
+                    raise RuntimeError(message)
+
+            result = {'format': image['format'],
+                      'size': image['size'],
+                      'width': width,
+                      'app_resize_image': _time_median(run_app, repeat)}
+
+            if resize_image_to_file is not None:
+                # 出力ファイルは入力と同じフォルダに作られるため、コピーしたファイルを使う
+                gui_dir = os.path.join(work_dir, 'gui')
+                os.makedirs(gui_dir, exist_ok=True)
+                gui_input = os.path.join(gui_dir, os.path.basename(image['path']))
+                shutil.copyfile(image['path'], gui_input)
+                result['ameblo_resize_image'] = _time_median(lambda: resize_image_to_file(gui_input, width), repeat)
+            results.append(result)
+    return results
+
+def _resize_job(path, output_path, width):
+    from app import resize_image
+    success, message, _, _ = resize_image(path, output_path, width)
+    if not success:
+        raise RuntimeError(message)
+
+def run_concurrency_benchmark(image, width, work_dir, max_workers, jobs_per_worker):
+    """
+    1〜max_workers 並列のプロセスでのスループットを測定する
+
+    Returns:
+        list: 並列数ごとの結果 (workers, jobs, elapsed, images_per_second, speedup)
+    """
+    results = []
+    for workers in range(1, max_workers + 1):
+        jobs = workers * jobs_per_worker
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            # プロセスの起動とモジュールの読み込みは測定に含めない
+            list(executor.map(_resize_job, [image['path']] * workers,
+                              [os.path.join(work_dir, f"warmup_{i}.jpg") for i in range(workers)], [width] * workers))
+            started = time.perf_counter()
+            list(executor.map(_resize_job, [image['path']] * jobs,
+                              [os.path.join(work_dir, f"concurrency_{i}.jpg") for i in range(jobs)], [width] * jobs))
+            elapsed = time.perf_counter() - started
+        results.append({'workers': workers,
+                        'jobs': jobs,
+                        'elapsed': elapsed,
+                        'images_per_second': jobs / elapsed})
+    for result in results:
+        result['speedup'] = result['images_per_second'] / results[0]['images_per_second']
+    return results
+
+def measure_startup(path, width, storage, warm):
+    """
+    新しいプロセスで app を読み込み、/api/resize を2回呼び出して処理時間を測る (新しいプロセスで実行)
+
+    2回目はリサイズ結果のキャッシュに当たらないよう、横幅を1px変えて呼び出します。
+
+    Args:
+        warm: True の場合、リクエストの前に app.warmup() を呼び出す (gunicorn の post_worker_init と同じ)
+
+    Returns:
+        dict: import / warmup / first_request / second_request の処理時間 (秒)
+    """
+    os.environ['IMAGE_RESIZE_STORAGE'] = storage
+    timings = {}
+    started = time.perf_counter()
+    import app
+    timings['import'] = time.perf_counter() - started
+    if warm:
+        started = time.perf_counter()
+        app.warmup()
+        timings['warmup'] = time.perf_counter() - started
+
+    client = app.app.test_client()
+    for name, request_width in (('first_request', width), ('second_request', width - 1)):
+        with open(path, 'rb') as f:
+            started = time.perf_counter()
+            response = client.post('/api/resize', data={'file': (f, os.path.basename(path)), 'width': str(request_width)})
+            timings[name] = time.perf_counter() - started
+        if response.status_code != 200:
+            raise RuntimeError(f"/api/resize が失敗しました (HTTP {response.status_code})")
+    return timings
+
+def measure_gui_import():
+    """新しいプロセスで ameblo_resize を読み込む時間 (秒) と、tkinter が読み込まれたかどうかを返す"""
+    started = time.perf_counter()
+    import ameblo_resize  # noqa: F401
+    return {'import': time.perf_counter() - started, 'tkinter_loaded': 'tkinter' in sys.modules}
+
+def run_startup_benchmark(image, width, work_dir, repeat):
+    """
+    起動時間と最初のリクエストの処理時間を測定する
+
+    モジュールの読み込みを測るため、1回の測定ごとに新しいプロセスを spawn で起動します。
+
+    Returns:
+        dict: cold (ウォームアップなし) / warm (ウォームアップあり) / ameblo_resize の結果 (中央値)
+    """
+    context = multiprocessing.get_context('spawn')
+
+    def run(func, *args):
+        runs = []
+        for index in range(repeat):
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                runs.append(executor.submit(func, *args).result())
+        return runs
+
+    results = {}
+    for mode, warm in (('cold', False), ('warm', True)):
+        storage = os.path.join(work_dir, f"startup_{mode}")
+        runs = run(measure_startup, image['path'], width, storage, warm)
+        results[mode] = {name: statistics.median(run[name] for run in runs) for name in runs[0]}
+    try:
+        runs = run(measure_gui_import)
+        results['ameblo_resize'] = {'import': statistics.median(run['import'] for run in runs),
+                                    'tkinter_loaded': any(run['tkinter_loaded'] for run in runs)}
+    except ImportError as e:
+        print(f"ameblo_resize を読み込めないため測定しません: {e}", file=sys.stderr)
+    return results
+
+def _case_key(result):
+    return f"{result['format']} {result['size'][0]}x{result['size'][1]} -> {result['width']}px"
+
+def print_report(report):
+    """測定結果を表示する"""
+    print("\n--- 段階ごとの処理時間 (ミリ秒、中央値) ---")
+    print(f"{'ケース':<32}" + ''.join(f"{stage:>9}" for stage in STAGES) + f"{'合計':>9}{'最大メモリ':>12}")
+    for result in report['stages']:
+        print(f"{_case_key(result):<32}"
+              + ''.join(f"{result['timings'][stage] * 1000:>9.1f}" for stage in STAGES)
+              + f"{result['total'] * 1000:>9.1f}{result['peak_rss_kb'] / 1024:>10.1f}MB")
+
+    print("\n--- リサイズ関数の処理時間 (ミリ秒、中央値) ---")
+    for result in report['end_to_end']:
+        line = f"{_case_key(result):<32} app: {result['app_resize_image'] * 1000:>8.1f}"
+        if 'ameblo_resize_image' in result:
+            line += f"  ameblo_resize: {result['ameblo_resize_image'] * 1000:>8.1f}"
+        print(line)
+
+    if report['concurrency']:
+        print("\n--- 並列処理のスループット ---")
+        for result in report['concurrency']:
+            print(f"{result['workers']:>3} プロセス: {result['images_per_second']:>7.1f} 枚/秒 (x{result['speedup']:.2f})")
+
+    startup = report.get('startup')
+    if startup:
+        print("\n--- 起動時間 (ミリ秒、中央値) ---")
+        for mode, label in (('cold', 'ウォームアップなし'), ('warm', 'ウォームアップあり')):
+            result = startup[mode]
+            print(f"{label:<16} import: {result['import'] * 1000:>7.1f}  warmup: {result.get('warmup', 0) * 1000:>7.1f}"
+                  f"  1回目: {result['first_request'] * 1000:>7.1f}  2回目: {result['second_request'] * 1000:>7.1f}")
+        if 'ameblo_resize' in startup:
+            result = startup['ameblo_resize']
+            print(f"ameblo_resize の読み込み: {result['import'] * 1000:.1f}"
+                  f" (tkinter: {'読み込む' if result['tkinter_loaded'] else '読み込まない'})")
+
+def print_comparison(report, baseline):
+    """前回の結果 (baseline) と比較して、ケースごとの処理時間の変化を表示する"""
+    previous = {_case_key(result): result for result in baseline.get('stages', [])}
+    print("\n--- 前回の結果との比較 (段階ごとの合計時間) ---")
+    for result in report['stages']:
+        key = _case_key(result)
+        if key not in previous:
+            continue
+        ratio = result['total'] / previous[key]['total'] if previous[key]['total'] else float('inf')
+        print(f"{key:<32} {previous[key]['total'] * 1000:>9.1f} -> {result['total'] * 1000:>9.1f} ms ({(ratio - 1) * 100:+.1f}%)")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=f"{PROGRAM_TITLE} (Ver.{VERSION})")
+    parser.add_argument('--sizes', type=parse_size, nargs='+', default=DEFAULT_SIZES,
+                        help='生成する画像の解像度 (例: 1920x1080 4000x3000)')
+    parser.add_argument('--formats', nargs='+', choices=list(FORMATS), default=DEFAULT_FORMATS, help='生成する画像の形式')
+    parser.add_argument('-w', '--width', type=int, action='append', dest='widths',
+                        help='リサイズ後の横幅 (複数指定可、既定: app.DEFAULT_WIDTHS)')
+    parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT, help=f'各ケースの繰り返し回数 (既定: {DEFAULT_REPEAT})')
+    parser.add_argument('-j', '--max-workers', type=int, default=os.cpu_count() or 1,
+                        help='スループットを測定する最大の並列数 (既定: CPUコア数、0 で測定しない)')
+    parser.add_argument('--jobs-per-worker', type=int, default=DEFAULT_JOBS_PER_WORKER,
+                        help=f'スループット測定でプロセス1つあたりに処理させる枚数 (既定: {DEFAULT_JOBS_PER_WORKER})')
+    parser.add_argument('--exact', action='store_true', help='高速縮小を使わず厳密なリサイズを測定する')
+    parser.add_argument('-o', '--output', default=DEFAULT_OUTPUT, help=f'結果を保存するJSONファイル (既定: {DEFAULT_OUTPUT})')
+    parser.add_argument('--compare', help='比較する前回の結果 (JSONファイル)')
+    parser.add_argument('--startup', action='store_true', help='起動時間と最初のリクエストの処理時間も測定する')
+    parser.add_argument('--work-dir', help='画像を生成するフォルダ (省略時は一時フォルダを作成して最後に削除)')
+    args = parser.parse_args(argv)
+
+    if args.repeat <= 0 or args.jobs_per_worker <= 0 or args.max_workers < 0:
+        parser.error('回数・枚数には正の整数を指定してください。')
+
+    import app
+    widths = args.widths or app.DEFAULT_WIDTHS
+    if any(width <= 0 for width in widths):
+        parser.error('横幅には正の整数を指定してください。')
+
+    print(f"=== {PROGRAM_TITLE} (Ver.{VERSION}) ===")
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix='image-resize-benchmark-')
+    os.makedirs(work_dir, exist_ok=True)
+    try:
+        print("画像を生成しています...")
+        images = generate_images(work_dir, args.sizes, args.formats)
+        print("段階ごとの処理時間を測定しています...")
+        stages = run_stage_benchmark(images, widths, work_dir, args.repeat, args.exact)
+        print("リサイズ関数の処理時間を測定しています...")
+        end_to_end = run_end_to_end_benchmark(images, widths, work_dir, args.repeat)
+
+        # スループットは最大の解像度の画像 (JPEGがあればJPEG) で測定する
+        concurrency = []
+        if args.max_workers:
+            print("並列処理のスループットを測定しています...")
+            largest = max(images, key=lambda image: (image['size'][0] * image['size'][1], image['format'] == 'jpeg'))
+            concurrency = run_concurrency_benchmark(largest, min(widths), work_dir, args.max_workers, args.jobs_per_worker)
+
+        # 起動時間は最小の解像度の画像 (JPEGがあればJPEG) で測定する
+        startup = None
+        if args.startup:
+            print("起動時間を測定しています...")
+            smallest = min(images, key=lambda image: (image['size'][0] * image['size'][1], image['format'] != 'jpeg'))
+            startup = run_startup_benchmark(smallest, min(widths), work_dir, args.repeat)
+    finally:
+        if not args.work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    report = {'meta': {'benchmark_version': VERSION,
+                       'app_version': app.VERSION,
+                       'created': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+                       'python': platform.python_version(),
+                       'pillow': PIL.__version__,
+                       'platform': platform.platform(),
+                       'cpu_count': os.cpu_count(),
+                       'fast_downscale': not args.exact and app.FAST_DOWNSCALE,
+                       'reducing_gap': app.RESIZE_REDUCING_GAP,
+                       'repeat': args.repeat,
+                       'widths': widths},
+              'images': [{k: v for k, v in image.items() if k != 'path'} for image in images],
+              'stages': stages,
+              'end_to_end': end_to_end,
+              'concurrency': concurrency,
+              'startup': startup}
+
+    print_report(report)
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            print_comparison(report, json.load(f))
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"\n結果を保存しました: {args.output}")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
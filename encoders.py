@@ -0,0 +1,334 @@
+"""
+画像の保存設定 (エンコーダーのプリセットと出力形式)
+
+Web サービス (app.py) と GUI ツール (ameblo_resize.py) で共通の保存設定です。
+
+- プリセット: 'fast' (速度優先) / 'balanced' (従来の設定) / 'smallest' (サイズ優先)
+- 出力形式: 元の形式のまま、または JPEG / プログレッシブJPEG / PNG / WebP / AVIF に変換
+  (AVIF は Pillow が対応している場合のみ)
+- 目標ファイルサイズ (バイト数) を指定した場合は、収まる最高の品質を二分探索します (アニメーション画像も)
+- アニメーション画像 (GIF / WebP) は縮小済みのフレームをまとめて保存します
+- プリセットと出力形式ごとに、エンコード時間と出力サイズを記録します
+
+作成日: 2026-10-16
+"""
+
+import io
+import logging
+import os
+import threading
+import time
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+PRESET_FAST = 'fast'
+PRESET_BALANCED = 'balanced'
+PRESET_SMALLEST = 'smallest'
+DEFAULT_PRESET = PRESET_BALANCED
+
+# プリセットごと・画像形式ごとの保存設定 (img.save() のキーワード引数)
+# balanced は従来の設定 (JPEGは quality=95, optimize=True、その他は Pillow の既定値) です。
+ENCODER_PRESETS = {
+    PRESET_FAST: {
+        'JPEG': {'quality': 90},  # optimize を行わない (ハフマン表の最適化はCPU負荷が高い)
+        'PNG': {'compress_level': 1},
+        'WEBP': {'quality': 80, 'method': 0},
+        'AVIF': {'quality': 60, 'speed': 10},
+    },
+    PRESET_BALANCED: {
+        'JPEG': {'quality': 95, 'optimize': True},
+        'PNG': {},
+        'WEBP': {'quality': 85, 'method': 4},
+        'AVIF': {'quality': 65, 'speed': 6},
+    },
+    PRESET_SMALLEST: {
+        'JPEG': {'quality': 85, 'optimize': True, 'progressive': True},
+        'PNG': {'optimize': True},
+        'WEBP': {'quality': 80, 'method': 6},
+        'AVIF': {'quality': 55, 'speed': 2},
+    },
+}
+PRESET_LABELS = {
+    PRESET_FAST: '速度優先',
+    PRESET_BALANCED: '標準',
+    PRESET_SMALLEST: 'サイズ優先',
+}
+
+FORMAT_ORIGINAL = 'original'  # 元の画像と同じ形式
+FORMAT_AUTO = 'auto'  # ブラウザの Accept ヘッダーから選ぶ (Web サービスのみ)
+
+# 出力形式の選択肢 -> (PIL の画像形式, 拡張子, プリセットに追加する保存設定)
+OUTPUT_FORMATS = {
+    'jpeg': ('JPEG', '.jpg', {}),
+    'progressive_jpeg': ('JPEG', '.jpg', {'progressive': True}),
+    'png': ('PNG', '.png', {}),
+    'webp': ('WEBP', '.webp', {}),
+    'avif': ('AVIF', '.avif', {}),
+}
+OUTPUT_FORMAT_LABELS = {
+    FORMAT_ORIGINAL: '元の形式のまま',
+    FORMAT_AUTO: '自動 (ブラウザの対応形式)',
+    'jpeg': 'JPEG',
+    'progressive_jpeg': 'プログレッシブJPEG',
+    'png': 'PNG',
+    'webp': 'WebP',
+    'avif': 'AVIF',
+}
+
+# 目標ファイルサイズの設定
+QUALITY_FORMATS = ('JPEG', 'WEBP', 'AVIF')  # quality で出力サイズを調整できる画像形式
+TARGET_SIZE_MIN_QUALITY = 20  # これより低い品質にはしない
+TARGET_SIZE_MAX_ITERATIONS = 7  # 1画像あたりのエンコード回数の上限 (達した場合はそれまでに収まった最高の品質を使う)
+
+# 透過情報を持つ画像モード
+_ALPHA_MODES = ('RGBA', 'LA', 'PA', 'RGBa', 'La')
+
+def available_output_formats():
+    """この環境の Pillow で保存できる出力形式の選択肢を返す"""
+    Image.init()
+    return [name for name, (pil_format, _, _) in OUTPUT_FORMATS.items() if pil_format in Image.SAVE]
+
+def output_format_info(name):
+    """
+    出力形式の選択肢に対応する設定を返す
+
+    Returns:
+        tuple: (PIL の画像形式, 拡張子, 追加の保存設定)。元の形式のままの場合は None
+    """
+    if name in (None, FORMAT_ORIGINAL):
+        return None
+    if name not in available_output_formats():
+        raise ValueError(f"保存できない出力形式です: {name}")
+    return OUTPUT_FORMATS[name]
+
+def encoder_params(output_format, preset=DEFAULT_PRESET, encoder_options=None):
+    """
+    画像形式とプリセットに対応する保存設定を返す
+
+    Args:
+        output_format: PIL の画像形式 (例: 'JPEG')
+        preset: プリセット名
+        encoder_options: プリセットに追加・上書きする保存設定 (例: {'progressive': True})
+    """
+    if preset not in ENCODER_PRESETS:
+        raise ValueError(f"不明なプリセットです: {preset}")
+    params = dict(ENCODER_PRESETS[preset].get(output_format, {}))
+    params.update(encoder_options or {})
+    return params
+
+def convert_for_format(img, output_format):
+    """
+    保存先の画像形式で扱えない画像モードを変換する
+
+    JPEG は透過を扱えないため、透過部分を白で塗りつぶします。
+    """
+    has_alpha = img.mode in _ALPHA_MODES or (img.mode == 'P' and 'transparency' in img.info)
+    if output_format == 'JPEG':
+        if img.mode in ('RGB', 'L', 'CMYK'):
+            return img
+        if has_alpha:
+            rgba = img.convert('RGBA')
+            background = Image.new('RGB', rgba.size, (255, 255, 255))
+            background.paste(rgba, mask=rgba.getchannel('A'))
+            return background
+        return img.convert('RGB')
+    if output_format in ('WEBP', 'AVIF'):
+        if img.mode in ('RGB', 'RGBA'):
+            return img
+        return img.convert('RGBA' if has_alpha else 'RGB')
+    if output_format == 'PNG' and img.mode == 'CMYK':
+        return img.convert('RGB')
+    return img
+
+class EncoderStats:
+    """プリセット・画像形式ごとのエンコード時間と出力サイズの集計 (プロセスごと)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def record(self, preset, output_format, seconds, size):
+        """エンコード1回分の結果を記録する"""
+        with self._lock:
+            entry = self._stats.setdefault((preset, output_format),
+                                           {'count': 0, 'seconds_total': 0.0, 'bytes_total': 0})
+            entry['count'] += 1
+            entry['seconds_total'] += seconds
+            entry['bytes_total'] += size
+
+    def snapshot(self):
+        """
+        集計結果を返す
+
+        Returns:
+            dict: {プリセット名: {画像形式: {count, seconds_total, bytes_total, seconds_avg, bytes_avg}}}
+        """
+        with self._lock:
+            result = {}
+            for (preset, output_format), entry in sorted(self._stats.items()):
+                result.setdefault(preset, {})[output_format] = dict(
+                    entry,
+                    seconds_avg=entry['seconds_total'] / entry['count'],
+                    bytes_avg=entry['bytes_total'] / entry['count'])
+            return result
+
+encoder_stats = EncoderStats()
+
+def _timed_save(img, output, output_format, preset, params):
+    """画像を保存し、エンコード時間と出力サイズを記録する (出力サイズを返す)"""
+    start_pos = output.tell() if hasattr(output, 'write') else 0
+    started = time.perf_counter()
+    img.save(output, format=output_format, **params)
+    seconds = time.perf_counter() - started
+    size = output.tell() - start_pos if hasattr(output, 'write') else os.path.getsize(output)
+    encoder_stats.record(preset, output_format, seconds, size)
+    return size
+
+def encode_to_size(img, output_format, max_bytes, preset=DEFAULT_PRESET, encoder_options=None,
+                   min_quality=TARGET_SIZE_MIN_QUALITY, max_iterations=TARGET_SIZE_MAX_ITERATIONS):
+    """
+    出力サイズが max_bytes 以下になる最高の品質でエンコードする
+
+    リサイズ済みの画像をメモリ上で繰り返しエンコードし、品質を二分探索します
+    (再デコードは行いません)。品質の上限はプリセットの品質です。
+    まず上限の品質、次に下限の品質を試すため、収まる場合・収まらない場合とも
+    すぐに探索を打ち切れます。
+
+    Args:
+        img: エンコードする画像 (リサイズ済み)
+        output_format: PIL の画像形式 (例: 'JPEG')
+        max_bytes: 目標ファイルサイズ (バイト)
+        preset: プリセット名
+        encoder_options: プリセットに追加・上書きする保存設定
+        min_quality: 品質の下限
+        max_iterations: エンコード回数の上限
+
+    Returns:
+        tuple: (エンコードしたデータ, 使用した品質, 目標サイズに収まったかどうか)
+               quality で調整できない画像形式 (PNGなど) の場合、品質は None
+    """
+    params = encoder_params(output_format, preset, encoder_options)
+    img = convert_for_format(img, output_format)
+
+    def encode(quality):
+        buffer = io.BytesIO()
+        _timed_save(img, buffer, output_format, preset, dict(params, quality=quality) if quality else params)
+        return buffer.getvalue()
+
+    return _search_quality(encode, output_format, params, max_bytes, min_quality, max_iterations)
+
+def encode_animation_to_size(frames, output_format, max_bytes, durations, disposals=None, loop=None,
+                             preset=DEFAULT_PRESET, encoder_options=None,
+                             min_quality=TARGET_SIZE_MIN_QUALITY, max_iterations=TARGET_SIZE_MAX_ITERATIONS):
+    """
+    アニメーション画像を、出力サイズが max_bytes 以下になる最高の品質でエンコードする
+
+    縮小済みのフレームをまとめて繰り返しエンコードし、encode_to_size() と同じように品質を二分探索します。
+    GIF は quality で調整できないため、1回だけエンコードします。
+
+    Args:
+        frames: フレームのリスト (縮小済み)
+        output_format: PIL の画像形式 ('GIF' または 'WEBP')
+        max_bytes: 目標ファイルサイズ (バイト)
+        durations, disposals, loop: save_animation() と同じ
+        preset: プリセット名
+        encoder_options: プリセットに追加・上書きする保存設定
+        min_quality: 品質の下限
+        max_iterations: エンコード回数の上限
+
+    Returns:
+        tuple: (エンコードしたデータ, 使用した品質, 目標サイズに収まったかどうか)
+               GIF の場合、品質は None
+    """
+    params = encoder_params(output_format, preset, encoder_options)
+
+    def encode(quality):
+        buffer = io.BytesIO()
+        options = dict(encoder_options or {}, quality=quality) if quality else encoder_options
+        save_animation(frames, buffer, output_format, durations, disposals, loop, preset, options)
+        return buffer.getvalue()
+
+    return _search_quality(encode, output_format, params, max_bytes, min_quality, max_iterations)
+
+def _search_quality(encode, output_format, params, max_bytes, min_quality, max_iterations):
+    """
+    encode(品質) の出力サイズが max_bytes 以下になる最高の品質を二分探索する
+
+    Returns:
+        tuple: (エンコードしたデータ, 使用した品質, 目標サイズに収まったかどうか)
+    """
+    if output_format not in QUALITY_FORMATS:
+        data = encode(None)
+        return data, None, len(data) <= max_bytes
+
+    high = params.get('quality', 95)
+    low = min(min_quality, high)
+    data = encode(high)
+    if len(data) <= max_bytes:
+        return data, high, True
+    if max_iterations < 2 or low == high:
+        return data, high, False
+    best_data, best_quality = encode(low), low
+    if len(best_data) > max_bytes:
+        return best_data, low, False
+
+    # low は収まり high は収まらない範囲を二分探索する
+    iterations = 2
+    while high - low > 1 and iterations < max_iterations:
+        quality = (low + high) // 2
+        data = encode(quality)
+        iterations += 1
+        if len(data) <= max_bytes:
+            low, best_data, best_quality = quality, data, quality
+        else:
+            high = quality
+    return best_data, best_quality, True
+
+def save_image(img, output, output_format, preset=DEFAULT_PRESET, encoder_options=None):
+    """
+    プリセットに従って画像を保存し、エンコード時間と出力サイズを記録する
+
+    Args:
+        img: 保存する画像
+        output: 出力画像ファイルのパス、またはファイルオブジェクト
+        output_format: PIL の画像形式 (例: 'JPEG')
+        preset: プリセット名
+        encoder_options: プリセットに追加・上書きする保存設定
+
+    Returns:
+        int: 出力サイズ (バイト)
+    """
+    params = encoder_params(output_format, preset, encoder_options)
+    return _timed_save(convert_for_format(img, output_format), output, output_format, preset, params)
+
+def save_animation(frames, output, output_format, durations, disposals=None, loop=None,
+                   preset=DEFAULT_PRESET, encoder_options=None):
+    """
+    縮小済みのフレームをアニメーション画像として保存する
+
+    Args:
+        frames: フレームのリスト
+        output: 出力画像ファイルのパス、またはファイルオブジェクト
+        output_format: PIL の画像形式 ('GIF' または 'WEBP')
+        durations: フレームごとの表示時間 (ミリ秒) のリスト
+        disposals: フレームごとの破棄方法のリスト (GIFのみ)
+        loop: ループ回数 (0 は無限、None は1回だけ再生)
+        preset: プリセット名
+        encoder_options: プリセットに追加・上書きする保存設定
+
+    Returns:
+        int: 出力サイズ (バイト)
+    """
+    params = dict(encoder_params(output_format, preset, encoder_options),
+                  save_all=True, append_images=frames[1:], duration=durations)
+    if output_format == 'GIF':
+        # GIF はループ回数の指定がなければ1回だけ再生する
+        if loop is not None:
+            params['loop'] = loop
+        if disposals is not None:
+            params['disposal'] = disposals
+    else:
+        # WebP のループ回数は再生回数 (0 は無限)
+        params['loop'] = 1 if loop is None else loop
+    return _timed_save(frames[0], output, output_format, preset, params)
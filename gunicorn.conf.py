@@ -0,0 +1,22 @@
+"""
+gunicorn の設定
+
+各ワーカーがリクエストを受け付ける前に app.warmup() を呼び出し、画像形式のプラグイン・
+デコーダー・エンコーダー・リサイズ処理・テンプレートの初期化を済ませます
+(ウォームアップしない場合、各ワーカーの最初のリクエストだけが遅くなります)。
+
+ワーカー数などはこのファイルでは設定しません (コマンドラインや GUNICORN_CMD_ARGS で指定してください)。
+
+使い方:
+    gunicorn -w 4 -c gunicorn.conf.py app:app
+    IMAGE_RESIZE_STARTUP_TIMING=1 gunicorn -w 4 -c gunicorn.conf.py app:app   # 起動時間をログに出力
+
+作成日: 2026-10-17
+"""
+
+def post_worker_init(worker):
+    """ワーカーの起動後、リクエストを受け付ける前に呼び出される"""
+    import app
+    timings = app.warmup()
+    worker.log.info("ウォームアップ完了 (pid %s): %s", worker.pid,
+                    ', '.join(f"{name} {seconds * 1000:.1f}ms" for name, seconds in timings.items()))
@@ -0,0 +1,234 @@
+"""
+非同期ジョブキュー
+
+リサイズ処理をプロセスプールで実行し、リクエストハンドラはジョブIDをすぐに返します。
+ジョブの状態は JSON ファイルとして保存するため、ジョブ投入とは別のワーカーからでも
+状態を確認できます。
+
+- キューに積めるジョブ数 (実行中 + 待機中) には上限があり、超えた場合は QueueFullError
+- ジョブごとにタイムアウトを設定でき、超えた場合は JobTimeoutError で打ち切ります
+- プロセスプールのプロセスが異常終了した場合 (BrokenProcessPool)、影響を受けたジョブを
+  failed にして、プロセスプールを作り直します
+
+作成日: 2026-10-16
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import json
+import logging
+import os
+import signal
+import threading
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+# ジョブの状態
+STATUS_QUEUED = 'queued'
+STATUS_RUNNING = 'running'
+STATUS_DONE = 'done'
+STATUS_FAILED = 'failed'
+STATUS_TIMEOUT = 'timeout'
+
+class QueueFullError(Exception):
+    """キューが満杯でジョブを受け付けられない"""
+
+class JobTimeoutError(BaseException):
+    """
+    ジョブの実行時間がタイムアウトを超えた
+
+    処理中の except Exception で握りつぶされないよう、KeyboardInterrupt と同様に
+    BaseException を継承しています。
+    """
+
+def _write_json(path, data):
+    """一時ファイルに書き込んでから置き換える (読み込み側が途中の内容を読まないように)"""
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+def _raise_timeout(signum, frame):
+    raise JobTimeoutError()
+
+def _run_job(job_folder, job_id, timeout, func, args):
+    """
+    プロセスプール側で実行されるジョブ本体
+
+    状態を running に更新し、SIGALRM によるタイムアウトを設定してから func を実行します。
+    """
+    status_path = os.path.join(job_folder, f"{job_id}.json")
+    try:
+        with open(status_path, 'r') as f:
+            status = json.load(f)
+    except (OSError, ValueError):
+        status = {'job_id': job_id}
+    status.update(status=STATUS_RUNNING, started=time.time())
+    _write_json(status_path, status)
+
+    previous_handler = signal.signal(signal.SIGALRM, _raise_timeout)
+    signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        return func(*args)
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous_handler)
+
+class JobQueue:
+    """
+    プロセスプールを使ったジョブキュー
+
+    プロセスプールは最初のジョブ投入時に作成します
+    (gunicorn のワーカーが fork された後に、ワーカーごとに作成するため)。
+    """
+
+    def __init__(self, job_folder, max_workers, max_pending, timeout):
+        """
+        Args:
+            job_folder: ジョブの状態ファイルを保存するディレクトリ
+            max_workers: プロセスプールのプロセス数
+            max_pending: このワーカーで受け付ける最大ジョブ数 (実行中 + 待機中)
+            timeout: ジョブ1件あたりの最大実行秒数
+        """
+        self.job_folder = job_folder
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self._executor = None
+        self._pending = 0
+        self._lock = threading.Lock()
+        os.makedirs(self.job_folder, exist_ok=True)
+
+    def _status_path(self, job_id):
+        return os.path.join(self.job_folder, f"{job_id}.json")
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+            return self._executor
+
+    def _discard_executor(self, executor):
+        """
+        壊れたプロセスプールを破棄する (次のジョブ投入時に作り直す)
+
+        複数のジョブから同時に呼ばれても、作り直した後のプロセスプールは破棄しないよう
+        現在のプロセスプールと同じ場合だけ破棄します。
+        """
+        with self._lock:
+            if self._executor is not executor:
+                return
+            self._executor = None
+        logger.error("プロセスプールのプロセスが異常終了したため、プロセスプールを作り直します")
+        executor.shutdown(wait=False)
+
+    def _submit_to_executor(self, *args):
+        """
+        プロセスプールに投入する
+
+        プロセスプールが壊れていた場合は作り直して1回だけ再投入します。
+
+        Returns:
+            tuple: (投入したプロセスプール, Future)
+        """
+        executor = self._get_executor()
+        try:
+            return executor, executor.submit(*args)
+        except BrokenProcessPool:
+            self._discard_executor(executor)
+        executor = self._get_executor()
+        return executor, executor.submit(*args)
+
+    def pending(self):
+        """このワーカーで実行中・待機中のジョブ数"""
+        with self._lock:
+            return self._pending
+
+    def submit(self, func, *args, info=None):
+        """
+        ジョブを投入する
+
+        Args:
+            func: プロセスプールで実行する関数 (モジュールのトップレベルに定義されたもの)
+            *args: func に渡す引数
+            info: 状態ファイルに一緒に保存する情報 (結果表示用)
+
+        Returns:
+            str: ジョブID
+
+        Raises:
+            QueueFullError: キューが満杯の場合
+        """
+        with self._lock:
+            if self._pending >= self.max_pending:
+                raise QueueFullError()
+            self._pending += 1
+
+        job_id = uuid.uuid4().hex
+        try:
+            _write_json(self._status_path(job_id), {'job_id': job_id,
+                                                    'status': STATUS_QUEUED,
+                                                    'created': time.time(),
+                                                    'info': info or {}})
+            executor, future = self._submit_to_executor(_run_job, self.job_folder, job_id, self.timeout, func, args)
+        except BrokenProcessPool as e:
+            # 作り直したプロセスプールにも投入できなかった場合は、ジョブを失敗として記録する
+            with self._lock:
+                self._pending -= 1
+            logger.error(f"ジョブ投入エラー ({job_id}): {str(e)}")
+            _write_json(self._status_path(job_id), {'job_id': job_id,
+                                                    'status': STATUS_FAILED,
+                                                    'created': time.time(),
+                                                    'finished': time.time(),
+                                                    'info': info or {},
+                                                    'error': str(e)})
+            return job_id
+        except Exception:
+            with self._lock:
+                self._pending -= 1
+            raise
+        future.add_done_callback(lambda f: self._on_done(job_id, executor, f))
+        return job_id
+
+    def _on_done(self, job_id, executor, future):
+        """ジョブ終了時に結果を状態ファイルへ書き込む"""
+        with self._lock:
+            self._pending -= 1
+
+        status = self.status(job_id) or {'job_id': job_id}
+        status['finished'] = time.time()
+        try:
+            status['result'] = future.result()
+            status['status'] = STATUS_DONE
+        except JobTimeoutError:
+            status['status'] = STATUS_TIMEOUT
+            status['error'] = f"処理が{self.timeout}秒以内に終わりませんでした。"
+        except BrokenProcessPool as e:
+            # ワーカープロセスが異常終了した (メモリ不足で強制終了された場合など)
+            logger.error(f"ジョブ実行エラー ({job_id}): {str(e)}")
+            status['status'] = STATUS_FAILED
+            status['error'] = "処理中にワーカープロセスが異常終了しました。"
+            self._discard_executor(executor)
+        except Exception as e:
+            logger.error(f"ジョブ実行エラー ({job_id}): {str(e)}")
+            status['status'] = STATUS_FAILED
+            status['error'] = str(e)
+        try:
+            _write_json(self._status_path(job_id), status)
+        except OSError as e:
+            logger.error(f"ジョブ状態の書き込みエラー ({job_id}): {str(e)}")
+
+    def status(self, job_id):
+        """
+        ジョブの状態を返す
+
+        Returns:
+            dict: 状態ファイルの内容。存在しない場合は None
+        """
+        try:
+            with open(self._status_path(job_id), 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
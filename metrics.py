@@ -0,0 +1,282 @@
+"""
+メトリクス (処理時間のヒストグラムとカウンター) の記録
+
+処理段階ごとの処理時間や、入出力バイト数・キャッシュヒット数などを記録し、
+Prometheus のテキスト形式で出力します。
+
+- 各プロセスは自分の値をメモリ上に持ち、リクエストの終了時などに
+  「<プロセスID>-<識別子>.json」としてディレクトリに書き出します
+- 出力時 (/metrics) は全プロセスのファイルを読み込んで合計するため、
+  どの gunicorn ワーカーにリクエストが届いても全体の値を返します
+- 終了したプロセスのファイルは集計用のファイル (archive.json) に足し込んでから削除するため、
+  ワーカーが入れ替わってもカウンターは減りません
+
+作成日: 2026-10-16
+"""
+
+from contextlib import contextmanager
+import fcntl
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+# 処理時間のヒストグラムの区切り (秒)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+def _labels_key(labels):
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format_labels(labels, extra=()):
+    items = list(labels) + list(extra)
+    if not items:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in items) + '}'
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+class Metrics:
+    """プロセスごとのメトリクスを記録し、全プロセス分を合計して出力する"""
+
+    ARCHIVE_NAME = 'archive.json'
+    LOCK_NAME = '.lock'
+
+    def __init__(self, folder, buckets=DEFAULT_BUCKETS):
+        """
+        Args:
+            folder: プロセスごとのファイルを置くディレクトリ (ワーカー間で共有するパス)
+            buckets: ヒストグラムの区切り (秒)
+        """
+        self.folder = folder
+        self.buckets = tuple(buckets)
+        self._help = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        os.makedirs(self.folder, exist_ok=True)
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._path = os.path.join(self.folder, f"{self._pid}-{uuid.uuid4().hex[:8]}.json")
+        self._counters = {}
+        self._histograms = {}
+        self._dirty = False
+
+    def _check_pid(self):
+        # fork 後の子プロセスは親プロセスの値を引き継がず、自分のファイルに記録する
+        if self._pid != os.getpid():
+            self._reset()
+
+    def describe(self, name, text):
+        """メトリクスの説明 (# HELP の行) を登録する"""
+        self._help[name] = text
+
+    def inc(self, name, value=1, **labels):
+        """カウンターを増やす"""
+        with self._lock:
+            self._check_pid()
+            key = (name, _labels_key(labels))
+            self._counters[key] = self._counters.get(key, 0) + value
+            self._dirty = True
+
+    def observe(self, name, seconds, **labels):
+        """
+        ヒストグラムに処理時間を記録する
+
+        stage ラベルを持つ値は、リクエスト中であれば段階ごとの合計時間にも加えます
+        (遅いリクエストのログ用)。
+        """
+        with self._lock:
+            self._check_pid()
+            key = (name, _labels_key(labels))
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = {'buckets': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    histogram['buckets'][i] += 1
+                    break
+            histogram['sum'] += seconds
+            histogram['count'] += 1
+            self._dirty = True
+
+        stages = getattr(self._local, 'stages', None)
+        if stages is not None and 'stage' in labels:
+            stages[labels['stage']] = stages.get(labels['stage'], 0.0) + seconds
+
+    @contextmanager
+    def timer(self, name, **labels):
+        """with ブロックの処理時間をヒストグラムに記録する"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, **labels)
+
+    def begin_request(self):
+        """このスレッドでの段階ごとの合計時間の記録を開始する"""
+        self._local.stages = {}
+
+    def end_request(self):
+        """
+        段階ごとの合計時間の記録を終了する
+
+        Returns:
+            dict: {段階名: 合計秒数}
+        """
+        stages = getattr(self._local, 'stages', None) or {}
+        self._local.stages = None
+        return stages
+
+    def flush(self):
+        """記録した値をこのプロセスのファイルに書き出す (変更がない場合は何もしない)"""
+        with self._lock:
+            self._check_pid()
+            if not self._dirty:
+                return
+            data = self._snapshot()
+            self._dirty = False
+        tmp_path = f"{self._path}.{uuid.uuid4().hex}.tmp"
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(data, f)
+            os.replace(tmp_path, self._path)
+        except OSError as e:
+            logger.error(f"メトリクス書き込みエラー: {str(e)}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def _snapshot(self):
+        return dict(self._serialize(self._counters, self._histograms), pid=self._pid)
+
+    def _serialize(self, counters, histograms):
+        """ファイルに書き出す形式に変換する"""
+        return {'buckets': list(self.buckets),
+                'counters': [[name, dict(labels), value] for (name, labels), value in counters.items()],
+                'histograms': [[name, dict(labels), h['buckets'], h['sum'], h['count']]
+                               for (name, labels), h in histograms.items()]}
+
+    @staticmethod
+    def _merge(total, data):
+        """data (ファイルの内容) の値を total に足し込む"""
+        for name, labels, value in data.get('counters', []):
+            key = (name, _labels_key(labels))
+            total['counters'][key] = total['counters'].get(key, 0) + value
+        for name, labels, buckets, seconds, count in data.get('histograms', []):
+            key = (name, _labels_key(labels))
+            histogram = total['histograms'].get(key)
+            if histogram is None:
+                histogram = total['histograms'][key] = {'buckets': [0] * len(buckets), 'sum': 0.0, 'count': 0}
+            histogram['buckets'] = [a + b for a, b in zip(histogram['buckets'], buckets)]
+            histogram['sum'] += seconds
+            histogram['count'] += count
+
+    @staticmethod
+    def _read(path):
+        try:
+            with open(path, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def collect(self):
+        """
+        全プロセスの値を合計する
+
+        終了したプロセスのファイルは archive.json に足し込んでから削除します。
+
+        Returns:
+            dict: {'counters': {(名前, ラベル): 値}, 'histograms': {(名前, ラベル): {buckets, sum, count}}}
+        """
+        self.flush()
+        total = {'counters': {}, 'histograms': {}}
+        archive_path = os.path.join(self.folder, self.ARCHIVE_NAME)
+        with open(os.path.join(self.folder, self.LOCK_NAME), 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                archive_total = {'counters': {}, 'histograms': {}}
+                self._merge(archive_total, self._read(archive_path) or {})
+                archived = False
+                for entry in os.scandir(self.folder):
+                    if not entry.name.endswith('.json') or entry.name == self.ARCHIVE_NAME:
+                        continue
+                    data = self._read(entry.path)
+                    if data is None or data.get('buckets') != list(self.buckets):
+                        continue
+                    if data['pid'] != os.getpid() and not _pid_alive(data['pid']):
+                        self._merge(archive_total, data)
+                        os.remove(entry.path)
+                        archived = True
+                    else:
+                        self._merge(total, data)
+                archive = self._serialize(archive_total['counters'], archive_total['histograms'])
+                if archived:
+                    tmp_path = f"{archive_path}.{uuid.uuid4().hex}.tmp"
+                    with open(tmp_path, 'w') as f:
+                        json.dump(archive, f)
+                    os.replace(tmp_path, archive_path)
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+        self._merge(total, archive)
+        return total
+
+    def render(self, gauges=(), counters=()):
+        """
+        全プロセスの値を Prometheus のテキスト形式で返す
+
+        Args:
+            gauges: 出力時に計算する値 (名前, ラベルの辞書, 値) のリスト (ディスク使用量など)
+            counters: 出力時に読み込む累計値 (名前, ラベルの辞書, 値) のリスト
+                      (一時ファイルの削除件数など、プロセスの外で数えているもの)
+        """
+        total = self.collect()
+        for name, labels, value in counters:
+            key = (name, _labels_key(labels))
+            total['counters'][key] = total['counters'].get(key, 0) + value
+        lines = []
+
+        def header(name, kind):
+            if name in self._help:
+                lines.append(f"# HELP {name} {self._help[name]}")
+            lines.append(f"# TYPE {name} {kind}")
+
+        for kind, values in (('counter', total['counters']), ('histogram', total['histograms'])):
+            current = None
+            for name, labels in sorted(values):
+                if name != current:
+                    header(name, kind)
+                    current = name
+                value = values[(name, labels)]
+                if kind == 'counter':
+                    lines.append(f"{name}{_format_labels(labels)} {value}")
+                    continue
+                cumulative = 0
+                for bound, count in zip(self.buckets, value['buckets']):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{_format_labels(labels, [('le', repr(float(bound)))])} {cumulative}")
+                lines.append(f"{name}_bucket{_format_labels(labels, [('le', '+Inf')])} {value['count']}")
+                lines.append(f"{name}_sum{_format_labels(labels)} {value['sum']}")
+                lines.append(f"{name}_count{_format_labels(labels)} {value['count']}")
+
+        current = None
+        for name, labels, value in sorted(gauges, key=lambda g: g[0]):
+            if name != current:
+                header(name, 'gauge')
+                current = name
+            lines.append(f"{name}{_format_labels(_labels_key(labels))} {value}")
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,230 @@
+"""
+知覚ハッシュ (dHash) による似た画像の検索
+
+保存し直した・圧縮し直した・少しだけ切り抜いた画像など、バイト列のハッシュ値では
+別の画像になるものを、見た目の特徴から作る64ビットのハッシュ値で見つけます。
+2つの画像のハッシュ値の異なるビット数 (ハミング距離) が小さいほど似ています。
+
+- dHash: 9x8 のグレースケールに縮小し、横に隣り合う画素の明るさの大小を64ビットに並べたもの
+  (縮小済みの画像から計算できるため、リサイズ処理のついでに求められます)
+- HashIndex: ハッシュ値を SQLite に保存し、16ビットずつ4つに分けた列の索引で検索します
+  (ハミング距離が3以下なら、4つの部分のどれか1つは必ず一致する)。複数のワーカーで共有できます
+- BKTree: メモリ上でハミング距離の近いハッシュ値を検索する木構造 (フォルダ内の画像の重複の一覧に使う)
+
+作成日: 2026-10-17
+"""
+
+from contextlib import closing
+import os
+import sqlite3
+import time
+from PIL import Image, ImageOps
+
+HASH_BITS = 64
+CHUNK_BITS = 16  # 索引に使う部分ハッシュのビット数
+CHUNK_COUNT = HASH_BITS // CHUNK_BITS
+CHUNK_MASK = (1 << CHUNK_BITS) - 1
+ORIENTATION_TAG = 0x0112  # EXIF の向き情報
+HASH_DECODE_SIZE = (64, 64)  # ファイルから計算する場合に draft() で縮小デコードする大きさの目安
+
+def dhash(img):
+    """
+    画像の dHash (64ビットの整数) を計算する
+
+    Args:
+        img: 画像 (縮小済みのものでよい)
+    """
+    small = img.convert('L').resize((9, 8), Image.BOX)
+    pixels = small.tobytes()  # 1画素1バイト (L)
+    value = 0
+    for y in range(8):
+        row = pixels[y * 9:(y + 1) * 9]
+        for x in range(8):
+            value = (value << 1) | (row[x] > row[x + 1])
+    return value
+
+def file_dhash(source, max_pixels=None):
+    """
+    画像ファイルの dHash を計算する
+
+    JPEG は draft() で縮小デコードするため、全画素をデコードするより高速です。
+    アニメーション画像は先頭のフレームで計算します。EXIF の向き情報は反映します (サイズも表示上の向き)。
+
+    Args:
+        source: 画像ファイルのパス、またはファイルオブジェクト (読み込み後に先頭へ戻す)
+        max_pixels: デコードする画素数の上限 (draft() による縮小後の画素数で判定し、超える場合は計算しない)
+
+    Returns:
+        tuple: (dHash (計算しなかった場合は None), 元のサイズ (幅, 高さ))
+    """
+    try:
+        with Image.open(source) as img:
+            size = img.size
+            if img.getexif().get(ORIENTATION_TAG) in (5, 6, 7, 8):
+                size = size[::-1]  # 縦横が入れ替わる向き
+            img.draft('L', HASH_DECODE_SIZE)
+            if max_pixels is not None and img.size[0] * img.size[1] > max_pixels:
+                return None, size
+            return dhash(ImageOps.exif_transpose(img)), size
+    finally:
+        if hasattr(source, 'seek'):
+            source.seek(0)
+
+def hamming(a, b):
+    """2つのハッシュ値のハミング距離 (異なるビット数)"""
+    return bin(a ^ b).count('1')
+
+def split_hash(value):
+    """ハッシュ値を上位から16ビットずつ4つに分ける"""
+    return [(value >> (CHUNK_BITS * (CHUNK_COUNT - 1 - i))) & CHUNK_MASK for i in range(CHUNK_COUNT)]
+
+def join_hash(chunks):
+    """split_hash() で分けたハッシュ値を元に戻す"""
+    value = 0
+    for chunk in chunks:
+        value = (value << CHUNK_BITS) | chunk
+    return value
+
+def format_hash(value):
+    """ハッシュ値を16桁の16進文字列にする"""
+    return f"{value:016x}"
+
+def similar_aspect(size_a, size_b, tolerance):
+    """2つの画像の縦横比の差が tolerance (比率) 以内かどうか"""
+    ratio_a = size_a[0] / size_a[1]
+    ratio_b = size_b[0] / size_b[1]
+    return abs(ratio_a - ratio_b) <= tolerance * max(ratio_a, ratio_b)
+
+class BKTree:
+    """
+    ハミング距離で検索する BK木
+
+    各ノードの子を「親ノードとの距離」ごとに持つため、三角不等式により
+    検索時に距離の範囲外の枝を辿らずに済みます。
+    """
+
+    def __init__(self):
+        self._root = None  # [ハッシュ値, 値のリスト, {距離: 子ノード}]
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def add(self, value, item):
+        """ハッシュ値 value と、それに対応する item を追加する"""
+        self._size += 1
+        if self._root is None:
+            self._root = [value, [item], {}]
+            return
+        node = self._root
+        while True:
+            distance = hamming(value, node[0])
+            if distance == 0:
+                node[1].append(item)
+                return
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = [value, [item], {}]
+                return
+            node = child
+
+    def search(self, value, max_distance):
+        """
+        value とのハミング距離が max_distance 以下の項目を検索する
+
+        Returns:
+            list: (距離, item) のリスト (距離の小さい順)
+        """
+        results = []
+        stack = [self._root] if self._root is not None else []
+        while stack:
+            node = stack.pop()
+            distance = hamming(value, node[0])
+            if distance <= max_distance:
+                results.extend((distance, item) for item in node[1])
+            for child_distance, child in node[2].items():
+                if distance - max_distance <= child_distance <= distance + max_distance:
+                    stack.append(child)
+        results.sort(key=lambda result: result[0])
+        return results
+
+class HashIndex:
+    """
+    SQLite に保存する知覚ハッシュの索引 (複数のワーカー・プロセスで共有できる)
+
+    キー (アップロードされた画像のバイト列のハッシュ値など) ごとに、
+    dHash と元の画像のサイズを保存します。
+    """
+
+    def __init__(self, path, timeout=5.0):
+        """
+        Args:
+            path: SQLite のデータベースファイルのパス
+            timeout: 他のプロセスが書き込み中の場合に待つ最大秒数
+        """
+        self.path = path
+        self.timeout = timeout
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with closing(self._connect()) as conn, conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('CREATE TABLE IF NOT EXISTS hashes ('
+                         'key TEXT PRIMARY KEY, h0 INTEGER, h1 INTEGER, h2 INTEGER, h3 INTEGER, '
+                         'width INTEGER, height INTEGER, updated REAL)')
+            for i in range(CHUNK_COUNT):
+                conn.execute(f'CREATE INDEX IF NOT EXISTS hashes_h{i} ON hashes (h{i})')
+
+    def _connect(self):
+        # 接続は fork したプロセスやスレッドで共有できないため、操作ごとに接続する
+        return sqlite3.connect(self.path, timeout=self.timeout)
+
+    def add(self, key, value, size):
+        """キー key の画像の dHash と元のサイズを登録する (登録済みの場合は更新する)"""
+        with closing(self._connect()) as conn, conn:
+            conn.execute('INSERT OR REPLACE INTO hashes (key, h0, h1, h2, h3, width, height, updated) '
+                         'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                         [key] + split_hash(value) + [size[0], size[1], time.time()])
+
+    def find(self, value, max_distance, exclude_key=None):
+        """
+        ハミング距離が max_distance 以下の画像を検索する
+
+        max_distance が3以下の場合は、4つの部分ハッシュのどれかが一致するものだけを索引で取り出して
+        距離を確認します。それより大きい場合は全件を確認します。
+
+        Returns:
+            list: (距離, キー, 元のサイズ) のリスト (距離の小さい順)
+        """
+        chunks = split_hash(value)
+        with closing(self._connect()) as conn:
+            if max_distance < CHUNK_COUNT:
+                rows = conn.execute('SELECT key, h0, h1, h2, h3, width, height FROM hashes '
+                                    'WHERE h0 = ? OR h1 = ? OR h2 = ? OR h3 = ?', chunks)
+            else:
+                rows = conn.execute('SELECT key, h0, h1, h2, h3, width, height FROM hashes')
+            results = []
+            for key, h0, h1, h2, h3, width, height in rows:
+                distance = hamming(value, join_hash((h0, h1, h2, h3)))
+                if distance <= max_distance and key != exclude_key:
+                    results.append((distance, key, (width, height)))
+        results.sort(key=lambda result: result[0])
+        return results
+
+    def touch(self, key):
+        """キー key の最後に使った時刻を更新する (prune() で削除されないように)"""
+        with closing(self._connect()) as conn, conn:
+            conn.execute('UPDATE hashes SET updated = ? WHERE key = ?', (time.time(), key))
+
+    def prune(self, max_age):
+        """
+        最後の登録・使用から max_age 秒以上経ったものを削除する
+
+        Returns:
+            int: 削除した件数
+        """
+        with closing(self._connect()) as conn, conn:
+            return conn.execute('DELETE FROM hashes WHERE updated < ?', (time.time() - max_age,)).rowcount
+
+    def count(self):
+        """登録されている件数"""
+        with closing(self._connect()) as conn:
+            return conn.execute('SELECT COUNT(*) FROM hashes').fetchone()[0]
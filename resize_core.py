@@ -0,0 +1,454 @@
+"""
+画像のリサイズ処理 (Web サービスとコマンドラインツールで共通)
+
+Web サービス (app.py) と一括リサイズツール (batch_resize.py) が同じ処理を使うための、
+Flask に依存しないリサイズ処理です。import しただけではファイルやフォルダを作成しません。
+
+- JPEG は draft() による縮小デコード、その他は reduce() による前縮小を行ってから LANCZOS で仕上げます
+- 複数の横幅は大きい横幅から順に、1つ前の中間画像から縮小します (カスケード縮小)
+- EXIF の向き情報の反映、回転、帯ごとの縮小 (無圧縮の大きな画像)、アニメーション画像の縮小、
+  目標ファイルサイズに収まる品質の探索を行います
+- 受け付けの上限 (画素数・メモリ)、全体のメモリの上限、メトリクスは Resizer の作成時に指定します
+  (メモリの上限・メトリクスを省略した場合は使用しません)
+
+作成日: 2026-10-17
+"""
+
+from contextlib import nullcontext
+import io
+import logging
+import os
+from PIL import Image
+from admission import AdmissionError, ImageTooLargeError, check_image, check_animation
+from animation import ANIMATION_FORMATS, is_animated, resize_frames
+from encoders import save_image, save_animation, encode_to_size, encode_animation_to_size, DEFAULT_PRESET
+from jpeg_rotate import rotate_jpeg_bytes, LosslessRotationError, METHOD_LOSSLESS, ORIENTATION_TAG
+from perceptual_hash import dhash
+from strip_resize import raw_layout, resize_in_strips, strip_rows
+
+logger = logging.getLogger(__name__)
+
+# 設定の既定値 (Web サービスの値は app.py のグローバル設定を参照)
+DEFAULT_REDUCING_GAP = 3.0  # 最終LANCZOSの前に目標サイズの何倍以上を残すか (3.0以上で厳密リサイズと見分けがつかない)
+DEFAULT_STRIP_MIN_PIXELS = 4 * 1000 * 1000  # この画素数以上の無圧縮の画像だけを帯ごとに縮小する
+DEFAULT_STRIP_HEIGHT = 256  # 1帯あたりの元画像の行数
+DEFAULT_MAX_IMAGE_PIXELS = 50 * 1000 * 1000  # 1枚あたりの画素数の上限
+DEFAULT_MAX_IMAGE_MEMORY = 512 * 1024 * 1024  # 1枚あたりのデコード・縮小に必要なメモリ (見積もり) の上限
+DEFAULT_MAX_ANIMATION_FRAMES = 500  # アニメーション画像のフレーム数の上限
+DEFAULT_MAX_ANIMATION_PIXELS = 200 * 1000 * 1000  # アニメーション画像の全フレームの合計画素数の上限
+
+# メトリクスの名前 (Resizer にメトリクスを指定した場合に記録する)
+METRIC_STAGE_SECONDS = 'image_resize_stage_seconds'
+METRIC_REJECTIONS = 'image_resize_rejections_total'
+METRIC_ERRORS = 'image_resize_errors_total'
+
+# EXIF の向き情報 -> 画素を表示どおりの向きにする変換 (ImageOps.exif_transpose と同じ)
+_ORIENTATION_TRANSPOSE = {2: Image.FLIP_LEFT_RIGHT, 3: Image.ROTATE_180, 4: Image.FLIP_TOP_BOTTOM,
+                          5: Image.TRANSPOSE, 6: Image.ROTATE_270, 7: Image.TRANSVERSE, 8: Image.ROTATE_90}
+
+def format_for_ext(file_ext):
+    """拡張子に対応する PIL の画像形式名を返す (例: '.jpg' -> 'JPEG')"""
+    return Image.registered_extensions().get(file_ext.lower())
+
+def format_label(file_ext):
+    """メトリクスのラベルに使う画像形式名 (例: '.jpg' -> 'jpeg')"""
+    return (format_for_ext(file_ext) or file_ext.lstrip('.') or 'unknown').lower()
+
+def _exif_orientation(img):
+    """EXIF の向き情報 (1〜8) を返す (情報がない・不正な場合は 1)"""
+    try:
+        orientation = img.getexif().get(ORIENTATION_TAG, 1)
+    except Exception:
+        return 1
+    return orientation if orientation in _ORIENTATION_TRANSPOSE else 1
+
+def _orient_pixels(img, orientation):
+    """EXIF の向き情報に従って画素を表示どおりの向きにする (保存時に EXIF は引き継がないため)"""
+    transpose = _ORIENTATION_TRANSPOSE.get(orientation)
+    return img.transpose(transpose) if transpose is not None else img
+
+def _rotate_pixels(img, rotate):
+    """画像を時計回りに rotate 度 (0/90/180/270) 回転させる (画素の並べ替えのみ)"""
+    transpose = {90: Image.ROTATE_270, 180: Image.ROTATE_180, 270: Image.ROTATE_90}.get(rotate)
+    return img.transpose(transpose) if transpose is not None else img
+
+def _read_input_bytes(input_path):
+    """入力画像 (パスまたはファイルオブジェクト) の内容を読み込む"""
+    if hasattr(input_path, 'read'):
+        input_path.seek(0)
+        return input_path.read()
+    with open(input_path, 'rb') as f:
+        return f.read()
+
+def _target_size_message(message, max_bytes, quality, size, fits):
+    """目標ファイルサイズを指定した場合は、使用した品質と出力サイズをメッセージに追加する"""
+    if max_bytes is None:
+        return message
+    detail = f"品質{quality}、{size / 1024:.0f}KB" if quality is not None else f"{size / 1024:.0f}KB"
+    if fits:
+        return f"{message} ({detail})"
+    return f"{message} 目標の{max_bytes / 1024:.0f}KB には収まりませんでした ({detail})"
+
+class Resizer:
+    """
+    リサイズ処理の設定と、受け付けの上限・メモリの上限・メトリクスをまとめたもの
+
+    メモリの上限・メトリクスを指定しない場合は pickle できるため、プロセスプールにそのまま渡せます。
+    """
+
+    def __init__(self, fast_downscale=True, reducing_gap=DEFAULT_REDUCING_GAP,
+                 strip_resize=True, strip_min_pixels=DEFAULT_STRIP_MIN_PIXELS, strip_height=DEFAULT_STRIP_HEIGHT,
+                 max_image_pixels=DEFAULT_MAX_IMAGE_PIXELS, max_image_memory=DEFAULT_MAX_IMAGE_MEMORY,
+                 max_animation_frames=DEFAULT_MAX_ANIMATION_FRAMES, max_animation_pixels=DEFAULT_MAX_ANIMATION_PIXELS,
+                 memory_budget=None, metrics=None):
+        """
+        Args:
+            fast_downscale: False の場合は高速縮小を行わず従来の厳密なリサイズ (全画素デコード + LANCZOS) を行う
+            reducing_gap: 高速縮小で最終LANCZOSの前に目標サイズの何倍以上を残すか
+            strip_resize: False の場合は帯ごとの縮小を行わない
+            strip_min_pixels: 帯ごとに縮小する画像の画素数の下限
+            strip_height: 1帯あたりの元画像の行数
+            max_image_pixels: 1枚あたりの画素数の上限 (JPEGは draft() による縮小後の画素数で判定)
+            max_image_memory: 1枚あたりのデコード・縮小に必要なメモリ (見積もり) の上限 (バイト)
+            max_animation_frames: アニメーション画像のフレーム数の上限
+            max_animation_pixels: アニメーション画像の全フレームの合計画素数の上限
+            memory_budget: 同時に使うメモリの上限 (admission.MemoryBudget / SharedMemoryBudget、None の場合は制限しない)
+            metrics: 処理時間・エラー数を記録する metrics.Metrics (None の場合は記録しない)
+        """
+        self.fast_downscale = fast_downscale
+        self.reducing_gap = reducing_gap
+        self.strip_resize = strip_resize
+        self.strip_min_pixels = strip_min_pixels
+        self.strip_height = strip_height
+        self.max_image_pixels = max_image_pixels
+        self.max_image_memory = max_image_memory
+        self.max_animation_frames = max_animation_frames
+        self.max_animation_pixels = max_animation_pixels
+        self.memory_budget = memory_budget
+        self.metrics = metrics
+
+    def _timer(self, stage, format):
+        """段階ごとの処理時間を記録する (メトリクスを指定しない場合は何もしない)"""
+        if self.metrics is None:
+            return nullcontext()
+        return self.metrics.timer(METRIC_STAGE_SECONDS, stage=stage, format=format)
+
+    def _inc(self, name, **labels):
+        if self.metrics is not None:
+            self.metrics.inc(name, **labels)
+
+    def _reserve(self, estimate):
+        """必要なメモリを予約する (メモリの上限を指定しない場合は何もしない)"""
+        if self.memory_budget is None:
+            return nullcontext()
+        return self.memory_budget.reserve(estimate)
+
+    def prepare_downscale(self, img, new_size):
+        """
+        高速縮小の前処理を行う
+
+        JPEGの場合は draft() でDCT領域の縮小 (1/2, 1/4, 1/8) を指定し、
+        デコード時点で画素数を減らします。縮小後も目標サイズの
+        reducing_gap 倍以上の解像度が残るよう、縮小率は抑えます。
+
+        Args:
+            img: Image.open() で開いた (まだデコードしていない) 画像
+            new_size: 最終的なサイズ (幅, 高さ)
+
+        Returns:
+            tuple: 元画像の座標系に対応する領域 (resize の box 引数に渡す)
+        """
+        box = (0, 0) + img.size
+        if img.format == 'JPEG':
+            gap = self.reducing_gap
+            requested_size = (int(new_size[0] * gap), int(new_size[1] * gap))
+            draft_result = img.draft(img.mode, requested_size)
+            if draft_result is not None:
+                box = draft_result[1]
+        return box
+
+    def _decode(self, img):
+        """全画素をデコードし、処理時間を記録する (デコード済みの場合は何もしない)"""
+        if img.tile:
+            with self._timer('decode', (img.format or 'unknown').lower()):
+                img.load()
+
+    def _write_output_bytes(self, output, data):
+        """出力先 (パスまたはファイルオブジェクト) にデータを書き込む"""
+        if hasattr(output, 'write'):
+            output.write(data)
+        else:
+            with self._timer('write', format_label(os.path.splitext(output)[1])):
+                with open(output, 'wb') as f:
+                    f.write(data)
+
+    def save_image(self, img, output, output_format=None, preset=DEFAULT_PRESET, encoder_options=None, max_bytes=None):
+        """
+        出力形式とプリセットに応じた保存設定で画像を保存する
+
+        max_bytes を指定した場合は、メモリ上でエンコードを繰り返して
+        目標ファイルサイズに収まる最高の品質を探してから書き込みます。
+
+        Args:
+            img: 保存する画像
+            output: 出力画像ファイルのパス、またはファイルオブジェクト
+            output_format: 画像形式 (ファイルオブジェクトの場合は必須、省略時はパスの拡張子から判定)
+            preset: エンコーダーのプリセット名 ('fast' / 'balanced' / 'smallest')
+            encoder_options: プリセットに追加する保存設定 (例: プログレッシブJPEGの {'progressive': True})
+            max_bytes: 目標ファイルサイズ (バイト)
+
+        Returns:
+            tuple: (使用した品質, 出力サイズ, 目標サイズに収まったかどうか)
+                   目標ファイルサイズを指定しない場合、品質は None
+        """
+        if output_format is None:
+            output_format = format_for_ext(os.path.splitext(output)[1])
+        with self._timer('encode', output_format.lower()):
+            if max_bytes is None and hasattr(output, 'write'):
+                return None, save_image(img, output, output_format, preset, encoder_options), True
+            if max_bytes is None:
+                # エンコードとディスクへの書き込みの時間を分けて記録するため、メモリ上にエンコードする
+                buffer = io.BytesIO()
+                save_image(img, buffer, output_format, preset, encoder_options)
+                data, quality, fits = buffer.getbuffer(), None, True
+            else:
+                data, quality, fits = encode_to_size(img, output_format, max_bytes, preset, encoder_options)
+        self._write_output_bytes(output, data)
+        return quality, len(data), fits
+
+    def _resize_animation(self, img, ordered, sizes, output_format, rotate, preset, encoder_options, max_bytes):
+        """
+        アニメーション画像を1フレームずつデコード・縮小し、横幅ごとにアニメーションのまま保存する
+
+        元の画像のフレームは1フレームずつ処理するため、フレーム数が多くても全フレームを同時には保持しません。
+        縮小後のフレームは全ての横幅の全フレーム分を保持し (エンコーダーが全フレームを必要とし、
+        目標ファイルサイズの探索では繰り返しエンコードするため)、横幅ごとに保存し終えたものから解放します。
+        この分は admission.check_animation の見積もりに含まれ、メモリの上限で制限されます。
+        目標ファイルサイズを指定した場合は、静止画と同じように収まる最高の品質を探します
+        (GIF は品質で調整できないため、収まったかどうかだけを判定します)。
+
+        Args:
+            img: Image.open() で開いたアニメーション画像
+            ordered: (横幅, 出力先) のリスト (大きい横幅から順)
+            sizes: ordered と同じ順の縮小後のサイズのリスト
+            その他の引数は resize_multi と同じ
+
+        Returns:
+            list: 横幅ごとの結果 (resize_multi と同じ形式の辞書) のリスト
+        """
+        original_width = img.size[0]
+        input_format = (img.format or 'unknown').lower()
+        frames = [[] for _ in ordered]
+        durations, disposals = [], []
+        for resized, duration, disposal in resize_frames(img, sizes):
+            with self._timer('resize', input_format):
+                for i, frame in enumerate(resized):
+                    frames[i].append(_rotate_pixels(frame, rotate))
+            durations.append(duration)
+            disposals.append(disposal)
+
+        renditions = []
+        for i, ((max_width, output_path), (new_width, new_height)) in enumerate(zip(ordered, sizes)):
+            # 保存し終えた横幅のフレームは次の横幅のエンコード中に保持しない
+            output_frames, frames[i] = frames[i], None
+            target_format = output_format or format_for_ext(os.path.splitext(output_path)[1])
+            with self._timer('encode', target_format.lower()):
+                if max_bytes is None:
+                    buffer = io.BytesIO()
+                    save_animation(output_frames, buffer, target_format, durations, disposals, img.info.get('loop'),
+                                   preset, encoder_options)
+                    data, quality, fits = buffer.getbuffer(), None, True
+                else:
+                    data, quality, fits = encode_animation_to_size(output_frames, target_format, max_bytes, durations,
+                                                                   disposals, img.info.get('loop'), preset,
+                                                                   encoder_options)
+            self._write_output_bytes(output_path, data)
+            message = f"横幅は既に{max_width}px以下です。" if original_width <= max_width else "リサイズが完了しました。"
+            renditions.append({'max_width': max_width,
+                               'output_path': output_path,
+                               'new_size': (new_height, new_width) if rotate in (90, 270) else (new_width, new_height),
+                               'message': _target_size_message(f"{message} ({len(durations)}フレーム)", max_bytes,
+                                                               quality, len(data), fits),
+                               'quality': quality})
+        return renditions
+
+    def resize_multi(self, input_path, targets, exact=None, output_format=None, rotate=0, rotate_method=METHOD_LOSSLESS,
+                     preset=DEFAULT_PRESET, encoder_options=None, max_bytes=None):
+        """
+        1回のデコードで複数の横幅の画像を生成する
+
+        大きい横幅から順に処理し、各横幅の画像は1つ前 (1段大きい) の
+        中間画像から縮小します (カスケード縮小)。
+        exact=True の場合は、各横幅をそれぞれ元画像から縮小します。
+
+        Args:
+            input_path: 入力画像ファイルのパス、またはファイルオブジェクト
+            targets: (最大横幅, 出力画像ファイルのパス) のリスト
+                     出力先にはファイルオブジェクト (io.BytesIO など) も指定できます
+            exact: True の場合は高速縮小を行わず従来の厳密なリサイズを行う
+                   (None の場合は fast_downscale の設定に従う)
+            output_format: 出力する画像形式 (例: 'JPEG')。省略時は出力先の拡張子から判定します
+                           (出力先がファイルオブジェクトの場合は必須)
+            rotate: 時計回りの回転角度 (0/90/180/270)
+                    リサイズした画像は縮小後に回転させます。リサイズしないJPEGは
+                    rotate_method ('lossless' または 'exif') で再エンコードせずに回転させます。
+            rotate_method: リサイズしないJPEGの回転方法
+            preset: エンコーダーのプリセット名 ('fast' / 'balanced' / 'smallest')
+            encoder_options: プリセットに追加する保存設定 (例: {'progressive': True})
+            max_bytes: 目標ファイルサイズ (バイト)。指定した場合は、縮小済みの画像を
+                       メモリ上でエンコードし直して収まる最高の品質を探します
+
+        Returns:
+            tuple: (成功フラグ, メッセージ, 元のサイズ, 横幅ごとの結果のリスト)
+                   横幅ごとの結果は max_width, output_path, new_size, message, quality, dhash を持つ辞書
+                   (quality は目標ファイルサイズを指定した場合に使用した品質、それ以外は None。
+                    dhash は最も小さい縮小後の画像から計算した知覚ハッシュで全ての横幅で同じ値、アニメーション画像は None)
+
+        Raises:
+            ImageTooLargeError: 画素数、または必要なメモリが1枚あたりの上限を超えている場合
+            MemoryBudgetExceeded: メモリの上限に達しており、待っても空かなかった場合
+        """
+        if exact is None:
+            exact = not self.fast_downscale
+
+        input_format = 'unknown'
+        try:
+            with Image.open(input_path) as img:
+                input_format = (img.format or 'unknown').lower()
+                animated = is_animated(img) and all(
+                    (output_format or format_for_ext(os.path.splitext(output_path)[1])) in ANIMATION_FORMATS
+                    for _, output_path in targets)
+
+                # 横幅・サイズは EXIF の向き情報を反映した表示上の向きで扱う
+                # (縮小は保存されている画素の向きのまま行い、縮小後の小さい画像を表示どおりの向きにする)
+                orientation = 1 if animated else _exif_orientation(img)
+                swapped = orientation in (5, 6, 7, 8)
+                original_width, original_height = img.size[::-1] if swapped else img.size
+                original_size = (original_width, original_height)
+
+                def pixel_size(size):
+                    """表示上のサイズを、保存されている画素の向きのサイズにする"""
+                    return size[::-1] if swapped else size
+
+                # 大きい横幅から順に処理する
+                ordered = sorted(targets, key=lambda t: t[0], reverse=True)
+                output_sizes = [(min(w, original_width), int(original_height * min(w, original_width) / original_width))
+                                for w, _ in ordered]
+
+                # アニメーション画像は、アニメーションのまま保存できる形式であればフレームごとに縮小する
+                if animated:
+                    estimate = check_animation(img, output_sizes, self.max_animation_frames, self.max_animation_pixels,
+                                               self.max_image_memory)
+                    with self._reserve(estimate):
+                        renditions = self._resize_animation(img, ordered, output_sizes, output_format, rotate, preset,
+                                                            encoder_options, max_bytes)
+                    for r in renditions:
+                        r['dhash'] = None
+                    order = {output_path: i for i, (_, output_path) in enumerate(targets)}
+                    renditions.sort(key=lambda r: order[r['output_path']])
+                    return True, "リサイズが完了しました。", original_size, renditions
+
+                needs_resize = [w for w, _ in ordered if w < original_width]
+
+                # 元サイズのまま保存する横幅がなければ、最大の横幅に合わせて前縮小する
+                box = (0, 0) + img.size
+                if not exact and needs_resize and len(needs_resize) == len(ordered):
+                    largest = needs_resize[0]
+                    box = self.prepare_downscale(img, pixel_size((largest, int(original_height * largest / original_width))))
+
+                # 無圧縮の大きな画像は、全体をデコードせずに帯ごとに読み込んで最大の横幅に縮小する
+                # (元サイズのまま保存する横幅がある場合は全体のデコードが必要なため対象外)
+                strips = (self.strip_resize and orientation == 1 and needs_resize and len(needs_resize) == len(ordered)
+                          and original_width * original_height >= self.strip_min_pixels and raw_layout(img) is not None)
+                decoded_size = ((original_width, strip_rows(original_size, output_sizes[0], self.strip_height))
+                                if strips else None)
+
+                # デコード前にヘッダーの情報 (サイズと画像モード) から必要なメモリを見積もり、
+                # 上限を超える画像は受け付けない。全体の上限に達している場合は空くまで待つ
+                estimate = check_image(img, output_sizes, self.max_image_pixels, self.max_image_memory, decoded_size)
+                with self._reserve(estimate):
+                    source = img
+                    renditions = []
+                    for max_width, output_path in ordered:
+                        # 既に指定幅以下の場合はリサイズしない
+                        if original_width <= max_width:
+                            copied = False
+                            saved = (None, 0, True)
+                            target_format = output_format or format_for_ext(os.path.splitext(output_path)[1])
+                            if rotate and img.format == 'JPEG' and target_format == 'JPEG' and not encoder_options:
+                                # 再エンコードせずに回転 (DCT係数の並べ替え、またはEXIFの向き情報の書き換え)
+                                try:
+                                    data, _ = rotate_jpeg_bytes(_read_input_bytes(input_path), rotate, rotate_method)
+                                    # 目標ファイルサイズに収まらない場合は品質を下げて再エンコードする
+                                    if max_bytes is None or len(data) <= max_bytes:
+                                        self._write_output_bytes(output_path, data)
+                                        saved = (None, len(data), True)
+                                        copied = True
+                                except LosslessRotationError as e:
+                                    logger.info(f"無劣化回転ができないため画素を回転します: {str(e)}")
+                            if not copied:
+                                # 元の画像をそのままコピー (出力形式が異なる場合は変換)
+                                self._decode(img)
+                                saved = self.save_image(_rotate_pixels(_orient_pixels(img, orientation), rotate),
+                                                        output_path, output_format, preset, encoder_options, max_bytes)
+                            renditions.append({'max_width': max_width,
+                                               'output_path': output_path,
+                                               'new_size': original_size[::-1] if rotate in (90, 270) else original_size,
+                                               'message': _target_size_message(f"横幅は既に{max_width}px以下です。",
+                                                                               max_bytes, *saved),
+                                               'quality': saved[0]})
+                            continue
+
+                        # アスペクト比を維持してリサイズ (縮小は保存されている画素の向きで行う)
+                        new_width = max_width
+                        new_height = int(original_height * max_width / original_width)
+                        resize_size = pixel_size((new_width, new_height))
+
+                        # リサイズ実行
+                        if not strips:
+                            self._decode(img)
+                        with self._timer('resize', input_format):
+                            if strips and source is img:
+                                # 帯ごとに読み込んで縮小する (画像全体はデコードしない)
+                                resized_img = resize_in_strips(img, input_path, resize_size, self.strip_height)
+                            elif exact:
+                                resized_img = img.resize(resize_size, Image.LANCZOS)
+                            elif source is img:
+                                # DCT領域の縮小 + reduce() による前縮小を行ってから LANCZOS で仕上げる
+                                resized_img = img.resize(resize_size, Image.LANCZOS,
+                                                         box=box, reducing_gap=self.reducing_gap)
+                            else:
+                                # 1段大きい中間画像から縮小する
+                                resized_img = source.resize(resize_size, Image.LANCZOS)
+
+                        # 向きの反映と回転は縮小後の小さい画像に対して行う (カスケードの元画像は回転させない)
+                        saved = self.save_image(_rotate_pixels(_orient_pixels(resized_img, orientation), rotate),
+                                                output_path, output_format, preset, encoder_options, max_bytes)
+                        source = resized_img
+                        renditions.append({'max_width': max_width,
+                                           'output_path': output_path,
+                                           'new_size': (new_height, new_width) if rotate in (90, 270) else (new_width, new_height),
+                                           'message': _target_size_message("リサイズが完了しました。", max_bytes, *saved),
+                                           'quality': saved[0]})
+
+                    # 似た画像の検索に使う知覚ハッシュを、最も小さい縮小後の画像 (表示上の向き、回転前) から計算する
+                    image_hash = dhash(_orient_pixels(source, orientation))
+                    for r in renditions:
+                        r['dhash'] = image_hash
+
+                    # 呼び出し元の指定順に並べ直す
+                    order = {output_path: i for i, (_, output_path) in enumerate(targets)}
+                    renditions.sort(key=lambda r: order[r['output_path']])
+                    return True, "リサイズが完了しました。", original_size, renditions
+
+        except Image.DecompressionBombError as e:
+            self._inc(METRIC_REJECTIONS, reason=ImageTooLargeError.reason)
+            raise ImageTooLargeError(f"画像が大きすぎます: {str(e)}")
+        except AdmissionError as e:
+            # 受け付けなかった場合は呼び出し元で応答を変えられるよう、そのまま送出する
+            self._inc(METRIC_REJECTIONS, reason=e.reason)
+            raise
+        except Exception as e:
+            # ログの出力は呼び出し元に任せる (コマンドラインツールはエラーを集めて最後に表示する)
+            self._inc(METRIC_ERRORS, format=input_format)
+            return False, f"画像処理中にエラーが発生しました: {str(e)}", None, []
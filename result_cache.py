@@ -0,0 +1,214 @@
+"""
+リサイズ結果キャッシュ
+
+アップロードされた画像のハッシュ値とリサイズ条件 (横幅・形式・品質など) を
+キーとして、生成済みの画像をディスク上に保存します。
+同じ画像が同じ条件で再度アップロードされた場合は、デコードやリサイズを
+行わずに保存済みの画像を返します。
+
+- キャッシュディレクトリは複数の gunicorn ワーカーで共有できます
+  (書き込みは一時ファイル + os.replace による置き換え、削除は flock で排他)
+- 合計サイズと最終利用からの経過時間で古いものから削除 (LRU) します
+
+作成日: 2026-10-16
+"""
+
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+HASH_CHUNK_SIZE = 64 * 1024  # ストリーミングハッシュの読み込み単位
+
+def new_hasher():
+    """アップロードデータのハッシュ計算に使うハッシュオブジェクトを返す"""
+    return hashlib.sha256()
+
+def make_cache_key(content_hash, **params):
+    """
+    画像のハッシュ値とリサイズ条件からキャッシュキーを作成する
+
+    Args:
+        content_hash: アップロードされた画像データのハッシュ値 (16進文字列)
+        **params: 出力結果に影響するリサイズ条件 (横幅・拡張子・品質など)
+
+    Returns:
+        str: キャッシュキー (16進文字列)
+    """
+    param_text = ';'.join(f"{name}={params[name]}" for name in sorted(params))
+    return hashlib.sha256(f"{content_hash}:{param_text}".encode('utf-8')).hexdigest()
+
+def link_or_copy(src, dst):
+    """ハードリンクを作成し、できない場合 (別のファイルシステムなど) はコピーする"""
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copyfile(src, dst)
+
+class ResultCache:
+    """
+    ディスク上のリサイズ結果キャッシュ
+
+    エントリは「<キー><拡張子>」の画像ファイルと「<キー>.json」のメタデータで
+    構成されます。ヒット時にメタデータの更新時刻を現在時刻にすることで、
+    最終利用時刻として扱います (画像ファイルはダウンロード用のファイルとハードリンクで
+    共有されるため、更新時刻を変更しない)。
+    """
+
+    META_SUFFIX = '.json'
+    LOCK_NAME = '.lock'
+    TMP_PREFIX = '.tmp-'
+
+    def __init__(self, root, max_bytes, max_age, evict_interval=60):
+        """
+        Args:
+            root: キャッシュディレクトリ (ワーカー間で共有するパス)
+            max_bytes: キャッシュ全体の最大バイト数
+            max_age: 最終利用から削除までの秒数
+            evict_interval: 書き込み時に削除処理を行う最短間隔 (秒)
+        """
+        self.root = root
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.evict_interval = evict_interval
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._last_evict = 0.0
+        self._lock = threading.Lock()
+        os.makedirs(self.root, exist_ok=True)
+
+    def _paths(self, key, ext):
+        base = os.path.join(self.root, key)
+        return base + ext, base + self.META_SUFFIX
+
+    def get(self, key, ext):
+        """
+        キャッシュを検索する
+
+        Returns:
+            tuple: ヒットした場合は (画像ファイルのパス, メタデータ)、ミスの場合は None
+        """
+        data_path, meta_path = self._paths(key, ext)
+        try:
+            with open(meta_path, 'r') as f:
+                meta = json.load(f)
+            # 最終利用時刻を更新 (LRU)。画像ファイルはダウンロード用のファイルと共有しているため、
+            # 更新時刻を変えると Last-Modified や ETag、一時ファイルの保存期間まで変わってしまう
+            os.utime(meta_path)
+            if not os.path.exists(data_path):
+                raise FileNotFoundError(data_path)
+        except (OSError, ValueError):
+            # 未登録、または他のワーカーによって削除された
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return data_path, meta
+
+    def put(self, key, ext, src_path, meta):
+        """
+        生成した画像をキャッシュに登録する
+
+        画像ファイルを先に置き換えてからメタデータを書き込むため、
+        メタデータが読める時点で画像ファイルは必ず揃っています。
+        """
+        data_path, meta_path = self._paths(key, ext)
+        tmp_base = os.path.join(self.root, f"{self.TMP_PREFIX}{uuid.uuid4().hex}")
+        try:
+            link_or_copy(src_path, tmp_base + ext)
+            os.replace(tmp_base + ext, data_path)
+            with open(tmp_base + self.META_SUFFIX, 'w') as f:
+                json.dump(meta, f)
+            os.replace(tmp_base + self.META_SUFFIX, meta_path)
+        except OSError as e:
+            logger.error(f"キャッシュ書き込みエラー: {str(e)}")
+            for path in (tmp_base + ext, tmp_base + self.META_SUFFIX):
+                if os.path.exists(path):
+                    os.remove(path)
+            return
+
+        if time.time() - self._last_evict >= self.evict_interval:
+            self.evict()
+
+    def evict(self):
+        """
+        期限切れのエントリを削除し、合計サイズが上限を超えていれば古いものから削除する
+
+        他のワーカーが削除処理中の場合は何もしません。
+
+        Returns:
+            int: 削除したエントリ数
+        """
+        self._last_evict = time.time()
+        with open(os.path.join(self.root, self.LOCK_NAME), 'w') as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return 0
+            try:
+                return self._evict_locked()
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _evict_locked(self):
+        now = time.time()
+        entries = {}  # キー -> [最終利用時刻, バイト数, パスのリスト]
+        for entry in os.scandir(self.root):
+            if not entry.is_file() or entry.name == self.LOCK_NAME:
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            if entry.name.startswith(self.TMP_PREFIX):
+                # 書き込み途中で異常終了した一時ファイル
+                if now - stat.st_mtime > self.max_age:
+                    self._remove(entry.path)
+                continue
+            key, ext = os.path.splitext(entry.name)
+            item = entries.setdefault(key, [0.0, 0, []])
+            if ext == self.META_SUFFIX:
+                item[0] = stat.st_mtime
+            elif not any(path.endswith(self.META_SUFFIX) for path in item[2]):
+                # メタデータがまだない (書き込み途中の) エントリは画像ファイルの更新時刻を使う
+                item[0] = max(item[0], stat.st_mtime)
+            item[1] += stat.st_size
+            item[2].append(entry.path)
+
+        total_bytes = sum(item[1] for item in entries.values())
+        removed = 0
+        for key, (last_used, size, paths) in sorted(entries.items(), key=lambda kv: kv[1][0]):
+            if now - last_used <= self.max_age and total_bytes <= self.max_bytes:
+                break
+            # メタデータを先に削除して、ヒットしないようにしてから画像を削除する
+            for path in sorted(paths, key=lambda p: not p.endswith(self.META_SUFFIX)):
+                self._remove(path)
+            total_bytes -= size
+            removed += 1
+
+        if removed:
+            with self._lock:
+                self.evictions += removed
+            logger.info(f"キャッシュから {removed} 件削除しました (残り {total_bytes} bytes)")
+        return removed
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def stats(self):
+        """このプロセスでのヒット数・ミス数・削除数を返す"""
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions}
@@ -0,0 +1,192 @@
+"""
+一時ファイルの定期削除 (ジャニター)
+
+アップロード・ダウンロード用のディレクトリを定期的に走査し、
+保存期間 (TTL) を過ぎたファイルと、合計サイズの上限を超えた分のファイルを
+古いものから削除します。
+
+- ファイルの新しさは、更新時刻 (mtime) と inode の変更時刻 (ctime) の新しい方で判定します。
+  リサイズ結果キャッシュからハードリンクで渡したダウンロード用ファイルは、更新時刻がキャッシュに
+  登録した時点のままですが、リンクを作成した時点で ctime が更新されるため、渡した時刻から保存期間を数えます
+
+- 削除処理はバックグラウンドのスレッドで行い、リクエスト処理を止めません
+- 複数の gunicorn ワーカーが同じディレクトリを共有していても、
+  flock により同時に削除処理を行うのは1プロセスだけです
+- 直近の削除処理の結果 (使用バイト数・削除件数・所要時間) は JSON ファイルに保存し、
+  どのワーカーからでも参照できます
+
+作成日: 2026-10-16
+"""
+
+from collections import namedtuple
+import fcntl
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+# 削除ルール
+#   name: 表示名
+#   folder: 対象ディレクトリ
+#   ttl: 最終更新 (またはハードリンクの作成) からの保存秒数 (None の場合は期限なし)
+#   max_bytes: 合計サイズの上限 (None の場合は上限なし)
+SweepRule = namedtuple('SweepRule', ['name', 'folder', 'ttl', 'max_bytes'])
+
+class StorageJanitor:
+    """一時ファイルを定期的に削除するバックグラウンドスレッド"""
+
+    LOCK_NAME = '.janitor.lock'
+    STATS_NAME = '.janitor.json'
+
+    def __init__(self, root, rules, interval, extra_sweeps=()):
+        """
+        Args:
+            root: ロックファイルと統計ファイルを置くディレクトリ
+            rules: SweepRule のリスト
+            interval: 削除処理の間隔 (秒)
+            extra_sweeps: 削除処理のたびに呼び出す関数 (キャッシュの削除処理など)
+        """
+        self.root = root
+        self.rules = list(rules)
+        self.interval = interval
+        self.extra_sweeps = list(extra_sweeps)
+        self._thread = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+        self._stop = threading.Event()
+        os.makedirs(self.root, exist_ok=True)
+        for rule in self.rules:
+            os.makedirs(rule.folder, exist_ok=True)
+
+    def start(self):
+        """
+        削除処理のスレッドを開始する (既に開始している場合は何もしない)
+
+        fork 後の子プロセスにはスレッドが引き継がれないため、プロセスIDが
+        変わっていれば新しくスレッドを開始します。
+        """
+        if self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='storage-janitor', daemon=True)
+            self._thread.start()
+            self._pid = os.getpid()
+
+    def stop(self):
+        """削除処理のスレッドを停止する"""
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.sweep()
+            except Exception as e:
+                logger.error(f"一時ファイル削除エラー: {str(e)}")
+            self._stop.wait(self.interval)
+
+    def sweep(self):
+        """
+        全てのルールに従って削除処理を行う
+
+        他のプロセスが削除処理中の場合は何もしません。
+
+        Returns:
+            dict: 削除処理の結果。他のプロセスが処理中の場合は None
+        """
+        with open(os.path.join(self.root, self.LOCK_NAME), 'w') as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return None
+            try:
+                return self._sweep_locked()
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _sweep_locked(self):
+        started = time.time()
+        previous = self.stats() or {}
+        folders = {}
+        evicted_total = 0
+        for rule in self.rules:
+            bytes_used, files, evicted = self._sweep_folder(rule, started)
+            evicted_total += evicted
+            folders[rule.name] = {'bytes_used': bytes_used,
+                                  'files': files,
+                                  'files_evicted': previous.get('folders', {}).get(rule.name, {}).get('files_evicted', 0) + evicted}
+        for extra_sweep in self.extra_sweeps:
+            extra_sweep()
+
+        duration = time.time() - started
+        stats = {'last_sweep': started,
+                 'sweep_duration_seconds': duration,
+                 'sweeps': previous.get('sweeps', 0) + 1,
+                 'bytes_used': sum(f['bytes_used'] for f in folders.values()),
+                 'files_evicted': previous.get('files_evicted', 0) + evicted_total,
+                 'folders': folders}
+        self._write_stats(stats)
+        if evicted_total:
+            logger.info(f"一時ファイルを {evicted_total} 件削除しました ({duration:.3f}秒)")
+        return stats
+
+    def _sweep_folder(self, rule, now):
+        """
+        1つのディレクトリの削除処理を行う
+
+        Returns:
+            tuple: (削除後の合計バイト数, 削除後のファイル数, 削除したファイル数)
+        """
+        files = []
+        for entry in os.scandir(rule.folder):
+            try:
+                if entry.is_file(follow_symlinks=False):
+                    stat = entry.stat(follow_symlinks=False)
+                    # ハードリンクの作成 (キャッシュからダウンロード用に渡した時刻) は ctime に記録される
+                    files.append((max(stat.st_mtime, stat.st_ctime), stat.st_size, entry.path))
+            except FileNotFoundError:
+                continue
+
+        files.sort()
+        total_bytes = sum(size for _, size, _ in files)
+        remaining = len(files)
+        evicted = 0
+        for last_used, size, path in files:
+            expired = rule.ttl is not None and now - last_used > rule.ttl
+            over_quota = rule.max_bytes is not None and total_bytes > rule.max_bytes
+            if not expired and not over_quota:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total_bytes -= size
+            remaining -= 1
+            evicted += 1
+        return total_bytes, remaining, evicted
+
+    def _write_stats(self, stats):
+        path = os.path.join(self.root, self.STATS_NAME)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(stats, f)
+        os.replace(tmp_path, path)
+
+    def stats(self):
+        """
+        直近の削除処理の結果を返す
+
+        Returns:
+            dict: 削除処理の結果。まだ一度も実行されていない場合は None
+        """
+        try:
+            with open(os.path.join(self.root, self.STATS_NAME), 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
@@ -0,0 +1,150 @@
+"""
+大きな画像の帯 (ストリップ) ごとのリサイズ
+
+無圧縮の画像 (BMPなど) は、画像全体をデコードせずに数百行ずつ読み込んで縮小し、
+縮小後の画像に貼り付けます。メモリ使用量は画像全体の画素数ではなく「帯の高さ × 横幅」に比例します。
+
+- 入力がファイルのパス、またはディスク上のファイルオブジェクトの場合はメモリマップで読み込みます
+  (アップロードの SpooledTemporaryFile はディスクに書き出された後だけ対象で、メモリ上にある間はシークして読み込みます)
+- LANCZOS は上下の数行も参照するため、帯の上下に縮小率に応じた行を余分に読み込みます。
+  結果は画像全体を一度に縮小した場合と同じです (浮動小数点の丸めにより一部の画素で ±1 の差が出ることがあります)
+- JPEG は Pillow で行単位のデコードができないため対象外です (draft() による縮小デコードを使ってください)
+
+作成日: 2026-10-16
+"""
+
+from contextlib import contextmanager
+import math
+import mmap
+import tempfile
+from PIL import Image
+
+# 帯ごとに処理できる画像モード
+STRIP_MODES = ('L', 'RGB', 'RGBA')
+
+# LANCZOS が参照する範囲 (縮小後の1画素あたり、縮小率を掛けた元画像の行数)
+_LANCZOS_SUPPORT = 3
+
+def raw_layout(img):
+    """
+    無圧縮の画像のデータの並びを返す
+
+    Args:
+        img: Image.open() で開いた (まだデコードしていない) 画像
+
+    Returns:
+        tuple: (データの開始位置, rawmode, 1行のバイト数, 行の向き (1: 上から / -1: 下から))。
+               帯ごとに読み込めない画像の場合は None
+    """
+    if len(img.tile) != 1 or img.mode not in STRIP_MODES:
+        return None
+    codec, extents, offset, args = img.tile[0]
+    if codec != 'raw' or tuple(extents) != (0, 0) + img.size:
+        return None
+    args = args if isinstance(args, tuple) else (args,)
+    rawmode, stride, orientation = (args + (0, 1))[:3]
+    if stride == 0:
+        # 行の区切りに余白がない形式 (PPMなど) は、画像モードと同じ並びの場合だけ対象にする
+        if rawmode != img.mode:
+            return None
+        stride = img.size[0] * len(img.mode)
+    return offset, rawmode, stride, orientation
+
+def _file_descriptor(source):
+    """
+    ファイルオブジェクトをメモリマップできる場合はファイルディスクリプタを返す (できない場合は None)
+
+    SpooledTemporaryFile はメモリ上にある間に fileno() を呼ぶとディスクに書き出してしまうため、
+    書き出し済みの場合だけ対象にします。
+    """
+    if isinstance(source, tempfile.SpooledTemporaryFile) and not source._rolled:
+        return None
+    try:
+        fd = source.fileno()
+    except (AttributeError, OSError, ValueError):
+        return None
+    source.flush()  # 書き込みバッファに残っているデータをファイルに反映する
+    return fd
+
+def _mapped_row_reader(mapped, locate):
+    def read_rows(row0, row1):
+        start, length = locate(row0, row1)
+        data = mapped[start:start + length]
+        if hasattr(mapped, 'madvise'):
+            # 読み終えたページをこのプロセスのメモリ使用量から外す (ページキャッシュには残る)
+            aligned = start - start % mmap.PAGESIZE
+            mapped.madvise(mmap.MADV_DONTNEED, aligned, min(len(mapped), start + length) - aligned)
+        return data
+    return read_rows
+
+@contextmanager
+def _row_reader(source, offset, stride, orientation, height):
+    """
+    元画像の上から row0 行目から row1 行目の手前までのデータを返す関数を作る
+
+    ファイルのパス、またはディスク上のファイルオブジェクトの場合はメモリマップし、
+    それ以外のファイルオブジェクトの場合はシークして読み込みます。
+    """
+    def locate(row0, row1):
+        first = row0 if orientation > 0 else height - row1  # 下から並んでいる場合はファイル上の順序が逆になる
+        return offset + first * stride, (row1 - row0) * stride
+
+    if not hasattr(source, 'read'):
+        with open(source, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            yield _mapped_row_reader(mapped, locate)
+        return
+
+    fd = _file_descriptor(source)
+    if fd is not None:
+        with mmap.mmap(fd, 0, access=mmap.ACCESS_READ) as mapped:
+            yield _mapped_row_reader(mapped, locate)
+        return
+
+    def read_rows(row0, row1):
+        start, length = locate(row0, row1)
+        source.seek(start)
+        return source.read(length)
+    yield read_rows
+
+def strip_rows(size, new_size, strip_height):
+    """
+    1帯あたりに読み込む元画像の最大行数 (上下の余分な行を含む) を返す
+
+    メモリ使用量の見積もりに使います。
+    """
+    scale = size[1] / new_size[1]
+    return strip_height + 2 * (math.ceil(_LANCZOS_SUPPORT * scale) + 1)
+
+def resize_in_strips(img, source, new_size, strip_height, resample=Image.LANCZOS):
+    """
+    無圧縮の画像を帯ごとに読み込んで縮小する
+
+    Args:
+        img: Image.open() で開いた (まだデコードしていない) 画像 (raw_layout() が None でないもの)
+        source: img を開いた画像ファイルのパス、またはファイルオブジェクト
+        new_size: 縮小後のサイズ (幅, 高さ)
+        strip_height: 1帯あたりの元画像の行数 (上下の余分な行を除く)
+
+    Returns:
+        Image: 縮小後の画像
+    """
+    offset, rawmode, stride, orientation = raw_layout(img)
+    width, height = img.size
+    new_width, new_height = new_size
+    scale = height / new_height
+    margin = math.ceil(_LANCZOS_SUPPORT * scale) + 1
+    rows_per_strip = max(1, int(strip_height / scale))  # 1帯から作る縮小後の行数
+
+    output = Image.new(img.mode, new_size)
+    with _row_reader(source, offset, stride, orientation, height) as read_rows:
+        for out_y0 in range(0, new_height, rows_per_strip):
+            out_y1 = min(new_height, out_y0 + rows_per_strip)
+            top, bottom = out_y0 * scale, out_y1 * scale
+            row0 = max(0, int(top) - margin)
+            row1 = min(height, math.ceil(bottom) + margin)
+            strip = Image.frombuffer(img.mode, (width, row1 - row0), read_rows(row0, row1),
+                                     'raw', rawmode, stride, orientation)
+            # box で帯の中の対象範囲を指定し、余分な行は LANCZOS の参照範囲としてだけ使う
+            output.paste(strip.resize((new_width, out_y1 - out_y0), resample, box=(0, top - row0, width, bottom - row0)),
+                         (0, out_y0))
+    return output
@@ -0,0 +1,13 @@
+"""
+テストの共通設定
+
+リポジトリ直下のモジュール (jpeg_rotate.py など) を import できるようにします。
+Web サービス (app.py) の保存先は、テストごとの一時ディレクトリにします (app を import する前に設定する)。
+"""
+
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ['IMAGE_RESIZE_STORAGE'] = tempfile.mkdtemp(prefix='image-resize-test-')
@@ -0,0 +1,101 @@
+"""admission.py のテスト"""
+
+import multiprocessing
+import os
+import threading
+import time
+import pytest
+from PIL import Image
+from admission import (MemoryBudget, SharedMemoryBudget, ImageTooLargeError, TooManyFramesError, MemoryBudgetExceeded,
+                       check_image, check_animation, estimate_memory)
+
+def test_check_image_limits():
+    img = Image.new('RGB', (1000, 1000))
+    estimate = check_image(img, [(100, 100)], 2 * 1000 * 1000, 1024 * 1024 * 1024)
+    assert estimate == estimate_memory((1000, 1000), 'RGB', [(100, 100)])
+    with pytest.raises(ImageTooLargeError):
+        check_image(img, [(100, 100)], 999999, 1024 * 1024 * 1024)
+    with pytest.raises(ImageTooLargeError):
+        check_image(img, [(100, 100)], 2 * 1000 * 1000, 1024 * 1024)
+    # 帯ごとに縮小する場合は1帯分で見積もる
+    assert check_image(img, [(100, 100)], 2 * 1000 * 1000, 1024 * 1024, decoded_size=(1000, 100)) < 1024 * 1024
+
+def test_check_animation_limits(tmp_path):
+    path = str(tmp_path / 'anim.gif')
+    frames = [Image.new('RGB', (40, 30), (i * 50, 0, 0)) for i in range(5)]
+    frames[0].save(path, save_all=True, append_images=frames[1:], duration=50)
+    with Image.open(path) as img:
+        assert check_animation(img, [(20, 15)], 5, 10000, 1024 * 1024) > 0
+        with pytest.raises(TooManyFramesError):
+            check_animation(img, [(20, 15)], 4, 10000, 1024 * 1024)
+        with pytest.raises(TooManyFramesError):
+            check_animation(img, [(20, 15)], 5, 5999, 1024 * 1024)
+
+def test_memory_budget_waits_and_rejects():
+    budget = MemoryBudget(100, 0.05)
+    with budget.reserve(80):
+        with pytest.raises(MemoryBudgetExceeded):
+            with budget.reserve(30):
+                pass
+    with budget.reserve(30):
+        assert budget.stats()['used'] == 30
+    assert budget.stats() == {'capacity': 100, 'used': 0, 'waiting': 0, 'rejected': 1}
+
+    # 他の処理が終われば、待っている処理が予約できる
+    budget = MemoryBudget(100, 2)
+    released = threading.Event()
+
+    def hold():
+        with budget.reserve(100):
+            time.sleep(0.1)
+        released.set()
+
+    thread = threading.Thread(target=hold)
+    thread.start()
+    time.sleep(0.02)
+    with budget.reserve(50):
+        assert released.is_set()
+    thread.join()
+
+def _hold_shared(path, started, release):
+    budget = SharedMemoryBudget(100, 0, path)
+    with budget.reserve(80):
+        started.set()
+        release.wait(5)
+
+def _crash_with_reservation(path, started):
+    budget = SharedMemoryBudget(100, 0, path)
+    with budget.reserve(80):
+        started.set()
+        os._exit(0)  # 予約を解放せずに終了する
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason='fork が使えない')
+def test_shared_memory_budget_across_processes(tmp_path):
+    path = str(tmp_path / 'memory_budget.json')
+    budget = SharedMemoryBudget(100, 0.05, path)
+    context = multiprocessing.get_context('fork')
+
+    started, release = context.Event(), context.Event()
+    process = context.Process(target=_hold_shared, args=(path, started, release))
+    process.start()
+    try:
+        assert started.wait(5)
+        assert budget.stats()['used'] == 80
+        with pytest.raises(MemoryBudgetExceeded):
+            with budget.reserve(30):
+                pass
+    finally:
+        release.set()
+        process.join(5)
+    with budget.reserve(30):
+        assert budget.stats()['reservations'] == 1
+
+    # 強制終了されたプロセスの予約は削除される
+    started = context.Event()
+    process = context.Process(target=_crash_with_reservation, args=(path, started))
+    process.start()
+    process.join(5)
+    assert started.is_set()
+    assert budget.stats()['used'] == 0
+    with budget.reserve(100):
+        pass
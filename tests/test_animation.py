@@ -0,0 +1,67 @@
+"""animation.py (と Resizer のアニメーション画像の処理) のテスト"""
+
+import io
+import pytest
+from PIL import Image
+from admission import ImageTooLargeError, estimate_animation_memory
+from animation import is_animated, iter_frames, resize_frames
+from resize_core import Resizer
+
+def _animation(path, format='GIF', size=(120, 80), count=4):
+    frames = [Image.new('RGB', size, (i * 60, 255 - i * 60, 0)) for i in range(count)]
+    frames[0].save(path, format=format, save_all=True, append_images=frames[1:],
+                   duration=[40 + 10 * i for i in range(count)], loop=0)
+    return path
+
+def test_iter_frames_keeps_durations(tmp_path):
+    path = _animation(str(tmp_path / 'anim.gif'))
+    with Image.open(path) as img:
+        assert is_animated(img)
+        frames = list(iter_frames(img))
+        assert img.tell() == 0
+    assert [duration for _, duration, _ in frames] == [40, 50, 60, 70]
+    assert all(frame.mode == 'RGB' and frame.size == (120, 80) for frame, _, _ in frames)
+
+def test_resize_frames_cascades_sizes(tmp_path):
+    path = _animation(str(tmp_path / 'anim.gif'))
+    with Image.open(path) as img:
+        results = list(resize_frames(img, [(120, 80), (60, 40), (30, 20)]))
+    assert len(results) == 4
+    for resized, _, _ in results:
+        assert [frame.size for frame in resized] == [(120, 80), (60, 40), (30, 20)]
+
+def test_still_image_is_not_animated():
+    buffer = io.BytesIO()
+    Image.new('RGB', (10, 10)).save(buffer, format='GIF')
+    buffer.seek(0)
+    with Image.open(buffer) as img:
+        assert not is_animated(img)
+
+@pytest.mark.parametrize('format, ext', [('GIF', '.gif'), ('WEBP', '.webp')])
+def test_resizer_keeps_animation(tmp_path, format, ext):
+    path = _animation(str(tmp_path / f"anim{ext}"), format)
+    targets = [(60, str(tmp_path / f"small{ext}")), (100, str(tmp_path / f"large{ext}"))]
+    success, _, original_size, renditions = Resizer().resize_multi(path, targets)
+    assert success
+    assert original_size == (120, 80)
+    assert [r['new_size'] for r in renditions] == [(60, 40), (100, 66)]
+    for (_, output_path), r in zip(targets, renditions):
+        assert '4フレーム' in r['message']
+        with Image.open(output_path) as img:
+            assert img.n_frames == 4
+            img.seek(2)
+            img.load()  # WebP の表示時間はデコード後に設定される
+            assert img.info['duration'] == 60
+
+def test_estimate_includes_resized_frames():
+    # 元の画像3フレーム分 + 縮小後の全フレーム (4バイト/画素) + GIF のパレット画像 (最大の横幅、1バイト/画素)
+    estimate = estimate_animation_memory((120, 80), 4, [(60, 40), (30, 20)])
+    assert estimate == 120 * 80 * 4 * 3 + ((60 * 40 + 30 * 20) * 4 + 60 * 40) * 4
+
+def test_resizer_rejects_when_resized_frames_exceed_memory(tmp_path):
+    path = _animation(str(tmp_path / 'anim.gif'), count=20)
+    # 元の画像の3フレーム分には足りるが、縮小後の全フレームは保持できない上限
+    limit = 120 * 80 * 4 * 3 + 100 * 66 * 4 * 5
+    with pytest.raises(ImageTooLargeError):
+        Resizer(max_image_memory=limit).resize_multi(path, [(100, str(tmp_path / 'out.gif'))])
+    assert not (tmp_path / 'out.gif').exists()
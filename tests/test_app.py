@@ -0,0 +1,315 @@
+"""
+app.py (Web サービス) のテスト
+
+保存先は conftest.py で一時ディレクトリにしています。
+"""
+
+import io
+import json
+import os
+import random
+import signal
+import sqlite3
+import time
+import zipfile
+import pytest
+from PIL import Image
+import app as app_module
+from storage_janitor import SweepRule
+
+def _jpeg(size=(400, 300), color=(200, 40, 40)):
+    img = Image.new('RGB', size, color)
+    img.paste((20, 20, 200), (0, 0, size[0] // 2, size[1] // 2))
+    buffer = io.BytesIO()
+    img.save(buffer, format='JPEG')
+    return buffer.getvalue()
+
+@pytest.fixture
+def client():
+    return app_module.app.test_client()
+
+def _upload(client, data, filename='photo.jpg', widths=('100',)):
+    return client.post('/upload', data={'file': (io.BytesIO(data), filename), 'width': list(widths)},
+                       content_type='multipart/form-data')
+
+def _downloads():
+    return set(os.listdir(app_module.DOWNLOAD_FOLDER))
+
+def test_cache_hit_on_old_entry_survives_sweep(client):
+    data = _jpeg(color=(10, 120, 30))
+    assert _upload(client, data).status_code == 200
+
+    # キャッシュに登録してから時間が経ったエントリにする (DOWNLOAD_TTL を1秒として扱う)
+    old = time.time() - 2 * 24 * 60 * 60
+    for name in os.listdir(app_module.CACHE_FOLDER):
+        if name.endswith('.jpg'):
+            os.utime(os.path.join(app_module.CACHE_FOLDER, name), (old, old))
+    time.sleep(1.1)
+
+    before = _downloads()
+    assert _upload(client, data).status_code == 200
+    handed_out = _downloads() - before
+    assert len(handed_out) == 1
+
+    rule = SweepRule('downloads', app_module.DOWNLOAD_FOLDER, 1, None)
+    app_module.storage_janitor._sweep_folder(rule, time.time())
+    download_id = handed_out.pop()
+    assert os.path.exists(os.path.join(app_module.DOWNLOAD_FOLDER, download_id))
+    assert client.get(f'/download/{download_id}').status_code == 200
+
+def _batch(client, count=2, widths=('100', '200'), **kwargs):
+    files = [(io.BytesIO(_jpeg(color=(30 * i, 90, 160))), f"img{i}.jpg") for i in range(count)]
+    return client.post('/api/batch', data={'file': files, 'width': list(widths)},
+                       content_type='multipart/form-data', **kwargs)
+
+def _wait_for(condition, timeout=10):
+    deadline = time.time() + timeout
+    while not condition() and time.time() < deadline:
+        time.sleep(0.05)
+    return condition()
+
+def test_batch_leaves_no_downloads(client):
+    before = _downloads()
+    response = _batch(client)
+    assert response.status_code == 200
+    with zipfile.ZipFile(io.BytesIO(response.data)) as zf:
+        assert sorted(zf.namelist()) == ['img0_100px.jpg', 'img0_200px.jpg', 'img1_100px.jpg', 'img1_200px.jpg',
+                                         app_module.BATCH_MANIFEST_NAME]
+    assert _downloads() == before
+
+def test_batch_disconnect_removes_unstreamed_outputs(client):
+    before = _downloads()
+    response = _batch(client, count=4)
+    next(response.response)  # 最初のデータだけ受け取って切断する
+    response.close()
+    assert _wait_for(lambda: _downloads() == before)
+
+_run_batch_item = app_module.run_batch_item
+
+def _kill_on_img1(input_path, content_hash, base_name, *args):
+    """img1 の処理中にワーカープロセスが強制終了されたようにする"""
+    if base_name == 'img1':
+        os.kill(os.getpid(), signal.SIGKILL)
+    return _run_batch_item(input_path, content_hash, base_name, *args)
+
+def _manifest(response):
+    with zipfile.ZipFile(io.BytesIO(response.data)) as zf:
+        return json.loads(zf.read(app_module.BATCH_MANIFEST_NAME))
+
+def test_batch_recovers_from_killed_workers(client, monkeypatch):
+    executor = app_module._get_batch_executor()
+    assert _batch(client, count=1).status_code == 200
+    for process in list(executor._processes.values()):
+        os.kill(process.pid, signal.SIGKILL)
+    assert _wait_for(lambda: executor._broken)
+
+    # 壊れたプロセスプールは作り直される
+    response = _batch(client)
+    assert response.status_code == 200
+    assert _manifest(response)['processed'] == 2
+    assert app_module._get_batch_executor() is not executor
+
+    # 処理中にプロセスが異常終了した画像はエラーとして記録される
+    # (同時に処理していた画像もエラーになる場合がある)
+    monkeypatch.setattr(app_module, 'run_batch_item', _kill_on_img1)
+    response = _batch(client)
+    assert response.status_code == 200
+    errors = {entry['source']: entry['error'] for entry in _manifest(response)['files'] if entry['status'] == 'error'}
+    assert errors['img1.jpg'] == app_module.BATCH_WORKER_DIED_ERROR
+    assert set(errors.values()) == {app_module.BATCH_WORKER_DIED_ERROR}
+
+    monkeypatch.setattr(app_module, 'run_batch_item', _run_batch_item)
+    response = _batch(client)
+    assert response.status_code == 200
+    assert _manifest(response)['processed'] == 2
+
+def _photo_jpeg(quality, seed=7):
+    """ランダムな色の矩形を並べた写真風の JPEG (dHash のビットが偏らないもの)"""
+    rng = random.Random(seed)
+    img = Image.new('RGB', (320, 240))
+    for _ in range(40):
+        x, y = rng.randrange(320), rng.randrange(240)
+        img.paste(tuple(rng.randrange(256) for _ in range(3)), (x, y, x + 80, y + 60))
+    buffer = io.BytesIO()
+    img.save(buffer, format='JPEG', quality=quality)
+    return buffer.getvalue()
+
+def _phash_updated(content_hash):
+    with sqlite3.connect(app_module.PHASH_INDEX_PATH) as conn:
+        row = conn.execute('SELECT updated FROM hashes WHERE key = ?', (content_hash,)).fetchone()
+    return row[0] if row else None
+
+def test_near_duplicate_reuse_and_touch(client):
+    original = _photo_jpeg(95)
+    response = _upload(client, original, widths=('100', '200'))
+    assert response.status_code == 200
+    assert 'よく似た画像' not in response.get_data(as_text=True)
+    original_hash = app_module.hash_upload(io.BytesIO(original))
+    registered = _phash_updated(original_hash)
+    assert registered is not None
+
+    # 圧縮し直した画像は、既定で元の画像のリサイズ結果を再利用する (再利用した画像の記録は更新される)
+    time.sleep(0.01)
+    response = _upload(client, _photo_jpeg(60), widths=('100', '200'))
+    assert response.status_code == 200
+    assert 'よく似た画像' in response.get_data(as_text=True)
+    reused = _phash_updated(original_hash)
+    assert reused > registered
+
+    # キャッシュにヒットした画像の記録も更新される
+    time.sleep(0.01)
+    assert client.post('/api/resize', data={'file': (io.BytesIO(original), 'photo.jpg'), 'width': '100'},
+                       content_type='multipart/form-data').status_code == 200
+    assert _phash_updated(original_hash) > reused
+
+def test_metrics_include_janitor_stats(client):
+    stats = app_module.storage_janitor.sweep()
+    assert stats is not None
+    body = client.get('/metrics').get_data(as_text=True)
+    assert '# TYPE image_resize_janitor_sweeps_total counter' in body
+    assert f"image_resize_janitor_sweeps_total {stats['sweeps']}" in body
+    assert '# TYPE image_resize_janitor_sweep_duration_seconds gauge' in body
+    assert f"image_resize_janitor_last_sweep_timestamp_seconds {stats['last_sweep']}" in body
+    assert '# TYPE image_resize_storage_evicted_files_total counter' in body
+    for name, folder in stats['folders'].items():
+        assert f'image_resize_storage_evicted_files_total{{folder="{name}"}} {folder["files_evicted"]}' in body
+        assert f'image_resize_storage_files{{folder="{name}"}} {folder["files"]}' in body
+
+def _api_resize(client, data, filename='photo.jpg', headers=None, **fields):
+    form = dict({'file': (io.BytesIO(data), filename), 'width': '100'}, **fields)
+    return client.post('/api/resize', data=form, content_type='multipart/form-data', headers=headers)
+
+def test_api_resize_returns_image(client):
+    before = _downloads()
+    response = _api_resize(client, _jpeg(color=(90, 30, 160)))
+    assert response.status_code == 200
+    assert response.mimetype == 'image/jpeg'
+    assert response.headers['Content-Disposition'] == 'attachment; filename="photo_100px.jpg"'
+    assert response.headers['X-Original-Size'] == '400x300'
+    assert response.headers['X-Image-Size'] == '100x75'
+    assert response.headers['ETag'] and response.content_length == len(response.data)
+    with Image.open(io.BytesIO(response.data)) as img:
+        assert img.size == (100, 75)
+    assert _downloads() == before  # DOWNLOAD_FOLDER には保存しない
+
+def test_api_resize_output_format(client):
+    response = _api_resize(client, _jpeg(color=(90, 60, 160)), format='png')
+    assert response.mimetype == 'image/png'
+    assert response.headers['Content-Disposition'] == 'attachment; filename="photo_100px.png"'
+
+    if 'webp' in app_module.available_output_formats():
+        response = _api_resize(client, _jpeg(color=(90, 90, 160)), format='auto',
+                               headers={'Accept': 'image/webp,*/*'})
+        assert response.mimetype == 'image/webp'
+        assert 'Accept' in response.headers['Vary']
+
+def test_api_resize_rejects_invalid_requests(client, monkeypatch):
+    data = _jpeg(color=(90, 120, 160))
+    assert _api_resize(client, data, width='0').status_code == 400
+    assert _api_resize(client, data, filename='photo.txt').status_code == 415
+    assert _api_resize(client, data, preset='unknown').status_code == 400
+    assert client.post('/api/resize', data={'width': '100'}, content_type='multipart/form-data').status_code == 400
+    assert _api_resize(client, b'not an image').status_code == 422
+
+    monkeypatch.setattr(app_module.resizer, 'max_image_pixels', 1000)
+    response = _api_resize(client, _jpeg(color=(90, 150, 160)))
+    assert response.status_code == 413
+    assert 'error' in response.get_json()
+
+def _download_file(content=b'0123456789' * 100):
+    download_id = f"{os.urandom(8).hex()}_photo.jpg"
+    with open(os.path.join(app_module.DOWNLOAD_FOLDER, download_id), 'wb') as f:
+        f.write(content)
+    return download_id, content
+
+def test_download_etag_and_range(client):
+    download_id, content = _download_file()
+    response = client.get(f'/download/{download_id}')
+    assert response.status_code == 200
+    assert response.data == content
+    etag = response.headers['ETag']
+    assert not etag.startswith('W/')  # 内容のハッシュ値による強い ETag
+    assert 'max-age=3600' in response.headers['Cache-Control']
+
+    assert client.get(f'/download/{download_id}', headers={'If-None-Match': etag}).status_code == 304
+    response = client.get(f'/download/{download_id}', headers={'If-Modified-Since': response.headers['Last-Modified']})
+    assert response.status_code == 304
+
+    response = client.get(f'/download/{download_id}', headers={'Range': 'bytes=10-19'})
+    assert response.status_code == 206
+    assert response.data == content[10:20]
+    assert response.headers['Content-Range'] == f'bytes 10-19/{len(content)}'
+    # ETag が一致しない場合 (ファイルが変わった場合) は全体を返す
+    response = client.get(f'/download/{download_id}', headers={'Range': 'bytes=10-19', 'If-Range': '"other"'})
+    assert response.status_code == 200 and response.data == content
+
+def test_download_missing_file_redirects(client):
+    assert client.get('/download/missing.jpg').status_code == 302
+
+def test_download_sendfile_modes(client, monkeypatch):
+    download_id, _ = _download_file()
+    monkeypatch.setattr(app_module, 'DOWNLOAD_SENDFILE_MODE', app_module.SENDFILE_X_ACCEL)
+    response = client.get(f'/download/{download_id}')
+    assert response.status_code == 200
+    assert response.headers['X-Accel-Redirect'] == app_module.DOWNLOAD_ACCEL_PREFIX + download_id
+    assert 'X-Sendfile' not in response.headers
+    assert response.data == b''
+    # 304 の場合はプロキシにファイルを送らせない
+    response = client.get(f'/download/{download_id}', headers={'If-None-Match': response.headers['ETag']})
+    assert response.status_code == 304
+    assert 'X-Accel-Redirect' not in response.headers
+
+    monkeypatch.setattr(app_module, 'DOWNLOAD_SENDFILE_MODE', app_module.SENDFILE_X_SENDFILE)
+    response = client.get(f'/download/{download_id}')
+    assert response.headers['X-Sendfile'] == os.path.abspath(os.path.join(app_module.DOWNLOAD_FOLDER, download_id))
+
+def test_metrics_endpoint(client):
+    assert _upload(client, _jpeg(color=(200, 200, 40))).status_code == 200
+    response = client.get('/metrics')
+    assert response.status_code == 200
+    assert response.mimetype == 'text/plain'
+    body = response.get_data(as_text=True)
+    assert '# TYPE image_resize_request_seconds histogram' in body
+    assert 'image_resize_request_seconds_count{endpoint="upload_file"}' in body
+    assert 'image_resize_bytes_in_total{format="jpeg"}' in body
+    for stage in ('receive', 'decode', 'resize', 'encode', 'write'):
+        assert f'image_resize_stage_seconds_count{{format="jpeg",stage="{stage}"}}' in body
+
+def test_batch_zip_keeps_folders_and_reports_errors(client):
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, 'w') as zf:
+        zf.writestr('trip/day1/a.jpg', _jpeg(color=(10, 200, 90)))
+        zf.writestr('trip/day2/a.jpg', _jpeg(color=(10, 200, 120)))
+        zf.writestr('trip/notes.txt', 'not an image')  # 画像以外は無視する
+        zf.writestr('broken.jpg', b'not an image')
+    archive.seek(0)
+    files = [(archive, 'photos.zip'), (io.BytesIO(b'text'), 'readme.txt')]
+    response = client.post('/api/batch', data={'file': files, 'width': '100', 'format': 'png'},
+                           content_type='multipart/form-data')
+    assert response.status_code == 200
+    assert response.mimetype == 'application/zip'
+    with zipfile.ZipFile(io.BytesIO(response.data)) as zf:
+        assert sorted(zf.namelist()) == [app_module.BATCH_MANIFEST_NAME, 'trip/day1/a_100px.png', 'trip/day2/a_100px.png']
+        with Image.open(io.BytesIO(zf.read('trip/day1/a_100px.png'))) as img:
+            assert img.size == (100, 75)
+    manifest = _manifest(response)
+    assert (manifest['processed'], manifest['errors']) == (2, 2)
+    errors = sorted(entry['source'] for entry in manifest['files'] if entry['status'] == 'error')
+    assert errors == ['broken.jpg', 'readme.txt']
+
+def test_batch_rejects_invalid_requests(client, monkeypatch):
+    assert client.post('/api/batch', data={'width': '100'}, content_type='multipart/form-data').status_code == 400
+    assert _batch(client, widths=('abc',)).status_code == 400
+    assert client.post('/api/batch', data={'file': [(io.BytesIO(_jpeg()), 'a.jpg')], 'width': '100', 'preset': 'x'},
+                       content_type='multipart/form-data').status_code == 400
+
+    monkeypatch.setattr(app_module, 'BATCH_MAX_FILES', 1)
+    before = set(os.listdir(app_module.UPLOAD_FOLDER))
+    assert _batch(client, count=2).status_code == 413
+    assert set(os.listdir(app_module.UPLOAD_FOLDER)) == before  # 保存済みの入力画像は削除する
+
+def test_batch_numbers_duplicate_names(client):
+    files = [(io.BytesIO(_jpeg(color=(c, 40, 40))), 'same.jpg') for c in (50, 150)]
+    response = client.post('/api/batch', data={'file': files, 'width': '100'}, content_type='multipart/form-data')
+    with zipfile.ZipFile(io.BytesIO(response.data)) as zf:
+        assert sorted(zf.namelist()) == [app_module.BATCH_MANIFEST_NAME, 'same_100px.jpg', 'same_100px_2.jpg']
@@ -0,0 +1,55 @@
+"""batch_resize.py のテスト"""
+
+import os
+from PIL import Image
+import batch_resize
+from batch_resize import iter_input_files, main, output_paths, run_batch
+from resize_core import Resizer
+
+def _images(folder, count=3, size=(400, 300)):
+    os.makedirs(folder / 'sub', exist_ok=True)
+    for i in range(count):
+        Image.new('RGB', size, (60 * i, 120, 200)).save(folder / ('sub' if i == 0 else '.') / f"img{i}.jpg")
+    Image.new('RGB', (10, 10)).save(folder / 'old_620px.jpg')  # 出力ファイルは入力にしない
+    (folder / 'notes.txt').write_text('not an image')
+
+def test_iter_input_files_and_output_paths(tmp_path):
+    _images(tmp_path)
+    files = list(iter_input_files([str(tmp_path)]))
+    assert [relative for _, relative in files] == ['img1.jpg', 'img2.jpg', os.path.join('sub', 'img0.jpg')]
+    assert output_paths(str(tmp_path / 'sub' / 'img0.jpg'), os.path.join('sub', 'img0.jpg'), [100, 200], 'out') == [
+        (100, os.path.join('out', 'sub', 'img0_100px.jpg')), (200, os.path.join('out', 'sub', 'img0_200px.jpg'))]
+
+def test_run_batch_and_skip_up_to_date(tmp_path):
+    source, output = tmp_path / 'in', tmp_path / 'out'
+    _images(source)
+    summary = run_batch(iter_input_files([str(source)]), [100, 200], output_dir=str(output), workers=2)
+    assert summary['processed'] == 3 and summary['errors'] == []
+    with Image.open(output / 'sub' / 'img0_200px.jpg') as img:
+        assert img.size == (200, 150)
+
+    summary = run_batch(iter_input_files([str(source)]), [100, 200], output_dir=str(output), workers=2)
+    assert (summary['processed'], summary['skipped']) == (0, 3)
+
+def test_limit_above_pillow_decompression_bomb_threshold(tmp_path, monkeypatch):
+    # Pillow の判定 (MAX_IMAGE_PIXELS の2倍を超えるとエラー) より大きな上限を指定しても効く
+    # (大きな画像を作らずに確認するため、Pillow の判定を小さくしてプロセスを作る)
+    monkeypatch.setattr(Image, 'MAX_IMAGE_PIXELS', 10000)
+    _images(tmp_path, count=1)
+    files = [(str(tmp_path / 'sub' / 'img0.jpg'), 'img0.jpg')]
+    summary = run_batch(files, [100], output_dir=str(tmp_path / 'out'), workers=1,
+                        resizer=Resizer(max_image_pixels=1000 * 1000))
+    assert summary['processed'] == 1 and summary['errors'] == []
+
+    # 上限は Resizer で判定する
+    summary = run_batch(files, [100], output_dir=str(tmp_path / 'out'), workers=1, force=True,
+                        resizer=Resizer(max_image_pixels=50000))
+    assert summary['processed'] == 0 and len(summary['errors']) == 1
+
+def test_main(tmp_path, capsys):
+    _images(tmp_path)
+    assert main([str(tmp_path), '-w', '120', '-j', '1']) == 0
+    assert os.path.exists(tmp_path / 'img1_120px.jpg')
+    out = capsys.readouterr().out
+    assert batch_resize.VERSION in out
+    assert '処理: 3件' in out
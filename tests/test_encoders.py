@@ -0,0 +1,91 @@
+"""encoders.py のテスト (目標ファイルサイズのエンコード)"""
+
+import io
+import pytest
+from PIL import Image
+import encoders
+from encoders import TARGET_SIZE_MIN_QUALITY, encode_animation_to_size, encode_to_size, encoder_params
+
+def _photo(size=(160, 120)):
+    """品質によって出力サイズが変わるよう、ノイズを加えた画像"""
+    noise = Image.effect_noise(size, 60)
+    return Image.merge('RGB', [noise, noise.rotate(90, expand=False), Image.linear_gradient('L').resize(size)])
+
+def _jpeg_size(img, quality):
+    buffer = io.BytesIO()
+    img.save(buffer, format='JPEG', quality=quality, optimize=True)
+    return buffer.tell()
+
+@pytest.fixture
+def encode_count(monkeypatch):
+    calls = []
+    original = encoders._timed_save
+
+    def counting(*args):
+        calls.append(args[4].get('quality'))
+        return original(*args)
+
+    monkeypatch.setattr(encoders, '_timed_save', counting)
+    return calls
+
+def test_fits_at_preset_quality(encode_count):
+    img = _photo()
+    data, quality, fits = encode_to_size(img, 'JPEG', 10 * 1024 * 1024)
+    assert (quality, fits) == (95, True)
+    assert encode_count == [95]  # 収まる場合は1回で終わる
+    with Image.open(io.BytesIO(data)) as decoded:
+        assert decoded.format == 'JPEG' and decoded.size == img.size
+
+def test_finds_highest_quality_that_fits(encode_count):
+    img = _photo()
+    max_bytes = (_jpeg_size(img, 60) + _jpeg_size(img, 61)) // 2
+    data, quality, fits = encode_to_size(img, 'JPEG', max_bytes, max_iterations=20)
+    assert fits and len(data) <= max_bytes
+    assert quality == max(q for q in range(TARGET_SIZE_MIN_QUALITY, 96) if _jpeg_size(img, q) <= max_bytes)
+    assert encode_count[:2] == [95, TARGET_SIZE_MIN_QUALITY]  # 上限、下限の順に試す
+
+def test_iteration_limit_uses_best_so_far(encode_count):
+    img = _photo()
+    max_bytes = _jpeg_size(img, 70)
+    data, quality, fits = encode_to_size(img, 'JPEG', max_bytes, max_iterations=3)
+    assert len(encode_count) == 3
+    assert fits and len(data) <= max_bytes and TARGET_SIZE_MIN_QUALITY <= quality <= 70
+
+def test_does_not_fit_at_min_quality():
+    data, quality, fits = encode_to_size(_photo(), 'JPEG', 100)
+    assert (quality, fits) == (TARGET_SIZE_MIN_QUALITY, False)
+    assert len(data) > 100
+
+def test_preset_and_options_set_the_upper_quality(encode_count):
+    encode_to_size(_photo(), 'JPEG', 10 * 1024 * 1024, preset='fast')
+    encode_to_size(_photo(), 'JPEG', 10 * 1024 * 1024, encoder_options={'quality': 70})
+    assert encode_count == [encoder_params('JPEG', 'fast')['quality'], 70]
+
+def test_format_without_quality():
+    data, quality, fits = encode_to_size(_photo(), 'PNG', 100)
+    assert (quality, fits) == (None, False)
+    with Image.open(io.BytesIO(data)) as decoded:
+        assert decoded.format == 'PNG'
+
+def test_transparent_image_to_jpeg():
+    img = Image.new('RGBA', (40, 30), (255, 0, 0, 0))
+    data, _, fits = encode_to_size(img, 'JPEG', 10 * 1024 * 1024)
+    assert fits
+    with Image.open(io.BytesIO(data)) as decoded:
+        assert decoded.mode == 'RGB'
+        assert decoded.getpixel((20, 15)) == pytest.approx((255, 255, 255), abs=2)  # 透過部分は白
+
+@pytest.mark.parametrize('output_format', ['WEBP', 'GIF'])
+def test_encode_animation_to_size(output_format):
+    frames = [_photo((80, 60)) for _ in range(3)]
+    durations = [50, 60, 70]
+    data, quality, fits = encode_animation_to_size(frames, output_format, 10 * 1024 * 1024, durations, loop=0)
+    assert fits
+    assert quality == (None if output_format == 'GIF' else encoder_params('WEBP')['quality'])
+    with Image.open(io.BytesIO(data)) as img:
+        assert img.format == output_format and img.n_frames == 3
+
+    if output_format == 'WEBP':
+        small, quality, _ = encode_animation_to_size(frames, output_format, len(data) // 2, durations, loop=0)
+        assert quality < encoder_params('WEBP')['quality']
+        assert len(small) < len(data)
@@ -0,0 +1,92 @@
+"""job_queue.py のテスト"""
+
+import os
+import signal
+import time
+import pytest
+from concurrent.futures.process import BrokenProcessPool
+from job_queue import JobQueue, QueueFullError, STATUS_DONE, STATUS_FAILED, STATUS_TIMEOUT
+
+def _add(a, b):
+    return a + b
+
+def _sleep(seconds):
+    time.sleep(seconds)
+    return seconds
+
+def _fail():
+    raise ValueError('broken image')
+
+def _kill_worker():
+    os.kill(os.getpid(), signal.SIGKILL)
+
+def _wait_for_status(queue, job_id, timeout=10):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        status = queue.status(job_id)
+        if status and status['status'] not in ('queued', 'running'):
+            return status
+        time.sleep(0.05)
+    return queue.status(job_id)
+
+@pytest.fixture
+def queue(tmp_path):
+    queue = JobQueue(str(tmp_path), 1, 2, 5)
+    yield queue
+    if queue._executor is not None:
+        queue._executor.shutdown()
+
+def test_job_result_and_failure(queue):
+    job_id = queue.submit(_add, 1, 2, info={'original_filename': 'a.jpg'})
+    status = _wait_for_status(queue, job_id)
+    assert status['status'] == STATUS_DONE
+    assert status['result'] == 3
+    assert status['info'] == {'original_filename': 'a.jpg'}
+
+    status = _wait_for_status(queue, queue.submit(_fail))
+    assert status['status'] == STATUS_FAILED
+    assert status['error'] == 'broken image'
+    assert queue.pending() == 0
+
+def test_queue_full_and_timeout(tmp_path):
+    queue = JobQueue(str(tmp_path), 1, 1, 0.2)
+    try:
+        job_id = queue.submit(_sleep, 2)
+        with pytest.raises(QueueFullError):
+            queue.submit(_add, 1, 2)
+        assert _wait_for_status(queue, job_id)['status'] == STATUS_TIMEOUT
+        assert queue.pending() == 0
+    finally:
+        queue._executor.shutdown()
+
+def test_killed_worker_fails_job_and_rebuilds_pool(queue):
+    job_id = queue.submit(_kill_worker)
+    status = _wait_for_status(queue, job_id)
+    assert status['status'] == STATUS_FAILED
+    assert queue.pending() == 0
+
+    # 次のジョブは作り直したプロセスプールで実行される
+    status = _wait_for_status(queue, queue.submit(_add, 2, 3))
+    assert status['status'] == STATUS_DONE
+    assert status['result'] == 5
+
+class _BrokenExecutor:
+    def submit(self, *args):
+        raise BrokenProcessPool('A child process terminated abruptly')
+
+    def shutdown(self, wait=True):
+        pass
+
+def test_submit_to_broken_pool(queue, monkeypatch):
+    # 壊れたプロセスプールに投入した場合は作り直して再投入する
+    queue._executor = _BrokenExecutor()
+    status = _wait_for_status(queue, queue.submit(_add, 1, 1))
+    assert status['status'] == STATUS_DONE
+
+    # 作り直しても投入できない場合は、ジョブを失敗として記録する
+    queue._executor.shutdown()
+    queue._executor = _BrokenExecutor()
+    monkeypatch.setattr('job_queue.ProcessPoolExecutor', lambda max_workers: _BrokenExecutor())
+    status = queue.status(queue.submit(_add, 1, 1))
+    assert status['status'] == STATUS_FAILED
+    assert queue.pending() == 0
@@ -0,0 +1,181 @@
+"""
+jpeg_rotate.py のテスト
+
+EXIF の向き情報 (1〜8) と回転角度 (90/180/270) の全ての組み合わせを、
+リトルエンディアン (II) とビッグエンディアン (MM) の EXIF で確認します。
+"""
+
+import io
+import shutil
+import subprocess
+import pytest
+from PIL import Image, ImageChops, ImageOps
+from jpeg_rotate import (rotate_jpeg_bytes, rotate_jpeg_file, get_orientation, jpegtran_available,
+                         LosslessRotationError, METHOD_EXIF, METHOD_LOSSLESS, ORIENTATION_TAG)
+
+# 時計回りの回転角度 -> 表示上の画像に対する変換
+_CLOCKWISE = {90: Image.ROTATE_270, 180: Image.ROTATE_180, 270: Image.ROTATE_90}
+
+def _sample_jpeg():
+    """向きが分かるよう、四隅の色が異なる 64x32 の JPEG (MCU の倍数のサイズ)"""
+    img = Image.new('RGB', (64, 32), (255, 255, 255))
+    img.paste((255, 0, 0), (0, 0, 32, 16))
+    img.paste((0, 255, 0), (32, 0, 64, 16))
+    img.paste((0, 0, 255), (0, 16, 32, 32))
+    buffer = io.BytesIO()
+    img.save(buffer, format='JPEG', quality=95)
+    return buffer.getvalue()
+
+def _exif_segment(tags, byte_order):
+    """指定したタグ (SHORT 型) だけを持つ EXIF (APP1) セグメントを作成する"""
+    endian = 'little' if byte_order == b'II' else 'big'
+    tiff = byte_order + (42).to_bytes(2, endian) + (8).to_bytes(4, endian) + len(tags).to_bytes(2, endian)
+    for tag, value in sorted(tags.items()):
+        tiff += (tag.to_bytes(2, endian) + (3).to_bytes(2, endian) + (1).to_bytes(4, endian)
+                 + value.to_bytes(2, endian) + b'\x00\x00')
+    tiff += (0).to_bytes(4, endian)
+    payload = b'Exif\x00\x00' + tiff
+    return b'\xff\xe1' + (len(payload) + 2).to_bytes(2, 'big') + payload
+
+def _with_exif(data, tags, byte_order):
+    """JPEG の SOI の直後に EXIF を挿入する"""
+    return data[:2] + _exif_segment(tags, byte_order) + data[2:]
+
+def _displayed(data):
+    with Image.open(io.BytesIO(data)) as img:
+        return ImageOps.exif_transpose(img).convert('RGB')
+
+def _assert_same_pixels(a, b):
+    assert a.size == b.size
+    assert ImageChops.difference(a, b).getbbox() is None
+
+@pytest.mark.parametrize('byte_order', [b'II', b'MM'])
+@pytest.mark.parametrize('orientation', range(1, 9))
+@pytest.mark.parametrize('degrees', [90, 180, 270])
+def test_exif_rotation_matches_pixel_rotation(byte_order, orientation, degrees):
+    original = _with_exif(_sample_jpeg(), {ORIENTATION_TAG: orientation}, byte_order)
+    rotated, method = rotate_jpeg_bytes(original, degrees, METHOD_EXIF)
+
+    assert method == METHOD_EXIF
+    # 画素データはそのままで、EXIF の値 (2バイト) だけが書き換わる
+    assert len(rotated) == len(original)
+    _assert_same_pixels(_displayed(rotated), _displayed(original).transpose(_CLOCKWISE[degrees]))
+
+@pytest.mark.parametrize('byte_order', [b'II', b'MM'])
+def test_get_orientation_reads_both_byte_orders(byte_order):
+    for orientation in range(1, 9):
+        data = _with_exif(_sample_jpeg(), {ORIENTATION_TAG: orientation}, byte_order)
+        assert get_orientation(data) == orientation
+
+def test_four_quarter_turns_restore_orientation():
+    data = _with_exif(_sample_jpeg(), {ORIENTATION_TAG: 5}, b'II')
+    rotated = data
+    for _ in range(4):
+        rotated, _ = rotate_jpeg_bytes(rotated, 90, METHOD_EXIF)
+    assert rotated == data
+
+@pytest.mark.parametrize('degrees', [90, 180, 270])
+def test_exif_is_inserted_when_missing(degrees):
+    original = _sample_jpeg()
+    rotated, _ = rotate_jpeg_bytes(original, degrees, METHOD_EXIF)
+    assert get_orientation(original) == 1
+    assert get_orientation(rotated) == {90: 6, 180: 3, 270: 8}[degrees]
+    _assert_same_pixels(_displayed(rotated), _displayed(original).transpose(_CLOCKWISE[degrees]))
+
+def test_exif_without_orientation_is_rejected():
+    data = _with_exif(_sample_jpeg(), {0x0100: 64}, b'MM')  # ImageWidth のみ
+    with pytest.raises(LosslessRotationError):
+        rotate_jpeg_bytes(data, 90, METHOD_EXIF)
+
+def test_invalid_input_is_rejected():
+    with pytest.raises(LosslessRotationError):
+        rotate_jpeg_bytes(_sample_jpeg(), 45, METHOD_EXIF)
+    with pytest.raises(LosslessRotationError):
+        rotate_jpeg_bytes(b'\x89PNG\r\n\x1a\n', 90, METHOD_EXIF)
+
+def test_zero_degrees_returns_input():
+    data = _sample_jpeg()
+    assert rotate_jpeg_bytes(data, 0, METHOD_EXIF) == (data, METHOD_EXIF)
+
+def test_lossless_falls_back_to_exif_without_jpegtran(monkeypatch):
+    monkeypatch.setattr(shutil, 'which', lambda name: None)
+    _, method = rotate_jpeg_bytes(_sample_jpeg(), 90, METHOD_LOSSLESS)
+    assert method == METHOD_EXIF
+
+@pytest.mark.skipif(not jpegtran_available(), reason='jpegtran がインストールされていない')
+@pytest.mark.parametrize('degrees', [90, 180, 270])
+def test_jpegtran_rotation(degrees):
+    original = _sample_jpeg()
+    rotated, method = rotate_jpeg_bytes(original, degrees, METHOD_LOSSLESS)
+    assert method == METHOD_LOSSLESS
+    expected = _displayed(original).transpose(_CLOCKWISE[degrees])
+    actual = _displayed(rotated)
+    assert actual.size == expected.size
+    # DCT 係数の並べ替えのため、再エンコードによる誤差はほとんどない
+    assert max(high for _, high in ImageChops.difference(actual, expected).getextrema()) <= 8
+
+# jpegtran の変換 -> Pillow の変換 (jpegtran がない環境でもテストできるよう、Pillow で代用する)
+_JPEGTRAN_TRANSPOSE = {
+    ('-flip', 'horizontal'): Image.FLIP_LEFT_RIGHT, ('-flip', 'vertical'): Image.FLIP_TOP_BOTTOM,
+    ('-rotate', '90'): Image.ROTATE_270, ('-rotate', '180'): Image.ROTATE_180, ('-rotate', '270'): Image.ROTATE_90,
+    ('-transpose',): Image.TRANSPOSE, ('-transverse',): Image.TRANSVERSE,
+}
+
+def _fake_jpegtran(calls):
+    def run(args, input, stdout, stderr):
+        calls.append(args)
+        transform = tuple(args[1:-3])  # 'jpegtran' と '-perfect' / '-trim' '-copy' 'all' の間
+        with Image.open(io.BytesIO(input)) as img:
+            output = io.BytesIO()
+            # -copy all と同じく EXIF (Orientation を含む) をそのまま残す
+            img.transpose(_JPEGTRAN_TRANSPOSE[transform]).save(output, format='JPEG', quality=100, subsampling=0,
+                                                               exif=img.info.get('exif', b''))
+        return subprocess.CompletedProcess(args, 0, output.getvalue(), b'')
+    return run
+
+@pytest.mark.parametrize('orientation', range(1, 9))
+@pytest.mark.parametrize('degrees', [90, 180, 270])
+def test_jpegtran_applies_exif_orientation(monkeypatch, orientation, degrees):
+    calls = []
+    monkeypatch.setattr(shutil, 'which', lambda name: '/usr/bin/jpegtran')
+    monkeypatch.setattr(subprocess, 'run', _fake_jpegtran(calls))
+    original = _with_exif(_sample_jpeg(), {ORIENTATION_TAG: orientation}, b'MM')
+    rotated, method = rotate_jpeg_bytes(original, degrees, METHOD_LOSSLESS)
+
+    assert method == METHOD_LOSSLESS
+    # 向きは画素に反映され、表示時に二重に回転しないよう Orientation は 1 になる
+    assert get_orientation(rotated) == 1
+    expected = _displayed(original).transpose(_CLOCKWISE[degrees])
+    actual = _displayed(rotated)
+    assert actual.size == expected.size
+    assert max(high for _, high in ImageChops.difference(actual, expected).getextrema()) <= 8
+    assert len(calls) <= 1  # 回転と向きは1回の変換にまとめる
+
+def test_jpegtran_orientation_6(monkeypatch):
+    # 縦向きに撮影した写真 (Orientation 6) を時計回りに90度回転すると、180度回転した画素になる
+    calls = []
+    monkeypatch.setattr(shutil, 'which', lambda name: '/usr/bin/jpegtran')
+    monkeypatch.setattr(subprocess, 'run', _fake_jpegtran(calls))
+    original = _with_exif(_sample_jpeg(), {ORIENTATION_TAG: 6}, b'II')
+    rotated, _ = rotate_jpeg_bytes(original, 90, METHOD_LOSSLESS)
+    assert calls == [['jpegtran', '-rotate', '180', '-perfect', '-copy', 'all']]
+    assert get_orientation(rotated) == 1
+    with Image.open(io.BytesIO(rotated)) as img:
+        assert img.size == (64, 32)
+
+    # 回転すると元の画素の向きに戻る場合は jpegtran を使わず Orientation だけを書き換える
+    calls.clear()
+    rotated, _ = rotate_jpeg_bytes(original, 270, METHOD_LOSSLESS)
+    assert calls == []
+    assert get_orientation(rotated) == 1
+    assert len(rotated) == len(original)
+
+def test_rotate_jpeg_file(tmp_path):
+    path = tmp_path / 'photo.jpg'
+    path.write_bytes(_with_exif(_sample_jpeg(), {ORIENTATION_TAG: 6}, b'MM'))
+    output_path = tmp_path / 'rotated.jpg'
+
+    assert rotate_jpeg_file(str(path), 90, METHOD_EXIF, str(output_path)) == METHOD_EXIF
+    assert get_orientation(output_path.read_bytes()) == 3
+    assert get_orientation(path.read_bytes()) == 6  # 元のファイルは変更しない
+    assert [p.name for p in tmp_path.iterdir() if p.suffix == '.tmp'] == []
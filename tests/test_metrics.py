@@ -0,0 +1,63 @@
+"""metrics.py のテスト"""
+
+import multiprocessing
+import os
+import pytest
+from metrics import Metrics
+
+def test_render_counters_and_histograms(tmp_path):
+    metrics = Metrics(str(tmp_path), buckets=(0.1, 1.0))
+    metrics.describe('requests_total', 'リクエスト数')
+    metrics.inc('requests_total', endpoint='upload')
+    metrics.inc('requests_total', 2, endpoint='upload')
+    metrics.inc('requests_total', endpoint='say "hi"\n')
+    metrics.observe('stage_seconds', 0.05, stage='decode')
+    metrics.observe('stage_seconds', 0.5, stage='decode')
+    metrics.observe('stage_seconds', 5, stage='decode')
+
+    lines = metrics.render(gauges=[('storage_bytes', {'folder': 'uploads'}, 10)],
+                           counters=[('evicted_total', {'folder': 'uploads'}, 3)]).splitlines()
+    assert '# HELP requests_total リクエスト数' in lines
+    assert '# TYPE requests_total counter' in lines
+    assert 'requests_total{endpoint="upload"} 3' in lines
+    assert 'requests_total{endpoint="say \\"hi\\"\\n"} 1' in lines
+    assert '# TYPE stage_seconds histogram' in lines
+    assert 'stage_seconds_bucket{stage="decode",le="0.1"} 1' in lines
+    assert 'stage_seconds_bucket{stage="decode",le="1.0"} 2' in lines
+    assert 'stage_seconds_bucket{stage="decode",le="+Inf"} 3' in lines
+    assert 'stage_seconds_count{stage="decode"} 3' in lines
+    assert '# TYPE storage_bytes gauge' in lines
+    assert 'storage_bytes{folder="uploads"} 10' in lines
+    assert '# TYPE evicted_total counter' in lines
+    assert 'evicted_total{folder="uploads"} 3' in lines
+
+def test_request_stages(tmp_path):
+    metrics = Metrics(str(tmp_path))
+    metrics.begin_request()
+    metrics.observe('stage_seconds', 0.25, stage='decode')
+    metrics.observe('stage_seconds', 0.5, stage='decode')
+    with metrics.timer('stage_seconds', stage='encode'):
+        pass
+    stages = metrics.end_request()
+    assert stages['decode'] == 0.75 and 'encode' in stages
+    assert metrics.end_request() == {}
+
+def _record_in_child(folder):
+    metrics = Metrics(folder)
+    metrics.inc('jobs_total', 5)
+    metrics.flush()
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason='fork が使えない')
+def test_collect_sums_processes_and_keeps_exited_ones(tmp_path):
+    metrics = Metrics(str(tmp_path))
+    metrics.inc('jobs_total')
+    process = multiprocessing.get_context('fork').Process(target=_record_in_child, args=(str(tmp_path),))
+    process.start()
+    process.join(5)
+
+    # 終了したプロセスの値は archive.json に移してから合計する
+    assert metrics.collect()['counters'][('jobs_total', ())] == 6
+    assert os.path.exists(tmp_path / Metrics.ARCHIVE_NAME)
+    assert sorted(os.listdir(tmp_path)) == sorted([Metrics.ARCHIVE_NAME, Metrics.LOCK_NAME,
+                                                   os.path.basename(metrics._path)])
+    assert metrics.collect()['counters'][('jobs_total', ())] == 6
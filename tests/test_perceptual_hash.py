@@ -0,0 +1,88 @@
+"""perceptual_hash.py のテスト"""
+
+import io
+import random
+import time
+from PIL import Image
+from perceptual_hash import (BKTree, HashIndex, dhash, file_dhash, hamming, split_hash, join_hash,
+                             format_hash, similar_aspect, ORIENTATION_TAG)
+
+def _photo(size=(320, 240), seed=1):
+    """ランダムな色の矩形を並べた画像 (無地ではなく、dHash のビットが偏らないもの)"""
+    rng = random.Random(seed)
+    img = Image.new('RGB', size)
+    for _ in range(40):
+        x, y = rng.randrange(size[0]), rng.randrange(size[1])
+        img.paste(tuple(rng.randrange(256) for _ in range(3)), (x, y, x + size[0] // 4, y + size[1] // 4))
+    return img
+
+def _jpeg(img, quality=90, exif=None):
+    buffer = io.BytesIO()
+    img.save(buffer, format='JPEG', quality=quality, **({'exif': exif} if exif is not None else {}))
+    buffer.seek(0)
+    return buffer
+
+def test_recompressed_image_is_similar():
+    img = _photo()
+    a, _ = file_dhash(_jpeg(img, 95))
+    b, _ = file_dhash(_jpeg(img, 40))
+    c, _ = file_dhash(_jpeg(_photo(seed=2)))
+    assert hamming(a, b) <= 3
+    assert hamming(a, c) > 10
+
+def test_file_dhash_applies_orientation():
+    img = _photo()
+    exif = Image.Exif()
+    exif[ORIENTATION_TAG] = 6
+    value, size = file_dhash(_jpeg(img, exif=exif.tobytes()))
+    assert size == (240, 320)
+    assert hamming(value, dhash(img.transpose(Image.ROTATE_270))) <= 3
+
+def test_file_dhash_max_pixels():
+    value, size = file_dhash(_jpeg(_photo()), max_pixels=1)
+    assert value is None and size == (320, 240)
+
+def test_hash_helpers():
+    value = 0x0123456789abcdef
+    assert join_hash(split_hash(value)) == value
+    assert format_hash(1) == '0000000000000001'
+    assert hamming(0b1010, 0b0110) == 2
+    assert similar_aspect((1600, 1067), (800, 533), 0.02)
+    assert not similar_aspect((1600, 1067), (1000, 1000), 0.02)
+
+def test_bktree_matches_linear_search():
+    rng = random.Random(0)
+    values = [rng.getrandbits(64) for _ in range(300)]
+    values += [v ^ (1 << rng.randrange(64)) for v in values[:50]]  # 1ビットだけ異なるもの
+    tree = BKTree()
+    for index, value in enumerate(values):
+        tree.add(value, index)
+    assert len(tree) == len(values)
+    for query in values[:20]:
+        expected = sorted(i for i, v in enumerate(values) if hamming(query, v) <= 4)
+        assert sorted(i for _, i in tree.search(query, 4)) == expected
+
+def test_hash_index(tmp_path):
+    index = HashIndex(str(tmp_path / 'phash.sqlite3'))
+    index.add('a', 0xffff000000000000, (100, 50))
+    index.add('b', 0xffff000000000007, (200, 100))  # 'a' と3ビット違い
+    index.add('c', 0x0000ffffffffffff, (100, 100))
+
+    assert [(d, k) for d, k, _ in index.find(0xffff000000000000, 3)] == [(0, 'a'), (3, 'b')]
+    assert [k for _, k, _ in index.find(0xffff000000000000, 3, exclude_key='a')] == ['b']
+    assert index.find(0xffff000000000000, 3)[1][2] == (200, 100)
+    # 索引を使わない (全件を確認する) 距離でも同じ結果になる
+    assert [k for _, k, _ in index.find(0xffff000000000000, 10)] == ['a', 'b']
+    assert index.count() == 3
+    assert index.prune(-1) == 3
+    assert index.count() == 0
+
+def test_hash_index_touch_keeps_used_entries(tmp_path):
+    index = HashIndex(str(tmp_path / 'phash.sqlite3'))
+    index.add('a', 0xffff000000000000, (100, 50))
+    index.add('b', 0x0000ffffffffffff, (100, 100))
+    time.sleep(0.05)
+    index.touch('a')  # キャッシュにヒットした画像
+    index.touch('missing')
+    assert index.prune(0.03) == 1
+    assert [k for _, k, _ in index.find(0xffff000000000000, 0)] == ['a']
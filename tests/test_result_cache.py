@@ -0,0 +1,63 @@
+"""result_cache.py のテスト"""
+
+import os
+import time
+from result_cache import ResultCache, make_cache_key, link_or_copy
+
+def _put(cache, tmp_path, key, content=b'image'):
+    src = tmp_path / f"{key}-src.jpg"
+    src.write_bytes(content)
+    cache.put(key, '.jpg', str(src), {'new_size': [620, 413]})
+    return src
+
+def test_put_and_get(tmp_path):
+    cache = ResultCache(str(tmp_path / 'cache'), 1024 * 1024, 3600)
+    _put(cache, tmp_path, 'a')
+
+    data_path, meta = cache.get('a', '.jpg')
+    assert open(data_path, 'rb').read() == b'image'
+    assert meta == {'new_size': [620, 413]}
+    assert cache.get('b', '.jpg') is None
+    assert cache.stats() == {'hits': 1, 'misses': 1, 'evictions': 0}
+
+def test_get_touches_meta_not_shared_image(tmp_path):
+    cache = ResultCache(str(tmp_path / 'cache'), 1024 * 1024, 3600)
+    src = _put(cache, tmp_path, 'a')
+    past = time.time() - 1000
+    data_path, _ = cache.get('a', '.jpg')
+    meta_path = os.path.join(cache.root, 'a' + ResultCache.META_SUFFIX)
+    os.utime(data_path, (past, past))
+    os.utime(meta_path, (past, past))
+
+    cache.get('a', '.jpg')
+    # 画像ファイルはダウンロード用のファイルとハードリンクで共有されるため、更新時刻を変えない
+    assert os.path.getmtime(data_path) == past
+    assert os.path.getmtime(src) == past
+    assert os.path.getmtime(meta_path) > past
+
+def test_missing_image_is_a_miss(tmp_path):
+    cache = ResultCache(str(tmp_path / 'cache'), 1024 * 1024, 3600)
+    _put(cache, tmp_path, 'a')
+    os.remove(os.path.join(cache.root, 'a.jpg'))
+    assert cache.get('a', '.jpg') is None
+
+def test_evict_removes_least_recently_used(tmp_path):
+    cache = ResultCache(str(tmp_path / 'cache'), 150, 3600, evict_interval=3600)
+    for i, key in enumerate(('old', 'new')):
+        _put(cache, tmp_path, key, b'x' * 100)
+        meta_path = os.path.join(cache.root, key + ResultCache.META_SUFFIX)
+        os.utime(meta_path, (time.time() - 100 + i, time.time() - 100 + i))
+
+    assert cache.evict() == 1
+    assert cache.get('old', '.jpg') is None
+    assert cache.get('new', '.jpg') is not None
+
+def test_make_cache_key_depends_on_params():
+    assert make_cache_key('h', width=620, ext='.jpg') == make_cache_key('h', ext='.jpg', width=620)
+    assert make_cache_key('h', width=620) != make_cache_key('h', width=1280)
+
+def test_link_or_copy(tmp_path):
+    src = tmp_path / 'src'
+    src.write_bytes(b'data')
+    link_or_copy(str(src), str(tmp_path / 'dst'))
+    assert (tmp_path / 'dst').read_bytes() == b'data'
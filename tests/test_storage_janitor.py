@@ -0,0 +1,62 @@
+"""storage_janitor.py のテスト"""
+
+import fcntl
+import os
+import time
+from storage_janitor import StorageJanitor, SweepRule
+
+def _write(path, size, age=0):
+    with open(path, 'wb') as f:
+        f.write(b'x' * size)
+    if age:
+        old = time.time() - age
+        os.utime(path, (old, old))
+
+def _janitor(tmp_path, ttl=None, max_bytes=None, extra_sweeps=()):
+    folder = tmp_path / 'downloads'
+    janitor = StorageJanitor(str(tmp_path / 'root'), [SweepRule('downloads', str(folder), ttl, max_bytes)], 60,
+                             extra_sweeps)
+    return janitor, folder
+
+def test_sweep_by_ttl_and_quota(tmp_path):
+    janitor, folder = _janitor(tmp_path, max_bytes=250)
+    for i in range(4):
+        _write(folder / f"{i}.jpg", 100)
+        time.sleep(0.01)
+
+    # 上限を超えた分を古いものから削除する
+    stats = janitor.sweep()
+    assert sorted(os.listdir(folder)) == ['2.jpg', '3.jpg']
+    assert stats['folders']['downloads'] == {'bytes_used': 200, 'files': 2, 'files_evicted': 2}
+    assert stats['bytes_used'] == 200 and stats['sweeps'] == 1
+    assert stats['sweep_duration_seconds'] >= 0
+
+    # 削除件数と実行回数は累計する
+    _write(folder / '4.jpg', 100)
+    stats = janitor.sweep()
+    assert stats['sweeps'] == 2
+    assert stats['files_evicted'] == 3
+    assert stats['folders']['downloads']['files_evicted'] == 3
+    assert janitor.stats() == stats
+
+def test_sweep_expired_files(tmp_path):
+    calls = []
+    janitor, folder = _janitor(tmp_path, ttl=60, extra_sweeps=[lambda: calls.append(True)])
+    _write(folder / 'new.jpg', 10)
+    # 更新時刻が古くても、リンクを作成した (ctime が新しい) ファイルは削除しない
+    _write(folder / 'linked.jpg', 10, age=3600)
+    assert janitor.sweep()['folders']['downloads']['files_evicted'] == 0
+    assert calls == [True]
+
+    stats = janitor._sweep_folder(SweepRule('downloads', str(folder), 60, None), time.time() + 120)
+    assert stats == (0, 0, 2)
+    assert os.listdir(folder) == []
+
+def test_sweep_is_skipped_while_another_process_sweeps(tmp_path):
+    janitor, folder = _janitor(tmp_path, max_bytes=0)
+    _write(folder / 'a.jpg', 10)
+    with open(os.path.join(janitor.root, janitor.LOCK_NAME), 'w') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        assert janitor.sweep() is None
+    assert janitor.stats() is None
+    assert os.listdir(folder) == ['a.jpg']
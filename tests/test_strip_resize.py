@@ -0,0 +1,69 @@
+"""strip_resize.py のテスト"""
+
+import io
+import tempfile
+import pytest
+from PIL import Image, ImageChops
+from strip_resize import _file_descriptor, raw_layout, resize_in_strips, strip_rows
+
+def _gradient(mode, size=(300, 200)):
+    img = Image.linear_gradient('L').resize(size)
+    if mode == 'L':
+        return img
+    bands = [img, img.transpose(Image.FLIP_LEFT_RIGHT), img.transpose(Image.ROTATE_180)]
+    if mode == 'RGBA':
+        bands.append(img.transpose(Image.FLIP_TOP_BOTTOM))
+    return Image.merge(mode, bands)
+
+def _max_difference(a, b):
+    return max(high for _, high in ImageChops.difference(a.convert('RGB'), b.convert('RGB')).getextrema())
+
+@pytest.mark.parametrize('mode', ['L', 'RGB', 'RGBA'])
+def test_matches_whole_image_resize(tmp_path, mode):
+    path = str(tmp_path / 'input.bmp')
+    _gradient(mode).save(path)
+    with Image.open(path) as img:
+        assert raw_layout(img) is not None
+        resized = resize_in_strips(img, path, (90, 60), strip_height=16)
+    with Image.open(path) as img:
+        expected = img.resize((90, 60), Image.LANCZOS)
+    assert resized.size == (90, 60)
+    assert _max_difference(resized, expected) <= 1
+
+def test_file_object_input():
+    buffer = io.BytesIO()
+    _gradient('RGB').save(buffer, format='BMP')
+    buffer.seek(0)
+    with Image.open(buffer) as img:
+        resized = resize_in_strips(img, buffer, (150, 100), strip_height=32)
+    buffer.seek(0)
+    with Image.open(buffer) as img:
+        assert _max_difference(resized, img.resize((150, 100), Image.LANCZOS)) <= 1
+
+@pytest.mark.parametrize('max_size', [1, 1024 * 1024])
+def test_spooled_upload_input(max_size):
+    # アップロード (SpooledTemporaryFile) はディスクに書き出された場合だけメモリマップする
+    buffer = io.BytesIO()
+    _gradient('RGB').save(buffer, format='BMP')
+    spool = tempfile.SpooledTemporaryFile(max_size=max_size)
+    spool.write(buffer.getvalue())
+    spool.seek(0)
+    rolled = spool._rolled
+    assert rolled == (max_size == 1)
+    assert (_file_descriptor(spool) is not None) == rolled
+    with Image.open(spool) as img:
+        resized = resize_in_strips(img, spool, (150, 100), strip_height=32)
+    assert spool._rolled == rolled  # メモリ上のものはディスクに書き出さない
+    spool.seek(0)
+    with Image.open(spool) as img:
+        assert _max_difference(resized, img.resize((150, 100), Image.LANCZOS)) <= 1
+
+def test_compressed_image_has_no_raw_layout():
+    buffer = io.BytesIO()
+    _gradient('RGB').save(buffer, format='PNG')
+    buffer.seek(0)
+    with Image.open(buffer) as img:
+        assert raw_layout(img) is None
+
+def test_strip_rows_includes_margin():
+    assert strip_rows((6000, 4000), (600, 400), 256) > 256
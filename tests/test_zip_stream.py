@@ -0,0 +1,25 @@
+"""zip_stream.py のテスト"""
+
+import io
+import zipfile
+from zip_stream import iter_zip
+
+def test_chunks_form_a_valid_zip(tmp_path):
+    path = tmp_path / 'a.jpg'
+    path.write_bytes(b'jpeg data')
+
+    def entries():
+        yield 'a.jpg', str(path)
+        yield 'dir/b.txt', b'text'
+
+    chunks = list(iter_zip(entries()))
+    assert len(chunks) >= 3  # エントリーごとに書き出し、最後に中央ディレクトリ
+    with zipfile.ZipFile(io.BytesIO(b''.join(chunks))) as zf:
+        assert zf.namelist() == ['a.jpg', 'dir/b.txt']
+        assert zf.read('a.jpg') == b'jpeg data'
+        assert zf.read('dir/b.txt') == b'text'
+        assert all(info.compress_type == zipfile.ZIP_STORED for info in zf.infolist())
+
+def test_empty_zip():
+    with zipfile.ZipFile(io.BytesIO(b''.join(iter_zip([])))) as zf:
+        assert zf.namelist() == []
@@ -0,0 +1,60 @@
+"""
+ZIPファイルのストリーミング作成
+
+ZIPファイル全体をメモリやディスクに作らず、エントリーを追加するたびに
+書き出されたデータを返すジェネレーターです (HTTPレスポンスとしてそのまま送信できます)。
+
+- 書き込み先をシークしないため、各エントリーのサイズとCRCはデータの後ろ (データディスクリプタ) に書き込まれます
+- 画像は既に圧縮されているため、無圧縮 (ZIP_STORED) で格納します
+
+作成日: 2026-10-16
+"""
+
+import io
+import zipfile
+
+class _ChunkBuffer(io.RawIOBase):
+    """zipfile が書き込んだデータを溜めておき、まとめて取り出すための書き込み専用ストリーム"""
+
+    def __init__(self):
+        super().__init__()
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self):
+        """溜まったデータを取り出す"""
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+def iter_zip(entries):
+    """
+    エントリーを1つ追加するたびに、そこまでのZIPファイルのデータを返す
+
+    entries はジェネレーターでも構いません。エントリーが揃うのを待たずに、
+    受け取ったものから順に書き出します。
+
+    Args:
+        entries: (ZIP内のファイル名, ファイルのパス または bytes) のイテラブル
+
+    Yields:
+        bytes: ZIPファイルのデータ (順に連結すると1つのZIPファイルになる)
+    """
+    buffer = _ChunkBuffer()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_STORED) as zf:
+        for arcname, source in entries:
+            if isinstance(source, bytes):
+                zf.writestr(arcname, source)
+            else:
+                zf.write(source, arcname)
+            data = buffer.drain()
+            if data:
+                yield data
+    # 中央ディレクトリ (ZIPファイルの目次) は最後に書き込まれる
+    yield buffer.drain()